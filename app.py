@@ -1,55 +1,265 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, g, redirect, url_for
 #import pandas as pd
+import csv
 import json
 import time
 import random
 import os
+import threading
+import zlib
+from functools import wraps
+from io import StringIO
+from urllib.parse import urlencode
+
+import numpy as np
+
+from benchmark import FICHIER_BENCHMARK, lire_resultats
+from cache_http import CacheGzip, calculer_etag, compresser, compresser_flux
+from cache_recherche import CacheRecherche
+from dataset import DatasetHolder
+from historique import DOSSIER_HISTORIQUE, HistoriquePrix
+from metrics import Metriques
+from moteurs import creer_moteur
+from snapshot import DOSSIER_SNAPSHOT, lire_source, ouvrir_snapshot, preparer_snapshot, snapshot_disponible
+from station_geo import haversine_km
+from station_horaires import minute_semaine
+from station_index import normaliser_texte
+from station_compacte import StationsCompactes
+from station_cube import NIVEAUX, NIVEAU_ENFANT
+from station_store import TRIS, StationStore, date_en_epoch, normaliser_coordonnee
 
 app = Flask(__name__)
 
-# Charger les données depuis le fichier JSON
+# Moteur de stockage : memoire (données chargées depuis le JSON ou le snapshot) ou mongo
+BACKEND = os.environ.get('CARBURANT_BACKEND', 'memoire')
+
+# Fichier JSON des stations (data/stations.json par défaut)
+FICHIER_DONNEES = os.environ.get('CARBURANT_DONNEES', 'data/stations.json')
+
+# Charger les données depuis le fichier JSON (ou NDJSON : une station par ligne), chaque
+# station étant compactée dès qu'elle est décodée (voir station_compacte.py) ; retourne
+# aussi la version et la date du fichier lu
 def load_stations_data():
     try:
-        with open('data/stations.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return lire_source(FICHIER_DONNEES)
     except FileNotFoundError:
-        print("❌ Fichier data/stations.json non trouvé")
-        return []
+        print(f"❌ Fichier {FICHIER_DONNEES} non trouvé")
+        return StationsCompactes(), ('absent', 0)
+
+# Valeurs d'une case à cocher (formulaire ou paramètre d'URL) considérée comme cochée
+CASES_COCHEES = ('1', 'on', 'true', 'oui')
+
+def case_cochee(valeurs, nom):
+    return valeurs.get(nom, '').strip().lower() in CASES_COCHEES
+
+def lire_filtres(valeurs):
+    """Lit les filtres de recherche depuis un formulaire ou des paramètres d'URL"""
+    prix_min = valeurs.get('prix_min', '')
+    prix_max = valeurs.get('prix_max', '')
+    filtres = {
+        'ville': valeurs.get('ville', '').strip().lower(),
+        'carburant': valeurs.get('carburant', '').strip(),
+        'departement': valeurs.get('departement', '').strip(),
+        'prix_min': float(prix_min) if prix_min else None,
+        'prix_max': float(prix_max) if prix_max else None,
+        # "Ouvert maintenant" devient la minute de la semaine courante (clé de cache comprise)
+        'en_stock': case_cochee(valeurs, 'en_stock') or None,
+        'ouvert': minute_semaine() if case_cochee(valeurs, 'ouvert') else None
+    }
+    # Filtres normalisés gardés pour le journal des requêtes lentes (voir /metrics)
+    g.filtres = {nom: normaliser_texte(valeur) if nom == 'ville' else valeur
+                 for nom, valeur in filtres.items() if valeur not in ('', None)}
+    return filtres
 
 def calculate_home_stats():
     """Calcule les statistiques pour la page d'accueil"""
-    total_stations = len(stations_data)
-    
-    # Compter les départements uniques
-    departments = set()
-    avg_price_gazole = 0
-    gazole_count = 0
-    
-    for station in stations_data:
-        dept = station.get('code_departement')
-        if dept:
-            departments.add(dept)
-        
-        # Calculer le prix moyen du gazole
-        for carburant in station.get('carburants', []):
-            if carburant['type'] == 'Gazole':
-                avg_price_gazole += carburant['prix']
-                gazole_count += 1
-    
-    avg_price_gazole = avg_price_gazole / gazole_count if gazole_count > 0 else 0
-    
-    return {
-        'total_stations': total_stations,
-        'total_departments': len(departments),
-        'avg_price_gazole': avg_price_gazole
-    }
+    return moteur.stats_accueil()
+
+# Snapshot binaire (voir snapshot.py), préféré au JSON lorsqu'il est à jour
+SNAPSHOT = os.environ.get('CARBURANT_SNAPSHOT', DOSSIER_SNAPSHOT)
+
+# Sous gunicorn (gunicorn.conf.py), un snapshot périmé est reconstruit avant tout rechargement
+SNAPSHOT_AUTO = (os.environ.get('CARBURANT_PRELOAD', '') == '1'
+                 and os.environ.get('CARBURANT_SNAPSHOT_AUTO', '1') == '1')
+
+def charger_store():
+    """Ouvre le snapshot en mmap s'il est à jour, sinon construit le store depuis le JSON
+
+    Retourne le store et la version et la date des fichiers lus (voir dataset.identite_fichier).
+
+    Avec SNAPSHOT_AUTO, le premier worker qui voit le JSON changer reconstruit le snapshot
+    pendant que les autres l'attendent : tous rechargent alors les mêmes pages partagées.
+    """
+    if SNAPSHOT_AUTO:
+        total = preparer_snapshot(FICHIER_DONNEES, SNAPSHOT)
+        if total:
+            print(f"💾 Snapshot de {total} stations écrit dans {SNAPSHOT}")
+    if snapshot_disponible(SNAPSHOT, FICHIER_DONNEES):
+        donnees, identite = ouvrir_snapshot(SNAPSHOT)
+        print(f"✅ {len(donnees)} stations chargées depuis le snapshot {SNAPSHOT}")
+    else:
+        stations, identite = load_stations_data()
+        donnees = StationStore(stations)
+        print(f"✅ {len(donnees)} stations chargées depuis JSON")
+    return donnees, identite
+
+# Charger les données au démarrage (colonnes, index et agrégats construits ensemble)
+datasets = DatasetHolder(charger_store)
+if BACKEND == 'memoire':
+    datasets.recharger()
+
+def demarrer_surveillance():
+    """Rechargement automatique quand le JSON ou le snapshot changent (CARBURANT_SURVEILLER=1)"""
+    if BACKEND == 'memoire' and os.environ.get('CARBURANT_SURVEILLER', '') in ('1', 'true', 'oui'):
+        datasets.surveiller([FICHIER_DONNEES, os.path.join(SNAPSHOT, 'meta.json')],
+                            intervalle=float(os.environ.get('CARBURANT_SURVEILLER_INTERVALLE', 5)))
+
+# Avec gunicorn --preload, l'import a lieu dans le maître : les threads ne survivant pas au
+# fork, la surveillance est démarrée dans chaque worker par gunicorn.conf.py (post_fork)
+if os.environ.get('CARBURANT_PRELOAD', '') != '1':
+    demarrer_surveillance()
+
+def dataset_courant():
+    """Version des données utilisée pour toute la requête (fixée au premier accès)"""
+    if 'dataset' not in g:
+        g.dataset = datasets.courant()
+    return g.dataset
+
+def store_courant():
+    """Store (colonnes, index, agrégats) de la version utilisée par la requête"""
+    return dataset_courant().store
+
+# Cache des recherches fréquentes (CARBURANT_CACHE_TAILLE entrées, CARBURANT_CACHE_TTL secondes)
+cache_recherches = CacheRecherche(taille_max=int(os.environ.get('CARBURANT_CACHE_TAILLE', 256)),
+                                  ttl=float(os.environ.get('CARBURANT_CACHE_TTL', 300)))
+
+if BACKEND == 'mongo':
+    # Un seul client MongoDB (et son pool) par processus ; index créés au démarrage
+    moteur = creer_moteur('mongo',
+                          uri=os.environ.get('CARBURANT_MONGO_URI', 'mongodb://localhost:27017/'),
+                          base=os.environ.get('CARBURANT_MONGO_BASE', 'carburant_db'),
+                          taille_pool=int(os.environ.get('CARBURANT_MONGO_POOL', 50)))
+    moteur.creer_index()
+else:
+    moteur = creer_moteur(BACKEND, courant=dataset_courant, cache=cache_recherches)
+
+@app.after_request
+def ajouter_version(response):
+    # Version des données ayant servi à construire la réponse
+    response.headers['X-Dataset-Version'] = str(moteur.version())
+    return response
+
+# Métriques des requêtes exposées sur /metrics ; une requête plus longue que
+# CARBURANT_SEUIL_LENT_MS est ajoutée au journal des requêtes lentes (/metrics/slow)
+metriques = Metriques(seuil_lent=float(os.environ.get('CARBURANT_SEUIL_LENT_MS', 500)) / 1000)
+
+@app.before_request
+def demarrer_chrono():
+    g.debut_requete = time.perf_counter()
+
+@app.after_request
+def mesurer_requete(response):
+    if 'debut_requete' not in g:
+        return response
+    duree = time.perf_counter() - g.debut_requete
+    # Le modèle de la route plutôt que l'URL, pour ne pas multiplier les séries
+    route = request.url_rule.rule if request.url_rule else 'inconnue'
+    # Pour une réponse en flux seul l'envoi des en-têtes est mesuré, sans taille connue
+    taille_reponse = None if response.is_streamed else response.calculate_content_length()
+    lente = metriques.observer(route, request.method, response.status_code, duree,
+                               request.content_length or 0, taille_reponse,
+                               g.get('nb_resultats'), g.get('filtres'))
+    if lente:
+        print(f"🐢 Requête lente {lente['methode']} {route} {lente['duree_ms']} ms, filtres {lente['filtres']}")
+    return response
+
+@app.route('/metrics')
+def metrics():
+    jauges, compteurs = moteur.metriques()
+    jauges = jauges + [
+        ('carburant_gzip_cache_entries', 'Réponses gzip précompressées en cache', len(cache_gzip)),
+        ('carburant_gzip_cache_bytes', 'Taille des réponses gzip en cache', cache_gzip.octets)
+    ]
+    compteurs = compteurs + [
+        ('carburant_gzip_cache_hits_total', 'Réponses gzip servies depuis le cache', cache_gzip.hits),
+        ('carburant_gzip_cache_misses_total', 'Réponses gzip compressées à la demande', cache_gzip.misses)
+    ]
+    return Response(metriques.texte(jauges, compteurs), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow')
+def metrics_slow():
+    return jsonify({
+        'seuil_ms': metriques.seuil_lent * 1000,
+        'requetes': list(metriques.journal_lentes)
+    })
 
-# Charger les données au démarrage
-stations_data = load_stations_data()
-print(f"✅ {len(stations_data)} stations chargées depuis JSON")
+# Réponses qui ne dépendent que des données et de l'URL : ETag (version + URL), Last-Modified
+# (date des fichiers de données ; version et date sont les mêmes dans tous les workers)
+# et Cache-Control, pour qu'un client qui revient avec If-None-Match reçoive un 304 sans que
+# la page soit recalculée. Corps gzip des pages gardés en cache (CARBURANT_CACHE_GZIP_MO Mo par
+# worker, 8 par défaut : ×16 workers reste loin de la taille des données) ; les réponses en
+# flux (export CSV, NDJSON) sont compressées au fil de l'envoi et jamais gardées.
+CACHE_CONTROL = f"public, max-age={int(os.environ.get('CARBURANT_CACHE_MAX_AGE', 60))}"
+cache_gzip = CacheGzip(max_octets=int(os.environ.get('CARBURANT_CACHE_GZIP_MO', 8)) * 1024 * 1024)
+
+def conditionnel(precompresser=False, selon=()):
+    """Décorateur des routes GET cachables ; selon : en-têtes de la requête qui changent la réponse"""
+    def decorateur(vue):
+        @wraps(vue)
+        def route(*args, **kwargs):
+            version = moteur.version()
+            date_version = int(moteur.date_version())
+            parties = [request.full_path] + [request.headers.get(nom, '') for nom in selon]
+            # "Ouvert maintenant" : la réponse change avec l'heure, pas seulement avec les données
+            selon_heure = case_cochee(request.args, 'ouvert')
+            if selon_heure:
+                parties.append(minute_semaine())
+            etag = calculer_etag(version, *parties)
+            gzip = precompresser and request.accept_encodings['gzip'] > 0
+            if gzip:
+                etag += '-gzip'
+            
+            if request.if_none_match:
+                inchange = request.if_none_match.contains_weak(etag)
+            elif selon_heure:
+                inchange = False
+            else:
+                inchange = (request.if_modified_since is not None
+                            and request.if_modified_since.timestamp() >= date_version)
+            
+            en_cache = cache_gzip.obtenir(version, etag) if gzip and not inchange else None
+            if inchange:
+                response = Response(status=304)
+            elif en_cache is not None:
+                corps, entetes = en_cache
+                response = Response(corps, headers=entetes)
+            else:
+                response = app.make_response(vue(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if gzip and 'Content-Encoding' not in response.headers and response.mimetype != 'application/gzip':
+                    response.headers['Content-Encoding'] = 'gzip'
+                    if response.is_streamed:
+                        # Réponse en flux (export CSV, NDJSON) : compressée au fil de l'envoi, jamais gardée
+                        response.response = compresser_flux(response.response)
+                        response.headers.pop('Content-Length', None)
+                    else:
+                        # Compressé une fois par version et par URL
+                        response.set_data(compresser([response.get_data()]))
+                        entetes = [(nom, valeur) for nom, valeur in response.headers if nom != 'Content-Length']
+                        cache_gzip.ranger(version, etag, response.get_data(), entetes)
+            
+            response.set_etag(etag)
+            response.last_modified = date_version
+            response.headers.setdefault('Cache-Control', CACHE_CONTROL)
+            response.vary.update(list(selon) + (['Accept-Encoding'] if precompresser else []))
+            return response
+        return route
+    return decorateur
 
 # Route principale
 @app.route('/')
+@conditionnel(precompresser=True)
 def index():
     stats = calculate_home_stats()
     return render_template('index.html', 
@@ -57,240 +267,518 @@ def index():
                          total_departments=stats['total_departments'],
                          avg_price_gazole=stats['avg_price_gazole'])
 
-# Route pour la recherche avancée
-@app.route('/recherche', methods=['POST'])
+# Pagination des résultats de recherche : taille de page par défaut et maximale
+PAR_PAGE_DEFAUT = 50
+PAR_PAGE_MAX = 200
+
+def lire_entier(valeur, defaut, minimum, maximum):
+    try:
+        return min(max(int(valeur), minimum), maximum)
+    except (TypeError, ValueError):
+        return defaut
+
+def lire_tri(valeurs):
+    """Tri (prix, date, distance depuis lat/lon) et page demandés ; tri ignoré s'il est incomplet"""
+    tri = valeurs.get('tri', '').strip()
+    try:
+        lat = float(valeurs['lat']) if valeurs.get('lat') else None
+        lon = float(valeurs['lon']) if valeurs.get('lon') else None
+    except ValueError:
+        lat = lon = None
+    if tri not in TRIS or (tri == 'distance' and (lat is None or lon is None)):
+        tri = ''
+    return {
+        'tri': tri,
+        'lat': lat,
+        'lon': lon,
+        'page': lire_entier(valeurs.get('page'), 1, 1, 10 ** 6),
+        'par_page': lire_entier(valeurs.get('par_page'), PAR_PAGE_DEFAUT, 1, PAR_PAGE_MAX)
+    }
+
+# Route pour la recherche avancée (formulaire en POST, liens de pagination et de tri en GET)
+@app.route('/recherche', methods=['GET', 'POST'])
 def recherche():
     try:
         # Récupérer tous les paramètres
-        ville = request.form.get('ville', '').strip().lower()
-        carburant = request.form.get('carburant', '').strip()
-        departement = request.form.get('departement', '').strip()
-        prix_min = request.form.get('prix_min', '')
-        prix_max = request.form.get('prix_max', '')
+        try:
+            filtres = lire_filtres(request.values)
+        except ValueError:
+            return "Erreur lors de la recherche: prix_min et prix_max doivent être numériques", 400
+        tri = lire_tri(request.values)
         
-        # Filtrer les données
-        results = []
-        for station in stations_data:
-            match = True
-            
-            # Filtre par ville
-            if ville and ville not in station.get('ville', '').lower():
-                match = False
-            
-            # Filtre par département
-            if departement and departement != station.get('code_departement', ''):
-                match = False
-            
-            # Filtre par carburant
-            if carburant:
-                has_carburant = any(c['type'] == carburant for c in station.get('carburants', []))
-                if not has_carburant:
-                    match = False
-            
-            # Filtre par prix
-            if prix_min or prix_max:
-                prix_min_val = float(prix_min) if prix_min else 0
-                prix_max_val = float(prix_max) if prix_max else float('inf')
-                
-                has_matching_price = False
-                for carb in station.get('carburants', []):
-                    if prix_min_val <= carb['prix'] <= prix_max_val:
-                        has_matching_price = True
-                        break
-                
-                if not has_matching_price:
-                    match = False
-            
-            if match:
-                results.append(station)
+        # Filtrer les données : seule la page affichée est triée et rendue
+        page = tri['page']
+        count, results = moteur.rechercher(filtres, tri['tri'], tri['lat'], tri['lon'],
+                                           debut=(page - 1) * tri['par_page'], nombre=tri['par_page'])
+        g.nb_resultats = count
+        nb_pages = max(1, -(-count // tri['par_page']))
+        if page > nb_pages:
+            # Page au-delà de la dernière : on affiche la dernière
+            page = nb_pages
+            count, results = moteur.rechercher(filtres, tri['tri'], tri['lat'], tri['lon'],
+                                               debut=(page - 1) * tri['par_page'], nombre=tri['par_page'])
         
+        parametres = {
+            'ville': filtres['ville'],
+            'carburant': filtres['carburant'],
+            'departement': filtres['departement'],
+            'prix_min': request.values.get('prix_min', ''),
+            'prix_max': request.values.get('prix_max', ''),
+            'en_stock': '1' if filtres['en_stock'] else '',
+            'ouvert': '1' if filtres['ouvert'] is not None else ''
+        }
         return render_template('results.html', 
                              results=results, 
-                             ville=ville, 
-                             carburant=carburant,
-                             departement=departement,
-                             prix_min=prix_min,
-                             prix_max=prix_max,
-                             count=len(results))
+                             count=count,
+                             page=page,
+                             nb_pages=nb_pages,
+                             par_page=tri['par_page'],
+                             tri=tri['tri'],
+                             lat=request.values.get('lat', ''),
+                             lon=request.values.get('lon', ''),
+                             parametres=parametres,
+                             **parametres)
     
     except Exception as e:
         return f"Erreur lors de la recherche: {str(e)}", 500
 
 @app.route('/statistiques')
+@conditionnel(precompresser=True)
 def statistiques():
     try:
         # Statistiques générales
-        total_stations = len(stations_data)
+        total_stations = moteur.total()
         
-        # Calculer les statistiques de prix
-        stats_prix = {}
-        for station in stations_data:
-            for carburant in station.get('carburants', []):
-                type_carb = carburant['type']
-                prix = carburant['prix']
-                
-                if type_carb not in stats_prix:
-                    stats_prix[type_carb] = {'prix': [], 'count': 0}
-                
-                stats_prix[type_carb]['prix'].append(prix)
-                stats_prix[type_carb]['count'] += 1
+        # Statistiques de prix et stations par département
+        stats_final = moteur.stats_prix()
+        top_departements = moteur.top_departements(10)
         
-        # Préparer les statistiques finales
-        stats_final = []
-        for type_carb, data in stats_prix.items():
-            prix_list = data['prix']
-            stats_final.append({
-                '_id': type_carb,
-                'moyenne': sum(prix_list) / len(prix_list),
-                'minimum': min(prix_list),
-                'maximum': max(prix_list),
-                'count': data['count']
-            })
-        
-        # Stations par département
-        dept_count = {}
-        for station in stations_data:
-            dept = station.get('code_departement', 'Inconnu')
-            dept_count[dept] = dept_count.get(dept, 0) + 1
-        
-        top_departements = [{'count': v, '_id': k} for k, v in 
-                           sorted(dept_count.items(), key=lambda x: x[1], reverse=True)[:10]]
+        # Quantiles et histogrammes, en France et dans le département demandé (?departement=)
+        departement = request.args.get('departement', '').strip()
+        quantiles = {d['_id']: d for d in moteur.distributions_prix()}
+        distributions = moteur.distributions_prix(departement or None)
         
         return render_template('statistiques.html',
                              total_stations=total_stations,
                              stats_prix=stats_final,
-                             top_departements=top_departements)
+                             top_departements=top_departements,
+                             quantiles=quantiles,
+                             departement=departement,
+                             distributions=distributions)
     
     except Exception as e:
         return f"Erreur lors du calcul des statistiques: {str(e)}", 500
 
-# Route pour la page performance (version JSON)
+# Distribution des prix en JSON : /api/statistiques?departement=13 (France entière sans departement)
+@app.route('/api/statistiques')
+@conditionnel()
+def api_statistiques():
+    try:
+        departement = request.args.get('departement', '').strip()
+        return jsonify({
+            'departement': departement or None,
+            'carburants': moteur.distributions_prix(departement or None)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Autocomplétion des villes du formulaire : /api/villes?prefix=sai&limit=10
+LIMITE_VILLES_MAX = 50
+
+@app.route('/api/villes')
+@conditionnel()
+def api_villes():
+    try:
+        prefixe = request.args.get('prefix', '')
+        limite = lire_entier(request.args.get('limit'), 10, 1, LIMITE_VILLES_MAX)
+        return jsonify({'prefix': prefixe, 'villes': moteur.villes(prefixe, limite)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Agrégats précalculés par carburant : /api/cube?level=national|region|departement&carburant=Gazole
+# (&region=Bretagne pour les départements d'une région) ; chaque cellule donne l'URL du niveau inférieur
+@app.route('/api/cube')
+@conditionnel()
+def api_cube():
+    try:
+        niveau = request.args.get('level', 'national').strip()
+        if niveau not in NIVEAUX:
+            return jsonify({'error': f"level doit valoir {', '.join(NIVEAUX)}"}), 400
+        carburant = request.args.get('carburant', '').strip()
+        region = request.args.get('region', '').strip() or None
+        
+        cellules = moteur.cube().niveau(niveau, carburant, parent=region if niveau == 'departement' else None)
+        if niveau in NIVEAU_ENFANT:
+            parametres = {'carburant': carburant} if carburant else {}
+            cellules = [dict(cellule, detail=url_for('api_cube', level=NIVEAU_ENFANT[niveau],
+                                                     **dict(parametres, **({'region': cellule['code']}
+                                                                           if niveau == 'region' else {}))))
+                        for cellule in cellules]
+        return jsonify({
+            'level': niveau,
+            'carburant': carburant or None,
+            'region': region if niveau == 'departement' else None,
+            'cellules': cellules
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Résultats du benchmark (python benchmark.py), affichés sur la page performance
+FICHIER_BENCHMARK = os.environ.get('CARBURANT_BENCHMARK', FICHIER_BENCHMARK)
+
+# Route pour la page performance : résultats enregistrés, rien n'est chronométré ici
 @app.route('/performance')
 def performance():
-    total_stations = len(stations_data)
-    return render_template('performance.html', total_stations=total_stations)
+    total_stations = moteur.total()
+    return render_template('performance.html', total_stations=total_stations,
+                           benchmark=lire_resultats(FICHIER_BENCHMARK))
 
-# Route pour générer des données Big Data (version JSON simplifiée)
+# Route pour générer des données Big Data (copies BIG_ en base avec le moteur mongo)
 @app.route('/generate-big-data/<int:multiplier>')
 def generate_big_data_route(multiplier):
     if multiplier > 10:
         return "⚠️ Multiplicateur trop élevé pour la version web. Utilisez le script en console.", 400
-    
+
+    if BACKEND == 'mongo':
+        # Copies BIG_ de stations d'origine ajoutées en base (retirées par /reset-data)
+        ajoutees, total = moteur.dupliquer(multiplier)
+        return f"✅ {ajoutees} nouvelles stations ajoutées. Total: {total}"
+
     # Cette fonctionnalité n'est pas supportée en mode JSON simple
     return "⚠️ Génération de données Big Data non disponible en mode JSON. Utilisez MongoDB pour cette fonctionnalité."
 
 # Route pour réinitialiser les données
 @app.route('/reset-data')
 def reset_data():
-    # Recharger les données originales
-    global stations_data
-    stations_data = load_stations_data()
-    return f"✅ Données réinitialisées. {len(stations_data)} stations chargées"
+    if BACKEND == 'mongo':
+        # Supprimer seulement les données générées (BIG_)
+        supprimees, restantes = moteur.supprimer_copies()
+        return f"✅ {supprimees} stations BIG DATA supprimées. Reste: {restantes} stations originales"
+    # Recharger les données originales en arrière-plan : le nouveau store (index et
+    # agrégats compris) est publié d'un seul coup une fois construit (?attendre=1 pour l'attendre).
+    # Sous gunicorn, seul le worker qui reçoit la requête recharge : les autres suivent les
+    # fichiers avec la surveillance (CARBURANT_SURVEILLER=1). La version affichée est celle
+    # des fichiers lus, la même pour tous les workers qui les ont chargés.
+    version = dataset_courant().version
+    lance = datasets.recharger_en_arriere_plan()
+    if request.args.get('attendre', '') in ('1', 'true', 'oui'):
+        datasets.attendre_rechargement()
+        nouveau = datasets.courant()
+        return f"✅ Données réinitialisées dans ce worker. {len(nouveau.store)} stations chargées (version {nouveau.version})"
+    if not lance:
+        return f"⏳ Rechargement déjà en cours dans ce worker (version actuelle {version})", 202
+    return f"🔄 Rechargement lancé en arrière-plan dans ce worker (version actuelle {version})", 202
 
-# Route pour lancer les tests de performance (version JSON)
+# Ancienne route des tests chronométrés pendant la requête : voir benchmark.py
 @app.route('/run-tests')
 def run_tests():
-    tests = []
-    
-    # Test 1: Recherche simple
-    start = time.time()
-    results = [s for s in stations_data if 'paris' in s.get('ville', '').lower()]
-    temps1 = time.time() - start
-    tests.append({
-        "nom": "Recherche Paris",
-        "temps": temps1,
-        "resultats": f"{len(results)} stations"
-    })
-    
-    # Test 2: Recherche carburant
-    start = time.time()
-    results = [s for s in stations_data if any(c['type'] == 'Gazole' for c in s.get('carburants', []))]
-    temps2 = time.time() - start
-    tests.append({
-        "nom": "Recherche Gazole", 
-        "temps": temps2,
-        "resultats": f"{len(results)} stations"
-    })
-    
-    # Test 3: "Agrégation" (calcul manuel)
-    start = time.time()
-    prix_par_carburant = {}
-    for station in stations_data:
-        for carburant in station.get('carburants', []):
-            type_carb = carburant['type']
-            if type_carb not in prix_par_carburant:
-                prix_par_carburant[type_carb] = []
-            prix_par_carburant[type_carb].append(carburant['prix'])
-    
-    results = []
-    for type_carb, prix_list in prix_par_carburant.items():
-        results.append({
-            '_id': type_carb,
-            'moyenne': sum(prix_list) / len(prix_list)
-        })
-    temps3 = time.time() - start
-    tests.append({
-        "nom": "Agrégation prix",
-        "temps": temps3, 
-        "resultats": f"{len(results)} carburants"
-    })
-    
-    # Test 4: Compte total
-    start = time.time()
-    count = len(stations_data)
-    temps4 = time.time() - start
-    tests.append({
-        "nom": "Compte total",
-        "temps": temps4,
-        "resultats": f"{count} stations"
-    })
-    
-    total_stations = count
-    
-    return render_template('performance.html', tests=tests, total_stations=total_stations)
+    return redirect(url_for('performance'))
+
+# Pagination de l'API : taille de page par défaut et maximale
+LIMITE_API_DEFAUT = 100
+LIMITE_API_MAX = 1000
+
+def projeter(station, champs):
+    """Ne garde que les champs demandés d'une station (tous si aucun)"""
+    if not champs:
+        return station
+    return {champ: station[champ] for champ in champs if champ in station}
+
+def generer_ndjson(stations, champs):
+    """Produit une station JSON par ligne"""
+    for station in stations:
+        yield json.dumps(projeter(station, champs), ensure_ascii=False) + '\n'
 
 # Route API pour les données JSON
+# ?offset=&limit= ou ?cursor= (id_station du dernier élément reçu), ?fields=id_station,ville,...
+# et ?format=ndjson (ou Accept: application/x-ndjson) pour un flux d'une station par ligne
 @app.route('/api/stations')
+@conditionnel(precompresser=True, selon=('Accept',))
 def api_stations():
     try:
-        return jsonify(stations_data)
+        champs = [c.strip() for c in request.args.get('fields', '').split(',') if c.strip()]
+        ndjson = (request.args.get('format') == 'ndjson'
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        
+        try:
+            if 'limit' in request.args:
+                limite = min(max(0, int(request.args['limit'])), LIMITE_API_MAX)
+            else:
+                # Le flux NDJSON n'est pas limité par défaut : il ne garde rien en mémoire
+                limite = None if ndjson else LIMITE_API_DEFAUT
+            total, debut, stations = moteur.parcourir(max(0, int(request.args.get('offset', 0))), limite,
+                                                      apres=request.args.get('cursor'))
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Paramètre offset, limit ou cursor invalide'}), 400
+        
+        if ndjson:
+            return Response(generer_ndjson(stations, champs), mimetype='application/x-ndjson')
+        
+        stations = list(stations)
+        fin = debut + len(stations)
+        return jsonify({
+            'total': total,
+            'offset': debut,
+            'limit': limite,
+            'count': len(stations),
+            'next_cursor': stations[-1].get('id_station') if stations and fin < total else None,
+            'stations': [projeter(station, champs) for station in stations]
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Route pour l'export CSV
-@app.route('/export-csv')
-def export_csv():
+# Recherche autour d'un point : /api/nearby?lat=&lon=&radius_km=&carburant=&k=&sort=prix|distance
+RAYON_NEARBY_DEFAUT_KM = 10
+K_NEARBY_MAX = 100
+
+@app.route('/api/nearby')
+def api_nearby():
+    try:
+        carburant = request.args.get('carburant', '').strip()
+        try:
+            lat = float(request.args['lat'])
+            lon = float(request.args['lon'])
+            rayon_km = float(request.args.get('radius_km', RAYON_NEARBY_DEFAUT_KM))
+            k = min(max(1, int(request.args.get('k', 10))), K_NEARBY_MAX)
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Paramètres lat et lon obligatoires, radius_km et k numériques'}), 400
+        
+        # Par défaut : les moins chères si un carburant est choisi, sinon les plus proches
+        tri = request.args.get('sort', 'prix' if carburant else 'distance').strip()
+        if tri not in ('prix', 'distance'):
+            return jsonify({'error': 'sort doit valoir prix ou distance'}), 400
+        # Sans carburant, le tri par prix n'a pas de sens : on renvoie le tri réellement appliqué
+        if not carburant:
+            tri = 'distance'
+        stations = moteur.proches(lat, lon, rayon_km, carburant=carburant, k=k, tri=tri)
+        
+        return jsonify({'count': len(stations), 'sort': tri, 'stations': stations})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Paramètres acceptés par /api/recherche, avec leur valeur par défaut (omise de l'URL canonique)
+PARAMETRES_RECHERCHE = {
+    'ville': '', 'carburant': '', 'departement': '', 'prix_min': '', 'prix_max': '',
+    'en_stock': '', 'ouvert': '', 'tri': '', 'lat': '', 'lon': '', 'page': '1', 'par_page': str(PAR_PAGE_DEFAUT), 'fields': ''
+}
+CACHE_API_RECHERCHE = 'public, max-age=60'
+
+def url_canonique(valeurs):
+    """Même recherche → même URL : paramètres connus, non vides, hors défauts, triés par nom"""
+    canoniques = {}
+    for nom, defaut in PARAMETRES_RECHERCHE.items():
+        valeur = valeurs.get(nom, '').strip()
+        if nom == 'ville':
+            valeur = normaliser_texte(valeur).strip()
+        elif nom in ('en_stock', 'ouvert'):
+            valeur = '1' if valeur.lower() in CASES_COCHEES else ''
+        elif nom == 'fields':
+            valeur = ','.join(sorted({c.strip() for c in valeur.split(',') if c.strip()}))
+        elif nom in ('prix_min', 'prix_max', 'lat', 'lon', 'page', 'par_page') and valeur:
+            try:
+                valeur = str(int(valeur)) if nom in ('page', 'par_page') else repr(float(valeur))
+            except ValueError:
+                pass
+        if valeur and valeur != defaut:
+            canoniques[nom] = valeur
+    return request.path + ('?' + urlencode(sorted(canoniques.items())) if canoniques else '')
+
+def prix_carburant(station, carburant):
+    """Prix d'un carburant dans une station (None si elle ne le propose pas)"""
+    prix = [c['prix'] for c in station.get('carburants', []) if c.get('type') == carburant]
+    return min(prix) if prix else None
+
+# Recherche en JSON : mêmes filtres que /recherche en paramètres d'URL, plus tri, page,
+# par_page et fields=nom,ville,prix,... (id_station toujours présent). Les URLs non
+# canoniques sont redirigées pour qu'un cache HTTP ne garde qu'une réponse par recherche.
+@app.route('/api/recherche')
+@conditionnel()
+def api_recherche():
+    try:
+        canonique = url_canonique(request.args)
+        if canonique != request.full_path.rstrip('?'):
+            return redirect(canonique, code=301)
+        
+        try:
+            filtres = lire_filtres(request.args)
+        except ValueError:
+            return jsonify({'error': 'prix_min et prix_max doivent être numériques'}), 400
+        tri = lire_tri(request.args)
+        champs = [c for c in request.args.get('fields', '').split(',') if c]
+        
+        total, page_stations = moteur.rechercher(filtres, tri['tri'], tri['lat'], tri['lon'],
+                                                 debut=(tri['page'] - 1) * tri['par_page'], nombre=tri['par_page'])
+        g.nb_resultats = total
+        
+        champs_station = [c for c in champs if c not in ('prix', 'distance_km')]
+        stations = []
+        for station in page_stations:
+            resultat = {'id_station': station.get('id_station')}
+            if champs_station:
+                resultat.update(projeter(station, champs_station))
+            if 'prix' in champs and filtres['carburant']:
+                resultat['prix'] = prix_carburant(station, filtres['carburant'])
+            if 'distance_km' in champs and tri['lat'] is not None and tri['lon'] is not None:
+                distance = float(haversine_km(tri['lat'], tri['lon'], normaliser_coordonnee(station.get('latitude')),
+                                              normaliser_coordonnee(station.get('longitude'))))
+                resultat['distance_km'] = None if np.isnan(distance) else round(distance, 3)
+            stations.append(resultat)
+        
+        response = jsonify({
+            'total': total,
+            'page': tri['page'],
+            'par_page': tri['par_page'],
+            'nb_pages': max(1, -(-total // tri['par_page'])),
+            'tri': tri['tri'],
+            'stations': stations
+        })
+        response.headers['Cache-Control'] = CACHE_API_RECHERCHE
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Historique des prix alimenté par le collecteur (voir historique.py), ouvert à la première
+# requête /api/history : importer l'application ne lit ni ne crée le dossier
+_historique = None
+_verrou_historique = threading.Lock()
+
+def lire_historique():
+    global _historique
+    with _verrou_historique:
+        if _historique is None:
+            _historique = HistoriquePrix(os.environ.get('CARBURANT_HISTORIQUE', DOSSIER_HISTORIQUE))
+        return _historique
+
+# Nombre maximum d'intervalles renvoyés par /api/history
+MAX_INTERVALLES_HISTORIQUE = 10000
+UNITES_PAS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+def lire_pas(valeur):
+    """Durée d'un intervalle en secondes (ex: 3600, 15m, 1h, 1d, 1w)"""
+    if valeur[-1:] in UNITES_PAS:
+        return int(valeur[:-1]) * UNITES_PAS[valeur[-1]]
+    return int(valeur)
+
+def lire_instant(valeur, defaut):
+    """Instant epoch depuis un entier ou une date ISO (ex: 2025-11-20)"""
+    if not valeur:
+        return defaut
+    if valeur.isdigit():
+        return int(valeur)
+    instant = date_en_epoch(valeur)
+    if not instant:
+        raise ValueError(valeur)
+    return instant
+
+# Évolution des prix : /api/history?station=&carburant=&from=&to=&step=
+# (ou departement= à la place de station= pour agréger toutes les stations d'un département)
+@app.route('/api/history')
+def api_history():
     try:
-        import csv
-        from io import StringIO
-        from flask import Response
+        carburant = request.args.get('carburant', '').strip()
+        station = request.args.get('station', '').strip()
+        departement = request.args.get('departement', '').strip()
+        if not carburant or not (station or departement):
+            return jsonify({'error': 'Paramètres carburant et station (ou departement) obligatoires'}), 400
+        try:
+            fin = lire_instant(request.args.get('to', ''), int(time.time()))
+            debut = lire_instant(request.args.get('from', ''), fin - 7 * 86400)
+            pas = lire_pas(request.args.get('step', '1h'))
+        except ValueError:
+            return jsonify({'error': 'Paramètres from, to ou step invalides'}), 400
+        if pas <= 0 or fin < debut:
+            return jsonify({'error': 'Intervalle de temps invalide'}), 400
+        if (fin - debut) // pas + 1 > MAX_INTERVALLES_HISTORIQUE:
+            return jsonify({'error': f'Plus de {MAX_INTERVALLES_HISTORIQUE} intervalles, augmentez step'}), 400
         
-        # Créer le CSV en mémoire
-        output = StringIO()
-        writer = csv.writer(output)
+        if station:
+            ids_stations = [station]
+        else:
+            ids_stations = moteur.ids_departement(departement)
         
-        # En-têtes
-        writer.writerow(['nom_station', 'ville', 'adresse', 'departement', 'type_carburant', 'prix', 'date_maj'])
+        historique = lire_historique()
+        historique.rafraichir()
+        return jsonify({
+            'carburant': carburant,
+            'station': station or None,
+            'departement': departement or None,
+            'from': debut,
+            'to': fin,
+            'step': pas,
+            'points': historique.agreger(ids_stations, carburant, debut, fin, pas)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Nombre de stations écrites entre deux envois lors de l'export CSV
+TAILLE_BLOC_CSV = 500
+# Seuls champs lus pour l'export (les stations compactes ne convertissent que ceux-là)
+CHAMPS_CSV = ('nom', 'ville', 'adresse', 'code_departement', 'carburants')
+
+def generer_csv(stations, compresser=False):
+    """Produit le CSV par blocs (éventuellement compressés en gzip) sans le construire en entier"""
+    tampon = StringIO()
+    writer = csv.writer(tampon)
+    compresseur = zlib.compressobj(wbits=31) if compresser else None
+    
+    def vider_tampon():
+        bloc = tampon.getvalue().encode('utf-8')
+        tampon.seek(0)
+        tampon.truncate()
+        return compresseur.compress(bloc) if compresseur else bloc
+    
+    # En-têtes
+    writer.writerow(['nom_station', 'ville', 'adresse', 'departement', 'type_carburant', 'prix', 'date_maj'])
+    
+    # Données
+    for k, station in enumerate(stations, 1):
+        for carburant in station.get('carburants', []):
+            writer.writerow([
+                station.get('nom', ''),
+                station.get('ville', ''),
+                station.get('adresse', ''),
+                station.get('code_departement', ''),
+                carburant['type'],
+                carburant['prix'],
+                carburant.get('date_maj', '')
+            ])
+        if k % TAILLE_BLOC_CSV == 0:
+            bloc = vider_tampon()
+            if bloc:
+                yield bloc
+    
+    bloc = vider_tampon()
+    if bloc:
+        yield bloc
+    if compresseur:
+        yield compresseur.flush()
+
+# Route pour l'export CSV (mêmes filtres que /recherche, ?gzip=1 pour compresser)
+@app.route('/export-csv')
+@conditionnel(precompresser=True)
+def export_csv():
+    try:
+        filtres = lire_filtres(request.args)
+    except ValueError:
+        return "Erreur lors de l'export: prix_min et prix_max doivent être numériques", 400
+
+    try:
+        total, stations = moteur.exporter(filtres, CHAMPS_CSV)
+        g.nb_resultats = total
+        compresser = request.args.get('gzip', '') in ('1', 'true', 'oui')
         
-        # Données
-        for station in stations_data:
-            for carburant in station.get('carburants', []):
-                writer.writerow([
-                    station.get('nom', ''),
-                    station.get('ville', ''),
-                    station.get('adresse', ''),
-                    station.get('code_departement', ''),
-                    carburant['type'],
-                    carburant['prix'],
-                    carburant.get('date_maj', '')
-                ])
+        if compresser:
+            mimetype = "application/gzip"
+            filename = "export_prix_carburant.csv.gz"
+        else:
+            mimetype = "text/csv"
+            filename = "export_prix_carburant.csv"
         
-        # Retourner le fichier
-        output.seek(0)
+        # Réponse en flux : les lignes sont envoyées au fur et à mesure
         return Response(
-            output.getvalue(),
-            mimetype="text/csv",
-            headers={"Content-disposition": "attachment; filename=export_prix_carburant.csv"}
+            generer_csv(stations, compresser),
+            mimetype=mimetype,
+            headers={"Content-disposition": f"attachment; filename={filename}"}
         )
     
     except Exception as e:
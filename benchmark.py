@@ -0,0 +1,217 @@
+"""Benchmark des chemins réels de l'application à plusieurs échelles de données
+
+Chaque scénario passe par les routes Flask (client de test) ou les fonctions de app.py,
+sur un jeu de données ×1, ×10 et ×100 produit par generate_big_data.py. Après quelques
+exécutions d'échauffement, chaque scénario est répété et on garde p50/p95/p99. Le cache
+des recherches est vidé avant chaque exécution : les durées sont celles du chemin de
+recherche complet, pas d'une lecture du cache.
+
+Usage :
+    python benchmark.py [--echelles 1 10 100] [--repetitions 30] [--sortie data/benchmark.json]
+    python benchmark.py --backends memoire mongo [--mongo-uri mongodb://localhost:27017/]
+    python benchmark.py --reference data/benchmark_reference.json   (signale les régressions)
+    python benchmark.py --enregistrer-reference                      (la sortie devient la référence)
+
+Avec le moteur mongo, chaque jeu de données est importé dans la base CARBURANT_MONGO_BASE
+(carburant_benchmark par défaut) ; --mongo-uri mongomock:// remplace le serveur par mongomock
+(pip install -r requirements-dev.txt).
+
+Le code de retour vaut 1 si une régression est détectée, pour pouvoir l'utiliser en CI.
+La page /performance affiche les derniers résultats enregistrés.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from generate_big_data import generer_fichier
+
+FICHIER_BENCHMARK = 'data/benchmark.json'
+FICHIER_REFERENCE = 'data/benchmark_reference.json'
+
+# Scénarios : nom → (méthode, chemin, formulaire) ; None pour un appel direct
+SCENARIOS = {
+    'accueil': ('GET', '/', None),
+    'stats_accueil': None,
+    'recherche_ville': ('POST', '/recherche', {'ville': 'paris', 'carburant': 'Gazole'}),
+    'recherche_departement': ('POST', '/recherche', {'departement': '13'}),
+    'recherche_prix': ('POST', '/recherche', {'carburant': 'SP98', 'prix_min': '1.7', 'prix_max': '1.8'}),
+    'statistiques': ('GET', '/statistiques', None),
+    'export_csv': ('GET', '/export-csv', None),
+    'export_csv_departement': ('GET', '/export-csv?departement=75', None),
+    'api_stations': ('GET', '/api/stations?limit=1000', None),
+    'api_recherche': ('GET', '/api/recherche?carburant=Gazole&fields=nom%2Cprix&tri=prix', None),
+}
+
+# En dessous de cet écart absolu, une différence de p50 est considérée comme du bruit
+BRUIT_MS = 0.5
+
+
+def executer(application, client, scenario):
+    """Exécute un scénario une fois, sans résultats de recherche en cache ; retourne la durée en ms"""
+    requete = SCENARIOS[scenario]
+    application.cache_recherches.vider()
+    debut = time.perf_counter()
+    if requete is None:
+        with application.app.app_context():
+            application.calculate_home_stats()
+    else:
+        methode, chemin, formulaire = requete
+        reponse = client.open(chemin, method=methode, data=formulaire)
+        reponse.get_data()
+        if reponse.status_code != 200:
+            raise RuntimeError(f"{scenario}: statut {reponse.status_code}")
+    return (time.perf_counter() - debut) * 1000
+
+
+def mesurer(application, scenarios, repetitions, echauffement):
+    client = application.app.test_client()
+    resultats = {}
+    for scenario in scenarios:
+        for _ in range(echauffement):
+            executer(application, client, scenario)
+        durees = np.array([executer(application, client, scenario) for _ in range(repetitions)])
+        resultats[scenario] = {
+            'n': repetitions,
+            'min_ms': round(float(durees.min()), 3),
+            'moyenne_ms': round(float(durees.mean()), 3),
+            'p50_ms': round(float(np.percentile(durees, 50)), 3),
+            'p95_ms': round(float(np.percentile(durees, 95)), 3),
+            'p99_ms': round(float(np.percentile(durees, 99)), 3),
+            'max_ms': round(float(durees.max()), 3)
+        }
+    return resultats
+
+
+def comparer(resultats, reference, seuil):
+    """Scénarios dont le p50 dépasse celui de la référence de plus de seuil (ex: 0.2 = +20 %)"""
+    regressions = []
+    for echelle, mesure in resultats['echelles'].items():
+        precedente = reference.get('echelles', {}).get(echelle, {}).get('scenarios', {})
+        for scenario, valeurs in mesure['scenarios'].items():
+            if scenario not in precedente:
+                continue
+            avant, apres = precedente[scenario]['p50_ms'], valeurs['p50_ms']
+            if apres > avant * (1 + seuil) and apres - avant > BRUIT_MS:
+                regressions.append({
+                    'echelle': echelle,
+                    'scenario': scenario,
+                    'reference_p50_ms': avant,
+                    'p50_ms': apres,
+                    'ratio': round(apres / avant, 2) if avant else None
+                })
+    return regressions
+
+
+def lire_resultats(chemin=FICHIER_BENCHMARK):
+    """Résultats enregistrés par le dernier benchmark (None s'il n'y en a pas)"""
+    try:
+        with open(chemin, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des routes de l'application")
+    parser.add_argument('--source', default='data/stations.json')
+    parser.add_argument('--echelles', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--repetitions', type=int, default=30)
+    parser.add_argument('--echauffement', type=int, default=3)
+    parser.add_argument('--snapshot', action='store_true', help="charge les données depuis un snapshot mmap")
+    parser.add_argument('--backends', nargs='+', choices=['memoire', 'mongo'], default=['memoire'])
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/', help="mongomock:// pour un mock")
+    parser.add_argument('--sortie', default=FICHIER_BENCHMARK)
+    parser.add_argument('--reference', default=None, help=f"défaut: {FICHIER_REFERENCE} s'il existe")
+    parser.add_argument('--seuil', type=float, default=0.2, help="hausse de p50 tolérée (0.2 = +20 %%)")
+    parser.add_argument('--enregistrer-reference', action='store_true')
+    args = parser.parse_args()
+
+    # La surveillance des fichiers ne doit pas recharger les données pendant les mesures
+    os.environ.pop('CARBURANT_SURVEILLER', None)
+    import app as application
+    from moteurs import MoteurMongo
+
+    resultats = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': f"{platform.machine()} ({os.cpu_count()} CPU)",
+        'repetitions': args.repetitions,
+        'echauffement': args.echauffement,
+        'chargement': 'snapshot' if args.snapshot else 'json',
+        'backends': args.backends,
+        'echelles': {}
+    }
+    dossier_tmp = tempfile.mkdtemp()
+    try:
+        for echelle in args.echelles:
+            donnees = os.path.join(dossier_tmp, f'stations_x{echelle}.ndjson')
+            generer_fichier(args.source, echelle, donnees, 'ndjson')
+            snapshot = os.path.join(dossier_tmp, f'snapshot_x{echelle}')
+            if args.snapshot:
+                generer_fichier(args.source, echelle, snapshot, 'snapshot')
+                # Le snapshot doit être plus récent que sa source pour être utilisé
+                os.utime(os.path.join(snapshot, 'meta.json'))
+            application.FICHIER_DONNEES = donnees
+            application.SNAPSHOT = snapshot
+            moteur_memoire = application.moteur
+            for backend in args.backends:
+                debut = time.perf_counter()
+                if backend == 'mongo':
+                    # Import du même jeu de données, puis index comme au démarrage de l'application
+                    application.moteur = MoteurMongo(args.mongo_uri, os.environ.get('CARBURANT_MONGO_BASE',
+                                                                                      'carburant_benchmark'))
+                    with open(donnees, 'r', encoding='utf-8') as f:
+                        application.moteur.importer(json.loads(ligne) for ligne in f if ligne.strip())
+                    application.moteur.creer_index()
+                else:
+                    application.datasets.recharger()
+                chargement_ms = (time.perf_counter() - debut) * 1000
+                with application.app.app_context():
+                    total = application.moteur.total()
+
+                # Le moteur mémoire garde les clés x1, x10... des résultats déjà enregistrés
+                cle = f'x{echelle}' if backend == 'memoire' else f'x{echelle} {backend}'
+                print(f"📊 {cle}: {total} stations chargées en {chargement_ms:.0f} ms")
+                scenarios = mesurer(application, args.scenarios, args.repetitions, args.echauffement)
+                resultats['echelles'][cle] = {
+                    'backend': backend,
+                    'stations': total,
+                    'chargement_ms': round(chargement_ms, 1),
+                    'scenarios': scenarios
+                }
+                print(f"{'scénario':<24}{'p50':>10}{'p95':>10}{'p99':>10}")
+                for scenario, valeurs in scenarios.items():
+                    print(f"{scenario:<24}{valeurs['p50_ms']:>7.2f} ms{valeurs['p95_ms']:>7.2f} ms{valeurs['p99_ms']:>7.2f} ms")
+                application.moteur = moteur_memoire
+    finally:
+        shutil.rmtree(dossier_tmp, ignore_errors=True)
+
+    chemin_reference = args.reference or (FICHIER_REFERENCE if os.path.exists(FICHIER_REFERENCE) else None)
+    regressions = []
+    if chemin_reference and not args.enregistrer_reference:
+        reference = lire_resultats(chemin_reference)
+        if reference is None:
+            print(f"⚠️ Référence {chemin_reference} illisible, pas de comparaison")
+        else:
+            regressions = comparer(resultats, reference, args.seuil)
+            resultats['reference'] = {'fichier': chemin_reference, 'date': reference.get('date'), 'seuil': args.seuil}
+            for r in regressions:
+                print(f"❌ Régression {r['echelle']} {r['scenario']}: p50 {r['reference_p50_ms']} → {r['p50_ms']} ms")
+            if not regressions:
+                print(f"✅ Aucune régression par rapport à {chemin_reference}")
+    resultats['regressions'] = regressions
+
+    for chemin in [args.sortie] + ([FICHIER_REFERENCE] if args.enregistrer_reference else []):
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+        print(f"💾 Résultats écrits dans {chemin}")
+    sys.exit(1 if regressions else 0)
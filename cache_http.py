@@ -0,0 +1,98 @@
+"""Validation HTTP (ETag, Last-Modified) et corps gzip précompressés des grosses réponses"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+# Niveau de compression des corps mis en cache (compressés une fois, envoyés souvent)
+NIVEAU_GZIP = 6
+
+
+def calculer_etag(version, *parties):
+    """ETag fort : même version des données et mêmes paramètres → même réponse
+
+    La version doit désigner les données elles-mêmes (fichiers lus, version MongoDB) et non
+    un compteur propre au processus : deux workers peuvent répondre au même client.
+    """
+    empreinte = hashlib.sha1(repr((version,) + parties).encode('utf-8')).hexdigest()[:24]
+    return f'v{version}-{empreinte}'
+
+
+def compresser(morceaux):
+    """Corps gzip à partir des morceaux (str ou bytes) d'une réponse, sans la garder en entier"""
+    compresseur = zlib.compressobj(NIVEAU_GZIP, wbits=31)
+    blocs = []
+    for morceau in morceaux:
+        if isinstance(morceau, str):
+            morceau = morceau.encode('utf-8')
+        blocs.append(compresseur.compress(morceau))
+    blocs.append(compresseur.flush())
+    return b''.join(blocs)
+
+
+def compresser_flux(morceaux):
+    """Corps gzip produit au fil des morceaux d'une réponse en flux (rien n'est gardé)"""
+    compresseur = zlib.compressobj(NIVEAU_GZIP, wbits=31)
+    for morceau in morceaux:
+        if isinstance(morceau, str):
+            morceau = morceau.encode('utf-8')
+        bloc = compresseur.compress(morceau)
+        if bloc:
+            yield bloc
+    yield compresseur.flush()
+
+
+class CacheGzip:
+    """Corps gzip des dernières réponses et leurs en-têtes, indexés par ETag
+
+    Comme le cache des recherches, il ne vaut que pour une version des données et il est
+    vidé quand une autre version est servie. Éviction du moins récemment utilisé au-delà
+    de max_octets au total ; un corps plus gros que max_octets / 4 n'est pas gardé.
+    """
+
+    def __init__(self, max_octets=8 * 1024 * 1024):
+        self.max_octets = max_octets
+        self._entrees = OrderedDict()
+        self._version = None
+        self._octets = 0
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _verifier_version(self, version):
+        if version != self._version:
+            self._entrees.clear()
+            self._octets = 0
+            self._version = version
+
+    def obtenir(self, version, etag):
+        """(corps gzip, en-têtes) en cache pour cet ETag, None sinon"""
+        with self._verrou:
+            self._verifier_version(version)
+            entree = self._entrees.get(etag)
+            if entree is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(etag)
+            self.hits += 1
+            return entree
+
+    def ranger(self, version, etag, corps, entetes):
+        if len(corps) > self.max_octets // 4:
+            return
+        with self._verrou:
+            self._verifier_version(version)
+            if etag in self._entrees:
+                self._octets -= len(self._entrees.pop(etag)[0])
+            self._entrees[etag] = (corps, entetes)
+            self._octets += len(corps)
+            while self._octets > self.max_octets:
+                _, (ancien, _) = self._entrees.popitem(last=False)
+                self._octets -= len(ancien)
+
+    @property
+    def octets(self):
+        return self._octets
+
+    def __len__(self):
+        return len(self._entrees)
@@ -0,0 +1,97 @@
+"""Cache LRU des résultats de recherche, indexé par les filtres normalisés"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from station_index import normaliser_texte
+
+
+def cle_recherche(ville='', carburant='', departement='', prix_min=None, prix_max=None,
+                  en_stock=False, ouvert=None):
+    """Clé normalisée : deux recherches équivalentes (casse, accents, espaces) ont la même clé"""
+    return (
+        normaliser_texte(ville or '').strip(),
+        (carburant or '').strip(),
+        (departement or '').strip(),
+        None if prix_min is None else float(prix_min),
+        None if prix_max is None else float(prix_max),
+        bool(en_stock),
+        None if ouvert is None else int(ouvert)
+    )
+
+
+class CacheRecherche:
+    """Positions des stations trouvées pour les dernières recherches
+
+    Les résultats sont gardés sous forme de positions (int32, lecture seule) et non de
+    copies des stations. Ils ne valent que pour une version des données : le cache est vidé
+    dès qu'une autre version (rechargement ou modification en place du store) est demandée.
+    Éviction du moins récemment utilisé au-delà de taille_max entrées ou de max_positions
+    positions au total, et expiration après ttl secondes.
+    """
+
+    def __init__(self, taille_max=256, ttl=300, max_positions=5000000):
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self.max_positions = max_positions
+        self._entrees = OrderedDict()
+        self._version = None
+        self._positions = 0
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _verifier_version(self, version):
+        if version != self._version:
+            self._entrees.clear()
+            self._positions = 0
+            self._version = version
+
+    def _retirer(self, cle):
+        _, positions = self._entrees.pop(cle)
+        self._positions -= positions.size
+
+    def obtenir(self, version, cle):
+        """Positions en cache pour cette version des données, None sinon"""
+        with self._verrou:
+            self._verifier_version(version)
+            entree = self._entrees.get(cle)
+            if entree is not None and time.monotonic() - entree[0] > self.ttl:
+                self._retirer(cle)
+                self.evictions += 1
+                entree = None
+            if entree is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return entree[1]
+
+    def vider(self):
+        """Oublie toutes les recherches (benchmark des recherches non mises en cache)"""
+        with self._verrou:
+            self._entrees.clear()
+            self._positions = 0
+
+    def ranger(self, version, cle, positions):
+        """Met en cache les positions trouvées ; retourne le tableau gardé (lecture seule)"""
+        positions = np.asarray(positions, dtype=np.int32)
+        positions.flags.writeable = False
+        if positions.size > self.max_positions:
+            return positions
+        with self._verrou:
+            self._verifier_version(version)
+            if cle in self._entrees:
+                self._retirer(cle)
+            self._entrees[cle] = (time.monotonic(), positions)
+            self._positions += positions.size
+            while len(self._entrees) > self.taille_max or self._positions > self.max_positions:
+                self._retirer(next(iter(self._entrees)))
+                self.evictions += 1
+        return positions
+
+    def __len__(self):
+        return len(self._entrees)
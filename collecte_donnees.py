@@ -1,146 +1,409 @@
+import argparse
+import codecs
+import hashlib
+import json
+import os
 import requests
-from pymongo import MongoClient
 from datetime import datetime
 
-def collecte_finale():
-    """Version finale avec tous les correctifs"""
-    
-    client = MongoClient('mongodb://localhost:27017/')
-    db = client['carburant_db']
-    stations = db['stations']
-    
-    url = "https://data.economie.gouv.fr/api/explore/v2.1/catalog/datasets/prix-des-carburants-en-france-flux-instantane-v2/exports/json"
-    
-    try:
-        print("🚀 Lancement de la collecte finale...")
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code != 200:
-            print(f"❌ Erreur HTTP: {response.status_code}")
-            return
-        
-        data = response.json()
-        print(f"📥 {len(data)} stations téléchargées depuis l'API")
-        
-        # Nettoyer l'ancienne collection
-        stations.delete_many({})
-        print("🧹 Anciennes données supprimées")
-        
-        stations_inserees = 0
-        stations_ignorees = 0
-        
-        for i, station in enumerate(data[:500]):  # Prendre 500 stations max
+from station_horaires import ouvertures_station, ruptures_station
+
+URL_FLUX = "https://data.economie.gouv.fr/api/explore/v2.1/catalog/datasets/prix-des-carburants-en-france-flux-instantane-v2/exports/json"
+
+# Taille des morceaux lus sur le réseau et nombre de stations écrites par lot
+TAILLE_MORCEAU = 64 * 1024
+TAILLE_LOT = 1000
+
+CARBURANTS_MAPPING = {
+    'gazole_prix': {'nom': 'Gazole', 'date': 'gazole_maj'},
+    'sp95_prix': {'nom': 'SP95', 'date': 'sp95_maj'},
+    'sp98_prix': {'nom': 'SP98', 'date': 'sp98_maj'},
+    'e85_prix': {'nom': 'E85', 'date': 'e85_maj'},
+    'gplc_prix': {'nom': 'GPLc', 'date': 'gplc_maj'},
+    'e10_prix': {'nom': 'E10', 'date': 'e10_maj'}
+}
+
+def iterer_tableau_json(morceaux):
+    """Décode un tableau JSON au fil des morceaux reçus et produit ses éléments un par un"""
+    decodeur = json.JSONDecoder()
+    decodeur_texte = codecs.getincrementaldecoder('utf-8')()
+    tampon = ''
+    dans_tableau = False
+
+    for morceau in morceaux:
+        tampon += decodeur_texte.decode(morceau)
+        position = 0
+
+        if not dans_tableau:
+            tampon = tampon.lstrip()
+            if not tampon:
+                continue
+            if tampon[0] != '[':
+                raise ValueError("Le flux ne contient pas un tableau JSON")
+            dans_tableau = True
+            position = 1
+
+        while True:
+            # Séparateurs entre les éléments
+            while position < len(tampon) and tampon[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(tampon):
+                break
+            if tampon[position] == ']':
+                return
             try:
-                # Vérifier que la station a au moins un carburant et une ville valide
-                has_carburant = any([
-                    station.get('gazole_prix'),
-                    station.get('sp95_prix'), 
-                    station.get('sp98_prix'),
-                    station.get('e85_prix'),
-                    station.get('gplc_prix'),
-                    station.get('e10_prix')
-                ])
-                
-                has_ville = station.get('ville') and station.get('ville') != 'N/A'
-                
-                if not (has_carburant and has_ville):
-                    stations_ignorees += 1
-                    continue
-                
-                # 🔥 CORRECTION DES CHAMPS MANQUANTS 🔥
-                nouvelle_station = {
-                    "id_station": station.get('id', f'STATION_{i}'),
-                    "nom": station.get('adresse', 'Station sans nom'),  # On utilise l'adresse comme nom
-                    "adresse": station.get('adresse', 'Adresse non renseignée'),
-                    "ville": station.get('ville', 'Ville inconnue'),
-                    "code_postal": str(station.get('cp', '00000')),
-                    "departement": station.get('departement', station.get('code_departement', 'Département inconnu')),  # Correction ici
-                    "code_departement": station.get('code_departement', ''),
-                    "region": station.get('region', 'Région inconnue'),
-                    "latitude": station.get('latitude', 0),
-                    "longitude": station.get('longitude', 0),
-                    "services": station.get('services_service', []),
-                    "horaires": station.get('horaires_automate_24_24', 'Non renseigné'),
-                    "carburants": [],
-                    "date_collecte": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                
-                # 🔥 CORRECTION DES CARBURANTS - UTILISER LES BONNES CLÉS 🔥
-                carburants_mapping = {
-                    'gazole_prix': {'nom': 'Gazole', 'date': 'gazole_maj'},
-                    'sp95_prix': {'nom': 'SP95', 'date': 'sp95_maj'},
-                    'sp98_prix': {'nom': 'SP98', 'date': 'sp98_maj'},
-                    'e85_prix': {'nom': 'E85', 'date': 'e85_maj'},
-                    'gplc_prix': {'nom': 'GPLc', 'date': 'gplc_maj'},
-                    'e10_prix': {'nom': 'E10', 'date': 'e10_maj'}
-                }
-                
-                for api_key, infos in carburants_mapping.items():
-                    prix = station.get(api_key)
-                    if prix and prix > 0.5:  # Prix minimum réaliste (éviter les 0.001)
-                        date_maj = station.get(infos['date'], datetime.now().strftime("%Y-%m-%d"))
-                        nouvelle_station["carburants"].append({
-                            "type": infos['nom'],
-                            "prix": round(prix, 3),
-                            "date_maj": date_maj
-                        })
-                
-                # Insérer seulement si au moins 1 carburant valide
-                if nouvelle_station["carburants"]:
-                    stations.insert_one(nouvelle_station)
-                    stations_inserees += 1
-                    
-                    # Afficher les 3 premières stations pour vérification
-                    if stations_inserees <= 3:
-                        print(f"\n🔍 EXEMPLE Station {stations_inserees}:")
-                        print(f"   📍 {nouvelle_station['ville']} - {nouvelle_station['nom']}")
-                        print(f"   ⛽ Carburants: {len(nouvelle_station['carburants'])}")
-                        for carb in nouvelle_station['carburants']:
-                            print(f"      - {carb['type']}: {carb['prix']}€")
-                        
-            except Exception as e:
-                print(f"⚠️ Erreur sur la station {i}: {e}")
+                element, position = decodeur.raw_decode(tampon, position)
+            except json.JSONDecodeError:
+                # Élément incomplet : on attend le morceau suivant
+                break
+            yield element
+
+        tampon = tampon[position:]
+
+    raise ValueError("Flux JSON tronqué (tableau non terminé)")
+
+def normaliser_station(station, i):
+    """Convertit une station du flux au format de l'application (None si inutilisable)"""
+    # Vérifier que la station a au moins un carburant et une ville valide
+    has_carburant = any(station.get(api_key) for api_key in CARBURANTS_MAPPING)
+    has_ville = station.get('ville') and station.get('ville') != 'N/A'
+
+    if not (has_carburant and has_ville):
+        return None
+
+    # 🔥 CORRECTION DES CHAMPS MANQUANTS 🔥
+    nouvelle_station = {
+        "id_station": station.get('id', f'STATION_{i}'),
+        "nom": station.get('adresse', 'Station sans nom'),  # On utilise l'adresse comme nom
+        "adresse": station.get('adresse', 'Adresse non renseignée'),
+        "ville": station.get('ville', 'Ville inconnue'),
+        "code_postal": str(station.get('cp', '00000')),
+        "departement": station.get('departement', station.get('code_departement', 'Département inconnu')),  # Correction ici
+        "code_departement": station.get('code_departement', ''),
+        "region": station.get('region', 'Région inconnue'),
+        "latitude": station.get('latitude', 0),
+        "longitude": station.get('longitude', 0),
+        "services": station.get('services_service', []),
+        "horaires": station.get('horaires_automate_24_24', 'Non renseigné'),
+        # Décodés une fois ici : carburants en rupture et plages d'ouverture (station_horaires.py)
+        "ruptures": ruptures_station(station.get('rupture')),
+        "ouvertures": ouvertures_station(station.get('horaires')),
+        "carburants": [],
+        "date_collecte": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+    # 🔥 CORRECTION DES CARBURANTS - UTILISER LES BONNES CLÉS 🔥
+    for api_key, infos in CARBURANTS_MAPPING.items():
+        prix = station.get(api_key)
+        if prix and prix > 0.5:  # Prix minimum réaliste (éviter les 0.001)
+            date_maj = station.get(infos['date'], datetime.now().strftime("%Y-%m-%d"))
+            nouvelle_station["carburants"].append({
+                "type": infos['nom'],
+                "prix": round(prix, 3),
+                "date_maj": date_maj
+            })
+
+    # Garder seulement les stations avec au moins 1 carburant valide
+    return nouvelle_station if nouvelle_station["carburants"] else None
+
+def par_lots(elements, taille):
+    """Regroupe un itérable en listes d'au plus `taille` éléments"""
+    lot = []
+    for element in elements:
+        lot.append(element)
+        if len(lot) >= taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+def empreinte(station):
+    """Empreinte des métadonnées et des carburants (type, prix, date_maj) d'une station"""
+    contenu = {cle: valeur for cle, valeur in station.items()
+               if cle not in ('_id', 'date_collecte', 'empreinte')}
+    texte = json.dumps(contenu, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texte.encode('utf-8')).hexdigest()
+
+class DestinationMongo:
+    """Synchronise MongoDB par différence : seules les stations modifiées sont réécrites
+
+    Chaque document garde l'empreinte de son contenu ; une station dont l'empreinte n'a
+    pas changé n'est pas touchée, les autres sont remplacées (upsert) par lots avec
+    bulk_write, et celles absentes du flux sont supprimées en fin de collecte.
+    Une collecte interrompue garde les stations déjà écrites : abandonner() publie quand
+    même une nouvelle version pour que l'application les voie.
+    """
+
+    def __init__(self, uri='mongodb://localhost:27017/'):
+        if uri.startswith('mongomock://'):
+            # Tests : base en mémoire, comme moteurs.MoteurMongo
+            import mongomock
+            self.client = mongomock.MongoClient()
+        else:
+            from pymongo import MongoClient
+            self.client = MongoClient(uri)
+        self.stations = self.client['carburant_db']['stations']
+        self.existantes = {}
+        self.vues = set()
+        self.compteurs = {'inserees': 0, 'modifiees': 0, 'inchangees': 0, 'supprimees': 0}
+
+    def demarrer(self):
+        self.stations.create_index('id_station')
+        # Empreintes des stations déjà en base (projection : ni prix ni adresses)
+        self.existantes = {doc['id_station']: doc.get('empreinte')
+                           for doc in self.stations.find({}, {'_id': 0, 'id_station': 1, 'empreinte': 1})}
+        print(f"🗂️ {len(self.existantes)} stations déjà en base")
+
+    def ecrire(self, lot):
+        from pymongo import ReplaceOne
+        from moteurs import preparer_document
+        operations = []
+        for station in lot:
+            id_station = station['id_station']
+            self.vues.add(id_station)
+            signature = empreinte(station)
+            if id_station not in self.existantes:
+                self.compteurs['inserees'] += 1
+            elif self.existantes[id_station] != signature:
+                self.compteurs['modifiees'] += 1
+            else:
+                self.compteurs['inchangees'] += 1
                 continue
-        
-        # 📊 STATISTIQUES FINALES
-        print(f"\n{'='*50}")
-        print("🎉 COLLECTE TERMINÉE AVEC SUCCÈS!")
-        print(f"{'='*50}")
-        print(f"📥 Stations téléchargées: {len(data)}")
-        print(f"✅ Stations insérées: {stations_inserees}")
-        print(f"❌ Stations ignorées: {stations_ignorees}")
-        
-        total = stations.count_documents({})
+            # Champs des index de la recherche (voir moteurs.MoteurMongo)
+            document = dict(station, empreinte=signature, **preparer_document(station))
+            operations.append(ReplaceOne({'id_station': id_station}, document, upsert=True))
+        if operations:
+            self.stations.bulk_write(operations, ordered=False)
+
+    def _publier(self):
+        # L'application relit ses statistiques quand la version change
+        if self.compteurs['inserees'] or self.compteurs['modifiees'] or self.compteurs['supprimees']:
+            from moteurs import publier_version
+            publier_version(self.client['carburant_db'])
+
+    def abandonner(self):
+        self._publier()
+        print(f"⚠️ Collecte interrompue : {self.compteurs['inserees']} stations insérées et "
+              f"{self.compteurs['modifiees']} modifiées restent en base")
+
+    def terminer(self, complet=True):
+        # Stations disparues du flux (seulement si le flux a été lu en entier)
+        if complet:
+            disparues = [id_station for id_station in self.existantes if id_station not in self.vues]
+            for lot in par_lots(disparues, TAILLE_LOT):
+                self.compteurs['supprimees'] += self.stations.delete_many({'id_station': {'$in': lot}}).deleted_count
+
+        self._publier()
+
+        print(f"\n🔁 SYNCHRONISATION MONGODB:")
+        print(f"   ➕ Insérées: {self.compteurs['inserees']}")
+        print(f"   ✏️ Modifiées: {self.compteurs['modifiees']}")
+        print(f"   ⏸️ Inchangées: {self.compteurs['inchangees']}")
+        print(f"   ➖ Supprimées: {self.compteurs['supprimees']}")
+
+        total = self.stations.count_documents({})
         print(f"📊 Total en base MongoDB: {total} stations")
-        
+
         # Répartition par carburant
         pipeline = [
             {"$unwind": "$carburants"},
             {"$group": {"_id": "$carburants.type", "count": {"$sum": 1}, "prix_moyen": {"$avg": "$carburants.prix"}}}
         ]
-        stats = list(stations.aggregate(pipeline))
-        
+        stats = list(self.stations.aggregate(pipeline))
+
         print("\n⛽ STATISTIQUES PAR CARBURANT:")
         for stat in stats:
             print(f"   - {stat['_id']}: {stat['count']} stations, prix moyen: {stat['prix_moyen']:.3f}€")
-        
+
         # Top 5 des villes avec le plus de stations
         pipeline_ville = [
             {"$group": {"_id": "$ville", "count": {"$sum": 1}}},
             {"$sort": {"count": -1}},
             {"$limit": 5}
         ]
-        top_villes = list(stations.aggregate(pipeline_ville))
-        
+        top_villes = list(self.stations.aggregate(pipeline_ville))
+
         print(f"\n🏙️ TOP 5 des villes:")
         for ville in top_villes:
             print(f"   - {ville['_id']}: {ville['count']} stations")
-            
+
         print(f"\n💾 Les données sont maintenant prêtes dans MongoDB!")
+
+class DestinationJSON:
+    """Écrit les stations dans un fichier JSON au fil de l'eau (remplacé une fois complet)"""
+
+    def __init__(self, chemin='data/stations.json'):
+        self.chemin = chemin
+        self.temporaire = chemin + '.tmp'
+        self.fichier = None
+        self.premier = True
+
+    def demarrer(self):
+        self.fichier = open(self.temporaire, 'w', encoding='utf-8')
+        self.fichier.write('[')
+
+    def ecrire(self, lot):
+        for station in lot:
+            self.fichier.write('\n' if self.premier else ',\n')
+            json.dump(station, self.fichier, ensure_ascii=False)
+            self.premier = False
+
+    def terminer(self, complet=True):
+        self.fichier.write('\n]\n')
+        self.fichier.close()
+        os.replace(self.temporaire, self.chemin)
+        print(f"💾 Stations écrites dans {self.chemin}")
+
+    def abandonner(self):
+        # Le fichier précédent reste en place
+        if self.fichier is not None and not self.fichier.closed:
+            self.fichier.close()
+            os.remove(self.temporaire)
+
+class DestinationSnapshot:
+    """Construit le snapshot binaire de l'application (voir snapshot.py)
+
+    Le snapshot est écrit colonne par colonne à partir de toutes les stations : elles sont
+    gardées en mémoire jusqu'à terminer() (environ 3 Ko par station, 30 Mo pour les ~10 000
+    stations du flux national), contrairement aux autres destinations qui écrivent lot par lot.
+    """
+
+    def __init__(self, dossier=None):
+        from snapshot import DOSSIER_SNAPSHOT
+        self.dossier = dossier or DOSSIER_SNAPSHOT
+        self.stations = []
+
+    def demarrer(self):
+        pass
+
+    def ecrire(self, lot):
+        self.stations.extend(lot)
+
+    def terminer(self, complet=True):
+        from snapshot import ecrire_snapshot
+        ecrire_snapshot(self.stations, self.dossier, source='collecte')
+        print(f"💾 Snapshot écrit dans {self.dossier}")
+
+    def abandonner(self):
+        self.stations = []
+
+class DestinationHistorique:
+    """Ajoute les nouveaux prix à l'historique compact (voir historique.py)"""
+
+    def __init__(self, dossier=None):
+        from historique import DOSSIER_HISTORIQUE, SEGMENTS_AVANT_COMPACTION, HistoriquePrix
+        self.segments_avant_compaction = SEGMENTS_AVANT_COMPACTION
+        self.historique = HistoriquePrix(dossier or DOSSIER_HISTORIQUE)
+
+    def demarrer(self):
+        pass
+
+    def ecrire(self, lot):
+        self.historique.ajouter(lot)
+
+    def terminer(self, complet=True):
+        total = self.historique.enregistrer()
+        print(f"📈 {total} nouveaux points ajoutés à l'historique des prix")
+        if len(self.historique.segments) >= self.segments_avant_compaction:
+            print(f"🗜️ {self.historique.compacter()} segments d'historique fusionnés")
+
+    def abandonner(self):
+        # Les prix reçus sont réels : on les garde même si la collecte est incomplète
+        self.historique.enregistrer()
+
+def collecte_finale(url=URL_FLUX, destinations=None, taille_lot=TAILLE_LOT, limite=None):
+    """Télécharge le flux en continu, normalise les stations et les écrit par lots"""
+
+    if destinations is None:
+        destinations = [DestinationMongo()]
+
+    try:
+        print("🚀 Lancement de la collecte finale...")
+        response = requests.get(url, timeout=30, stream=True)
+
+        if response.status_code != 200:
+            print(f"❌ Erreur HTTP: {response.status_code}")
+            return
+
+        # Destinations à refermer par abandonner() si la collecte s'interrompt
+        demarrees = []
+
+        compteurs = {'telechargees': 0, 'inserees': 0, 'ignorees': 0}
+
+        def stations_normalisees():
+            # Les stations sont décodées au fur et à mesure de la réception du flux
+            for i, station in enumerate(iterer_tableau_json(response.iter_content(TAILLE_MORCEAU))):
+                if limite is not None and i >= limite:
+                    break
+                compteurs['telechargees'] += 1
+                try:
+                    nouvelle_station = normaliser_station(station, i)
+                except Exception as e:
+                    print(f"⚠️ Erreur sur la station {i}: {e}")
+                    nouvelle_station = None
+
+                if nouvelle_station is None:
+                    compteurs['ignorees'] += 1
+                    continue
+
+                compteurs['inserees'] += 1
+
+                # Afficher les 3 premières stations pour vérification
+                if compteurs['inserees'] <= 3:
+                    print(f"\n🔍 EXEMPLE Station {compteurs['inserees']}:")
+                    print(f"   📍 {nouvelle_station['ville']} - {nouvelle_station['nom']}")
+                    print(f"   ⛽ Carburants: {len(nouvelle_station['carburants'])}")
+                    for carb in nouvelle_station['carburants']:
+                        print(f"      - {carb['type']}: {carb['prix']}€")
+
+                yield nouvelle_station
+
+        try:
+            for destination in destinations:
+                destination.demarrer()
+                demarrees.append(destination)
+
+            for lot in par_lots(stations_normalisees(), taille_lot):
+                for destination in destinations:
+                    destination.ecrire(lot)
+        except BaseException:
+            # Flux coupé, erreur d'écriture ou Ctrl+C : chaque destination garde un état cohérent
+            # (version MongoDB publiée pour les stations déjà écrites, ancien fichier JSON)
+            for destination in demarrees:
+                destination.abandonner()
+            raise
+
+        # 📊 STATISTIQUES FINALES
+        print(f"\n{'='*50}")
+        print("🎉 COLLECTE TERMINÉE AVEC SUCCÈS!")
+        print(f"{'='*50}")
+        print(f"📥 Stations téléchargées: {compteurs['telechargees']}")
+        print(f"✅ Stations insérées: {compteurs['inserees']}")
+        print(f"❌ Stations ignorées: {compteurs['ignorees']}")
+
+        # Avec --limite, le flux n'est pas lu en entier : aucune station n'est considérée disparue
+        for destination in destinations:
+            destination.terminer(complet=limite is None)
+
         print(f"🌐 Vous pouvez relancer Flask: python3 app.py")
-        
+
     except Exception as e:
         print(f"❌ Erreur générale: {e}")
 
 if __name__ == "__main__":
-    collecte_finale()
+    parser = argparse.ArgumentParser(description="Collecte du flux instantané des prix des carburants")
+    parser.add_argument('--url', default=URL_FLUX, help="URL du flux (ex: serveur local rejouant un export enregistré)")
+    parser.add_argument('--destination', nargs='+', choices=['mongo', 'json', 'snapshot', 'historique'],
+                        default=['mongo', 'historique'])
+    parser.add_argument('--json', default='data/stations.json', help="Fichier écrit par la destination json")
+    parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT)
+    parser.add_argument('--limite', type=int, default=None, help="Nombre maximum de stations lues")
+    args = parser.parse_args()
+
+    fabriques = {
+        'mongo': DestinationMongo,
+        'json': lambda: DestinationJSON(args.json),
+        'snapshot': DestinationSnapshot,
+        'historique': DestinationHistorique
+    }
+    collecte_finale(args.url, [fabriques[nom]() for nom in args.destination], args.taille_lot, args.limite)
@@ -0,0 +1,115 @@
+"""Jeu de données versionné : rechargement en arrière-plan et publication atomique"""
+import hashlib
+import os
+import threading
+import time
+
+
+def identite_fichier(fichier):
+    """Version et date des données lues dans un fichier ouvert (inode, taille, date de modification)
+
+    Elles décrivent le fichier et non le processus : tous les workers qui ont lu les mêmes
+    fichiers publient la même version avec la même date, quel que soit leur nombre de
+    rechargements.
+    """
+    infos = os.fstat(fichier.fileno())
+    empreinte = hashlib.sha1(repr((infos.st_ino, infos.st_size, infos.st_mtime_ns)).encode('utf-8'))
+    return empreinte.hexdigest()[:12], infos.st_mtime
+
+
+class Dataset:
+    """Une version publiée des données : le store (colonnes, index, agrégats) et sa version
+
+    version et date_donnees viennent des fichiers lus (voir identite_fichier) ; numero
+    compte les publications de ce processus et date_chargement est l'heure de la sienne.
+    """
+
+    def __init__(self, store, version, date_donnees, numero):
+        self.store = store
+        self.version = version
+        self.date_donnees = date_donnees
+        self.numero = numero
+        self.date_chargement = time.time()
+
+
+class DatasetHolder:
+    """Garde la version courante des données et la remplace d'un seul coup
+
+    Le nouveau store est entièrement construit (hors du chemin des requêtes) avant d'être
+    publié par une simple affectation : une requête qui a lu courant() garde sa version
+    jusqu'au bout, même si un rechargement a lieu pendant ce temps. Les constructions
+    (démarrage, /reset-data, surveillance des fichiers) passent une par une : la dernière
+    publiée a toujours lu les fichiers les plus récents, et deux stores ne sont jamais
+    construits en même temps.
+    """
+
+    def __init__(self, charger):
+        # charger() → (store, (version, date des données))
+        self.charger = charger
+        self._courant = None
+        self._numero = 0
+        self._verrou = threading.Lock()
+        # Tenu de la lecture des fichiers jusqu'à la publication
+        self._construction = threading.Lock()
+        self._rechargement = None
+
+    def courant(self):
+        """Version des données actuellement publiée"""
+        return self._courant
+
+    def recharger(self):
+        """Construit une nouvelle version des données puis la publie (une construction à la fois)"""
+        with self._construction:
+            store, (version, date_donnees) = self.charger()
+            with self._verrou:
+                self._numero += 1
+                self._courant = Dataset(store, version, date_donnees, self._numero)
+            return self._courant
+
+    def _recharger_sans_erreur(self):
+        try:
+            self.recharger()
+        except Exception as e:
+            version = self._courant.version if self._courant else None
+            print(f"❌ Échec du rechargement, version {version} conservée: {e}")
+
+    def recharger_en_arriere_plan(self):
+        """Lance le rechargement dans un thread ; faux si un rechargement est déjà en cours"""
+        with self._verrou:
+            if self._rechargement is not None and self._rechargement.is_alive():
+                return False
+            self._rechargement = threading.Thread(target=self._recharger_sans_erreur, daemon=True)
+            self._rechargement.start()
+        return True
+
+    def attendre_rechargement(self, timeout=None):
+        """Attend la fin du rechargement en cours s'il y en a un"""
+        rechargement = self._rechargement
+        if rechargement is not None:
+            rechargement.join(timeout)
+
+    def surveiller(self, chemins, intervalle=5):
+        """Recharge automatiquement quand un des fichiers change (mtime, inode ou taille)"""
+        def signature():
+            resultat = []
+            for chemin in chemins:
+                try:
+                    infos = os.stat(chemin)
+                    resultat.append((infos.st_mtime_ns, infos.st_ino, infos.st_size))
+                except FileNotFoundError:
+                    resultat.append(None)
+            return resultat
+
+        def boucle():
+            precedente = signature()
+            while True:
+                time.sleep(intervalle)
+                actuelle = signature()
+                if actuelle != precedente:
+                    print(f"🔄 Fichier de données modifié, rechargement (publication {self._numero + 1})")
+                    self._recharger_sans_erreur()
+                    precedente = actuelle
+
+        surveillance = threading.Thread(target=boucle, daemon=True)
+        surveillance.start()
+        return surveillance
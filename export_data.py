@@ -2,9 +2,13 @@
 from pymongo import MongoClient
 import json
 
+from moteurs import CHAMPS_INTERNES_MONGO
+from snapshot import ecrire_snapshot
+
 client = MongoClient('mongodb://localhost:27017/')
 db = client['carburant_db']
-stations = list(db['stations'].find({}))
+# Sans les champs ajoutés pour les index MongoDB (position GeoJSON, ville normalisée...)
+stations = list(db['stations'].find({}, {champ: 0 for champ in CHAMPS_INTERNES_MONGO}))
 
 # Convertir ObjectId en string pour JSON
 for station in stations:
@@ -14,3 +18,7 @@ with open('data/stations.json', 'w', encoding='utf-8') as f:
     json.dump(stations, f, ensure_ascii=False, indent=2)
 
 print("✅ Données exportées vers data/stations.json")
+
+# Snapshot binaire ouvert directement par l'application (sans relire le JSON)
+ecrire_snapshot(stations, source='mongodb')
+print("✅ Snapshot binaire écrit dans data/snapshot")
@@ -1,8 +1,110 @@
-from pymongo import MongoClient
+"""Génération de gros volumes de données de test
+
+Sans MongoDB : python generate_big_data.py --multiplier 100 --format ndjson --sortie data/stations_x100.ndjson
+Chaque copie k (k = 1 … multiplier-1) des stations est générée par un processus du pool avec
+sa propre graine (graine + k) : le fichier produit est identique d'une exécution à l'autre,
+quel que soit le nombre de processus. La copie 0 reprend les stations d'origine.
+
+Sans argument, le menu interactif agit sur la base MongoDB.
+"""
+import argparse
+import copy
+import json
+import math
+import os
 import random
+import sys
 from datetime import datetime, timedelta
+from multiprocessing import Pool
 import time
 
+from station_store import ECHELLE_COORDONNEES, normaliser_coordonnee
+
+GRAINE = 42
+FORMATS = ('json', 'ndjson', 'snapshot')
+
+def varier_coordonnee(valeur, aleatoire):
+    """Décale une coordonnée de ±0.1° en gardant son format (degrés ou ×100000 en texte)"""
+    degres = normaliser_coordonnee(valeur)
+    if not math.isfinite(degres):
+        # Coordonnée absente ou illisible (None, '', 'N/A') : gardée telle quelle
+        return valeur
+    # normaliser_coordonnee a divisé par ECHELLE_COORDONNEES : format ×100000 de la source
+    en_texte = degres != float(valeur)
+    degres += aleatoire.uniform(-0.1, 0.1)
+    if en_texte:
+        return str(int(round(degres * ECHELLE_COORDONNEES)))
+    return round(degres, 6)
+
+def generer_copie(originales, k, graine=GRAINE):
+    """Copie k des stations : ids BIG_{k}_{id}, coordonnées et prix légèrement variés"""
+    if k == 0:
+        return originales
+    aleatoire = random.Random(graine + k)
+    stations = []
+    for station in originales:
+        # Les carburants sont copiés aussi : les prix de l'original ne doivent pas être modifiés
+        nouvelle = dict(station)
+        nouvelle['carburants'] = [dict(carburant) for carburant in station.get('carburants', [])]
+        nouvelle.pop('_id', None)
+        nouvelle['id_station'] = f"BIG_{k}_{station['id_station']}"
+        nouvelle['latitude'] = varier_coordonnee(nouvelle.get('latitude'), aleatoire)
+        nouvelle['longitude'] = varier_coordonnee(nouvelle.get('longitude'), aleatoire)
+        for carburant in nouvelle.get('carburants', []):
+            carburant['prix'] = round(max(0.5, carburant['prix'] + aleatoire.uniform(-0.1, 0.1)), 3)
+        stations.append(nouvelle)
+    return stations
+
+# Stations d'origine chargées une fois par processus du pool
+_originales = None
+
+def _initialiser_processus(source):
+    global _originales
+    with open(source, 'r', encoding='utf-8') as f:
+        _originales = json.load(f)
+
+def _generer_shard(tache):
+    """Copie k sérialisée dans le format demandé (texte JSON/NDJSON ou liste pour le snapshot)"""
+    k, graine, format_sortie = tache
+    stations = generer_copie(_originales, k, graine)
+    if format_sortie == 'snapshot':
+        return len(stations), stations
+    separateur = '\n' if format_sortie == 'ndjson' else ',\n'
+    return len(stations), separateur.join(json.dumps(station, ensure_ascii=False) for station in stations)
+
+def generer_fichier(source, multiplier, sortie, format_sortie='json', processus=None, graine=GRAINE):
+    """Écrit multiplier copies des stations de source dans sortie ; retourne le nombre de stations"""
+    if format_sortie not in FORMATS:
+        raise ValueError(f"Format inconnu: {format_sortie}")
+    taches = [(k, graine, format_sortie) for k in range(multiplier)]
+    total = 0
+    with Pool(processus, initializer=_initialiser_processus, initargs=(source,)) as pool:
+        # imap garde l'ordre des copies : la sortie ne dépend pas du nombre de processus
+        shards = pool.imap(_generer_shard, taches)
+        if format_sortie == 'snapshot':
+            from snapshot import ecrire_snapshot
+            stations = []
+            for nombre, morceau in shards:
+                stations.extend(morceau)
+                total += nombre
+            ecrire_snapshot(stations, sortie, source=source)
+            return total
+
+        temporaire = sortie + '.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            if format_sortie == 'json':
+                f.write('[\n')
+            for nombre, morceau in shards:
+                if nombre:
+                    if total:
+                        f.write('\n' if format_sortie == 'ndjson' else ',\n')
+                    f.write(morceau)
+                total += nombre
+            f.write('\n]\n' if format_sortie == 'json' else '\n')
+        os.replace(temporaire, sortie)
+    return total
+
+
 def generate_big_data(multiplier=10):
     """
     Génère un volume de données multiplié pour les tests de performance
@@ -10,6 +112,7 @@ def generate_big_data(multiplier=10):
     multiplier = 100 → 100x plus de données
     """
     
+    from pymongo import MongoClient
     client = MongoClient('mongodb://localhost:27017/')
     db = client['carburant_db']
     stations = db['stations']
@@ -33,8 +136,9 @@ def generate_big_data(multiplier=10):
     
     for i in range(multiplier - 1):  # -1 car on a déjà les données originales
         for station in original_stations:
-            # Créer une copie modifiée de la station
-            nouvelle_station = station.copy()
+            # Créer une copie modifiée de la station (copie profonde : les carburants
+            # de l'original ne doivent pas être modifiés)
+            nouvelle_station = copy.deepcopy(station)
             
             # Important: supprimer l'_id pour éviter les conflits
             nouvelle_station.pop('_id', None)
@@ -83,6 +187,7 @@ def generate_big_data(multiplier=10):
 def performance_test():
     """Test des performances avec les données actuelles"""
     
+    from pymongo import MongoClient
     client = MongoClient('mongodb://localhost:27017/')
     db = client['carburant_db']
     stations = db['stations']
@@ -139,7 +244,27 @@ def performance_test():
     print(f"   • Export: {temps_export:.4f}s")
     print(f"   • Compte: {temps_count:.4f}s")
 
-if __name__ == "__main__":
+def main_fichier():
+    parser = argparse.ArgumentParser(description="Génère un gros jeu de données sans MongoDB")
+    parser.add_argument('--source', default='data/stations.json')
+    parser.add_argument('--multiplier', type=int, default=10)
+    parser.add_argument('--format', choices=FORMATS, default='json')
+    parser.add_argument('--sortie', default=None, help="Fichier (json/ndjson) ou dossier (snapshot)")
+    parser.add_argument('--processus', type=int, default=None, help="Taille du pool (défaut: nombre de CPU)")
+    parser.add_argument('--graine', type=int, default=GRAINE)
+    args = parser.parse_args()
+
+    sortie = args.sortie
+    if sortie is None:
+        sortie = f"data/stations_x{args.multiplier}" + ('' if args.format == 'snapshot' else f".{args.format}")
+    print(f"🚀 Génération de {args.multiplier}x les données de {args.source}...")
+    debut = time.time()
+    total = generer_fichier(args.source, args.multiplier, sortie, args.format, args.processus, args.graine)
+    print(f"✅ {total} stations écrites dans {sortie} en {time.time() - debut:.2f} secondes")
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    main_fichier()
+elif __name__ == "__main__":
     print("🔧 GÉNÉRATEUR DE DONNÉES BIG DATA")
     print("1. Générer 10x plus de données")
     print("2. Générer 100x plus de données") 
@@ -155,6 +280,7 @@ if __name__ == "__main__":
     elif choix == "3":
         performance_test()
     elif choix == "4":
+        from pymongo import MongoClient
         client = MongoClient('mongodb://localhost:27017/')
         db = client['carburant_db']
         stations = db['stations']
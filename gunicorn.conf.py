@@ -0,0 +1,54 @@
+# Configuration gunicorn : une seule copie des données partagée entre les workers
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# - le snapshot binaire (voir snapshot.py) est reconstruit au démarrage s'il est absent ou
+#   plus ancien que le JSON : ses colonnes et ses stations sont ouvertes en mmap, donc
+#   partagées par le cache de pages du système entre tous les workers ;
+# - quand le JSON change, un seul worker reconstruit le snapshot et les autres l'attendent
+#   (snapshot.preparer_snapshot) : aucun worker ne recharge le JSON dans sa propre mémoire ;
+# - l'application est chargée une fois dans le maître (preload_app) puis les objets Python
+#   sont gelés (gc.freeze) avant chaque fork pour que le ramasse-miettes ne touche plus
+#   leurs pages, qui restent ainsi partagées en copy-on-write.
+#
+# Mémoire mesurée sur 48400 stations (×100) par python mesure_memoire.py
+# (détail dans data/mesure_memoire.json) — PSS moyen par worker / PSS total :
+#
+#   workers   json (sans preload)   preload + gc.freeze   snapshot mmap (cette config)
+#         1      92 Mo /  107 Mo       57 Mo /  116 Mo       55 Mo /  96 Mo
+#         4      86 Mo /  355 Mo       35 Mo /  176 Mo       29 Mo / 143 Mo
+#        16      83 Mo / 1334 Mo       24 Mo /  409 Mo       19 Mo / 323 Mo
+#
+# Les stations chargées depuis le JSON sont compactées (station_compacte.py) : 647 octets
+# par station au lieu de 3068 pour les dicts (avant : json 209 Mo et preload 124 Mo à 1 worker).
+# S'y ajoute au plus CARBURANT_CACHE_GZIP_MO (8 Mo) de pages gzip en cache par worker.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+preload_app = True
+
+# Lu par app.py : la surveillance des fichiers est démarrée dans les workers (post_fork)
+os.environ['CARBURANT_PRELOAD'] = '1'
+
+
+def on_starting(server):
+    # Avec CARBURANT_BACKEND=mongo les stations sont lues dans MongoDB : pas de snapshot
+    if os.environ.get('CARBURANT_SNAPSHOT_AUTO', '1') != '1' or os.environ.get('CARBURANT_BACKEND') == 'mongo':
+        return
+    from snapshot import DOSSIER_SNAPSHOT, preparer_snapshot
+
+    dossier = os.environ.get('CARBURANT_SNAPSHOT', DOSSIER_SNAPSHOT)
+    total = preparer_snapshot(os.environ.get('CARBURANT_DONNEES', 'data/stations.json'), dossier)
+    if total:
+        server.log.info(f"Snapshot de {total} stations écrit dans {dossier}")
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import demarrer_surveillance
+    demarrer_surveillance()
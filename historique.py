@@ -0,0 +1,350 @@
+"""Historique compact des prix : segments binaires en ajout seul, requêtes par intervalle de temps
+
+Chaque collecte ajoute un segment (data/historique/segment_000001.bin, ...) qui contient
+seulement les points nouveaux, c'est-à-dire dont la date_maj a changé depuis le dernier
+point connu de la série (station, carburant). Un segment n'est jamais modifié ensuite.
+
+Format d'un segment (entiers en varint, deltas en zigzag) :
+    b'HPX2' t_min t_max nb_carburants carburants... nb_series
+    répertoire : pour chaque série id_station carburant (indice) t_max - t_dernier nb_points taille_bloc
+    blocs      : pour chaque série nb_points × (delta temps en s, delta prix en millièmes)
+Les identifiants numériques sont écrits en varint, les autres en texte. Le premier delta de
+temps part de t_min, le premier delta de prix de 0 : un point coûte 2 à 4 octets, plus le
+coût de la série dans le répertoire de chaque segment où elle apparaît.
+
+Une collecte ne produit qu'un point par série : compacter() fusionne régulièrement les
+segments en un seul (segment_000001-000030.bin couvre les segments 1 à 30, qui sont ensuite
+supprimés) pour que le répertoire ne soit payé qu'une fois par série.
+
+Usage : python historique.py data/stations.json   (ajoute les prix d'un fichier de stations)
+"""
+import argparse
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from station_store import date_en_epoch
+
+DOSSIER_HISTORIQUE = 'data/historique'
+MAGIQUE = b'HPX2'
+# La collecte compacte l'historique dès que ce nombre de segments est atteint
+SEGMENTS_AVANT_COMPACTION = 30
+# Relectures du dossier quand un segment disparaît pendant rafraichir() (compaction concurrente)
+TENTATIVES_RAFRAICHIR = 5
+NOM_SEGMENT = re.compile(r'^segment_(\d{6})(?:-(\d{6}))?\.bin$')
+
+
+def ecrire_varint(tampon, valeur):
+    while valeur >= 0x80:
+        tampon.append((valeur & 0x7F) | 0x80)
+        valeur >>= 7
+    tampon.append(valeur)
+
+
+def lire_varint(donnees, position):
+    resultat = 0
+    decalage = 0
+    while True:
+        octet = donnees[position]
+        position += 1
+        resultat |= (octet & 0x7F) << decalage
+        if octet < 0x80:
+            return resultat, position
+        decalage += 7
+
+
+def zigzag(valeur):
+    return valeur * 2 if valeur >= 0 else -valeur * 2 - 1
+
+
+def dezigzag(valeur):
+    return valeur >> 1 if not valeur & 1 else -(valeur >> 1) - 1
+
+
+def ecrire_texte(tampon, texte):
+    donnees = texte.encode('utf-8')
+    ecrire_varint(tampon, len(donnees))
+    tampon.extend(donnees)
+
+
+def lire_texte(donnees, position):
+    longueur, position = lire_varint(donnees, position)
+    return donnees[position:position + longueur].decode('utf-8'), position + longueur
+
+
+def ecrire_identifiant(tampon, id_station):
+    """Identifiant numérique (sans zéro initial) en varint pair, sinon texte marqué impair"""
+    if id_station.isdigit() and id_station == str(int(id_station)):
+        ecrire_varint(tampon, int(id_station) * 2)
+    else:
+        donnees = id_station.encode('utf-8')
+        ecrire_varint(tampon, len(donnees) * 2 + 1)
+        tampon.extend(donnees)
+
+
+def lire_identifiant(donnees, position):
+    valeur, position = lire_varint(donnees, position)
+    if not valeur & 1:
+        return str(valeur >> 1), position
+    longueur = valeur >> 1
+    return donnees[position:position + longueur].decode('utf-8'), position + longueur
+
+
+def encoder_segment(series):
+    """Encode {(id_station, carburant): [(t, prix_millièmes), ...]} en segment binaire"""
+    temps = [t for points in series.values() for t, _ in points]
+    t_min, t_max = min(temps), max(temps)
+    carburants = sorted({carburant for _, carburant in series})
+    indices = {carburant: i for i, carburant in enumerate(carburants)}
+
+    blocs = bytearray()
+    repertoire = []
+    for (id_station, carburant), points in series.items():
+        points.sort()
+        debut = len(blocs)
+        t_precedent, prix_precedent = t_min, 0
+        for t, prix in points:
+            ecrire_varint(blocs, zigzag(t - t_precedent))
+            ecrire_varint(blocs, zigzag(prix - prix_precedent))
+            t_precedent, prix_precedent = t, prix
+        repertoire.append((id_station, indices[carburant], points[-1][0], len(points), len(blocs) - debut))
+
+    segment = bytearray(MAGIQUE)
+    ecrire_varint(segment, t_min)
+    ecrire_varint(segment, t_max)
+    ecrire_varint(segment, len(carburants))
+    for carburant in carburants:
+        ecrire_texte(segment, carburant)
+    ecrire_varint(segment, len(repertoire))
+    for id_station, carburant, t_dernier, nb_points, taille in repertoire:
+        ecrire_identifiant(segment, id_station)
+        ecrire_varint(segment, carburant)
+        ecrire_varint(segment, t_max - t_dernier)
+        ecrire_varint(segment, nb_points)
+        ecrire_varint(segment, taille)
+    return bytes(segment + blocs)
+
+
+class Segment:
+    """Segment ouvert en lecture : en-tête et répertoire décodés, blocs décodés à la demande"""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        with open(chemin, 'rb') as f:
+            self.donnees = f.read()
+        if self.donnees[:4] != MAGIQUE:
+            raise ValueError(f"Segment d'historique invalide: {chemin}")
+        position = 4
+        self.t_min, position = lire_varint(self.donnees, position)
+        self.t_max, position = lire_varint(self.donnees, position)
+        nb_carburants, position = lire_varint(self.donnees, position)
+        carburants = []
+        for _ in range(nb_carburants):
+            carburant, position = lire_texte(self.donnees, position)
+            carburants.append(carburant)
+        nb_series, position = lire_varint(self.donnees, position)
+        self.repertoire = {}
+        offset = 0
+        for _ in range(nb_series):
+            id_station, position = lire_identifiant(self.donnees, position)
+            carburant, position = lire_varint(self.donnees, position)
+            ecart, position = lire_varint(self.donnees, position)
+            nb_points, position = lire_varint(self.donnees, position)
+            taille, position = lire_varint(self.donnees, position)
+            self.repertoire[(id_station, carburants[carburant])] = (self.t_max - ecart, nb_points, offset)
+            offset += taille
+        self.debut_blocs = position
+
+    def points(self, id_station, carburant):
+        """Points (t, prix en millièmes) d'une série dans ce segment"""
+        if (id_station, carburant) not in self.repertoire:
+            return []
+        _, nb_points, offset = self.repertoire[(id_station, carburant)]
+        position = self.debut_blocs + offset
+        t, prix = self.t_min, 0
+        points = []
+        for _ in range(nb_points):
+            delta_t, position = lire_varint(self.donnees, position)
+            delta_prix, position = lire_varint(self.donnees, position)
+            t += dezigzag(delta_t)
+            prix += dezigzag(delta_prix)
+            points.append((t, prix))
+        return points
+
+
+class HistoriquePrix:
+    """Ensemble des segments d'un dossier, avec le dernier point connu de chaque série"""
+
+    def __init__(self, dossier=DOSSIER_HISTORIQUE):
+        self.dossier = dossier
+        self.segments = {}
+        self.derniers = {}
+        self.en_attente = {}
+        self.dernier_numero = 0
+        self._verrou = threading.Lock()
+        self.rafraichir()
+
+    def _ouvrir(self, nom):
+        """Ouvre un segment ; False s'il vient d'être supprimé par compacter() (autre processus)"""
+        try:
+            segment = Segment(os.path.join(self.dossier, nom))
+        except FileNotFoundError:
+            return False
+        self.segments[nom] = segment
+        for cle, (t_dernier, _, _) in segment.repertoire.items():
+            self.derniers[cle] = max(t_dernier, self.derniers.get(cle, 0))
+        return True
+
+    def _segments_sur_disque(self):
+        """Noms des segments valides, sans ceux couverts par un segment compacté"""
+        plages = {}
+        try:
+            fichiers = os.listdir(self.dossier)
+        except FileNotFoundError:
+            # Dossier créé au premier segment écrit
+            fichiers = []
+        for nom in fichiers:
+            correspondance = NOM_SEGMENT.match(nom)
+            if correspondance:
+                debut = int(correspondance.group(1))
+                plages[nom] = (debut, int(correspondance.group(2) or debut))
+        return sorted(nom for nom, (debut, fin) in plages.items()
+                      if not any(d <= debut and fin <= f and (d, f) != (debut, fin) for d, f in plages.values())), plages
+
+    def rafraichir(self):
+        """Prend en compte les segments ajoutés ou compactés (par exemple par la collecte)
+
+        compacter() écrit le segment fusionné avant de supprimer les anciens : un segment
+        disparu entre listdir et open est donc couvert par un segment visible en relisant
+        le dossier.
+        """
+        with self._verrou:
+            for _ in range(TENTATIVES_RAFRAICHIR):
+                noms, plages = self._segments_sur_disque()
+                if plages:
+                    self.dernier_numero = max(self.dernier_numero, max(fin for _, fin in plages.values()))
+                if any(nom not in noms for nom in self.segments):
+                    self.segments = {}
+                    self.derniers = {}
+                ouverts = [self._ouvrir(nom) for nom in noms if nom not in self.segments]
+                if all(ouverts):
+                    return
+
+    def _segments_courants(self):
+        """Copie des segments ouverts, prise sous le verrou (rafraichir() peut en ajouter)"""
+        with self._verrou:
+            return list(self.segments.values())
+
+    def _ecrire(self, nom, series):
+        os.makedirs(self.dossier, exist_ok=True)
+        chemin = os.path.join(self.dossier, nom)
+        temporaire = chemin + '.tmp'
+        with open(temporaire, 'wb') as f:
+            f.write(encoder_segment(series))
+        os.replace(temporaire, chemin)
+
+    def ajouter(self, stations):
+        """Met de côté les prix dont la date_maj est plus récente que le dernier point connu"""
+        nouveaux = 0
+        for station in stations:
+            id_station = str(station.get('id_station'))
+            for carburant in station.get('carburants', []):
+                t = date_en_epoch(carburant.get('date_maj'))
+                cle = (id_station, carburant['type'])
+                if not t or t <= self.derniers.get(cle, 0):
+                    continue
+                self.derniers[cle] = t
+                self.en_attente.setdefault(cle, []).append((t, int(round(carburant['prix'] * 1000))))
+                nouveaux += 1
+        return nouveaux
+
+    def enregistrer(self):
+        """Écrit les points en attente dans un nouveau segment ; retourne le nombre de points"""
+        if not self.en_attente:
+            return 0
+        self.rafraichir()
+        nb_points = sum(len(points) for points in self.en_attente.values())
+        self.dernier_numero += 1
+        nom = f'segment_{self.dernier_numero:06d}.bin'
+        self._ecrire(nom, self.en_attente)
+        self.en_attente = {}
+        self._ouvrir(nom)
+        return nb_points
+
+    def compacter(self):
+        """Fusionne tous les segments en un seul ; retourne le nombre de segments fusionnés"""
+        self.rafraichir()
+        if len(self.segments) < 2:
+            return 0
+        series = {}
+        for segment in self._segments_courants():
+            for id_station, carburant in segment.repertoire:
+                series.setdefault((id_station, carburant), []).extend(segment.points(id_station, carburant))
+        anciens = list(self.segments)
+        _, plages_disque = self._segments_sur_disque()
+        plages = [plages_disque[nom] for nom in anciens]
+        nom = f'segment_{min(d for d, _ in plages):06d}-{max(f for _, f in plages):06d}.bin'
+        # Écrit avant de supprimer : un lecteur qui voit les deux ignore les segments couverts
+        self._ecrire(nom, series)
+        for ancien in anciens:
+            os.remove(os.path.join(self.dossier, ancien))
+        self.rafraichir()
+        return len(anciens)
+
+    def points(self, id_station, carburant, debut=0, fin=None):
+        """Tableaux (temps epoch, prix en €) d'une série entre debut et fin inclus"""
+        temps, prix = [], []
+        for segment in self._segments_courants():
+            if segment.t_max < debut or (fin is not None and segment.t_min > fin):
+                continue
+            for t, p in segment.points(str(id_station), carburant):
+                if t >= debut and (fin is None or t <= fin):
+                    temps.append(t)
+                    prix.append(p)
+        return np.array(temps, dtype=np.int64), np.array(prix, dtype=np.float64) / 1000
+
+    def agreger(self, ids_stations, carburant, debut, fin, pas):
+        """Min/moyenne/max par intervalle de `pas` secondes, sur une ou plusieurs stations"""
+        series = [self.points(id_station, carburant, debut, fin) for id_station in ids_stations]
+        temps = np.concatenate([t for t, _ in series]) if series else np.empty(0, dtype=np.int64)
+        prix = np.concatenate([p for _, p in series]) if series else np.empty(0)
+        if not temps.size:
+            return []
+
+        seaux = (temps - debut) // pas
+        nb_seaux = int(seaux.max()) + 1
+        comptes = np.bincount(seaux, minlength=nb_seaux)
+        sommes = np.bincount(seaux, weights=prix, minlength=nb_seaux)
+        minimums = np.full(nb_seaux, np.inf)
+        maximums = np.full(nb_seaux, -np.inf)
+        np.minimum.at(minimums, seaux, prix)
+        np.maximum.at(maximums, seaux, prix)
+
+        return [{
+            'debut': int(debut + k * pas),
+            'min': float(minimums[k]),
+            'avg': float(sommes[k] / comptes[k]),
+            'max': float(maximums[k]),
+            'count': int(comptes[k])
+        } for k in np.flatnonzero(comptes)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajoute les prix d'un fichier de stations à l'historique")
+    parser.add_argument('source', nargs='?', default='data/stations.json')
+    parser.add_argument('--dossier', default=DOSSIER_HISTORIQUE)
+    parser.add_argument('--compacter', action='store_true', help="fusionne les segments existants")
+    args = parser.parse_args()
+
+    historique = HistoriquePrix(args.dossier)
+    if args.compacter:
+        print(f"🗜️ {historique.compacter()} segments fusionnés dans {args.dossier}")
+        raise SystemExit
+    with open(args.source, 'r', encoding='utf-8') as f:
+        stations = json.load(f)
+    historique.ajouter(stations)
+    total = historique.enregistrer()
+    print(f"✅ {total} nouveaux points de prix ajoutés à {args.dossier}")
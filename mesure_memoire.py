@@ -0,0 +1,191 @@
+"""Mesure la mémoire par worker gunicorn (RSS, PSS, privée) à 1, 4 et 16 workers
+
+Trois modes sont comparés sur un jeu de données multiplié (×100 par défaut) :
+    json      chaque worker charge le JSON et construit son propre store (sans preload)
+    preload   JSON chargé une fois dans le maître, objets gelés (gc.freeze) avant le fork
+    snapshot  preload + snapshot binaire ouvert en mmap (configuration de gunicorn.conf.py)
+
+Mesure aussi les octets alloués par station : dicts lus dans le JSON, puis les mêmes
+stations compactées (voir station_compacte.py).
+
+Usage : python mesure_memoire.py [--multiplier 100] [--workers 1 4 16] [--sortie data/mesure_memoire.json]
+Linux uniquement (lecture de /proc/<pid>/smaps_rollup).
+"""
+import argparse
+import gc
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from generate_big_data import generer_fichier
+
+# Requêtes envoyées avant la mesure pour que chaque worker touche réellement les données
+REQUETES = [
+    ('GET', '/', None),
+    ('GET', '/statistiques', None),
+    ('POST', '/recherche', 'ville=paris&carburant=Gazole'),
+    ('POST', '/recherche', 'departement=13'),
+    ('GET', '/api/stations?limit=500', None),
+    ('GET', '/api/nearby?lat=48.85&lon=2.35&radius_km=30&carburant=Gazole', None),
+    ('GET', '/export-csv?departement=75', None),
+]
+
+
+def multiplier_donnees(source, multiplier, destination):
+    """Écrit une copie ×multiplier du fichier de stations (voir generate_big_data.py)"""
+    return generer_fichier(source, multiplier, destination)
+
+
+def memoire_processus(pid):
+    """Rss, Pss et mémoire privée (ko) d'un processus"""
+    valeurs = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for ligne in f:
+            champs = ligne.split()
+            if len(champs) >= 2 and champs[0].endswith(':'):
+                valeurs[champs[0][:-1]] = int(champs[1])
+    return {
+        'rss_ko': valeurs.get('Rss', 0),
+        'pss_ko': valeurs.get('Pss', 0),
+        'prive_ko': valeurs.get('Private_Clean', 0) + valeurs.get('Private_Dirty', 0)
+    }
+
+
+def octets_par_station(donnees):
+    """Octets alloués par station : liste de dicts du JSON, puis stations compactes seules"""
+    from station_compacte import StationsCompactes
+    gc.collect()
+    tracemalloc.start()
+    depart = tracemalloc.get_traced_memory()[0]
+    with open(donnees, 'r', encoding='utf-8') as f:
+        stations = json.load(f)
+    gc.collect()
+    dicts = tracemalloc.get_traced_memory()[0] - depart
+
+    # Les chaînes internées et les valeurs partagées sont comptées avec les stations compactes
+    compactes = StationsCompactes(stations)
+    del stations
+    gc.collect()
+    compact = tracemalloc.get_traced_memory()[0] - depart
+    tracemalloc.stop()
+    return {
+        'dicts_octets': round(dicts / len(compactes)),
+        'compact_octets': round(compact / len(compactes)),
+        'reduction': round(dicts / compact, 2)
+    }
+
+
+def enfants(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def attendre_workers(maitre, port, nb_workers, timeout=600):
+    """Attend que les workers soient lancés et que le serveur réponde"""
+    debut = time.time()
+    while time.time() - debut < timeout:
+        if maitre.poll() is not None:
+            raise RuntimeError("gunicorn s'est arrêté pendant le démarrage")
+        if len(enfants(maitre.pid)) >= nb_workers:
+            try:
+                connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                connexion.request('GET', '/api/stations?limit=1')
+                if connexion.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+        time.sleep(0.5)
+    raise RuntimeError("Délai de démarrage dépassé")
+
+
+def solliciter(port, nb_requetes):
+    for k in range(nb_requetes):
+        methode, chemin, corps = REQUETES[k % len(REQUETES)]
+        connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        entetes = {'Content-Type': 'application/x-www-form-urlencoded'} if corps else {}
+        connexion.request(methode, chemin, body=corps, headers=entetes)
+        connexion.getresponse().read()
+        connexion.close()
+
+
+def mesurer(mode, nb_workers, donnees, dossier_tmp, port):
+    env = dict(os.environ, CARBURANT_DONNEES=donnees, WEB_CONCURRENCY=str(nb_workers))
+    env.pop('CARBURANT_PRELOAD', None)
+    if mode == 'json':
+        # Config vide pour ne pas reprendre gunicorn.conf.py (pas de preload, pas de snapshot)
+        config = os.path.join(dossier_tmp, 'vide.conf.py')
+        open(config, 'w').close()
+        env['CARBURANT_SNAPSHOT'] = os.path.join(dossier_tmp, 'absent')
+    elif mode == 'preload':
+        config = 'gunicorn.conf.py'
+        env['CARBURANT_SNAPSHOT'] = os.path.join(dossier_tmp, 'absent')
+        env['CARBURANT_SNAPSHOT_AUTO'] = '0'
+    else:
+        config = 'gunicorn.conf.py'
+        env['CARBURANT_SNAPSHOT'] = os.path.join(dossier_tmp, 'snapshot')
+
+    commande = [sys.executable, '-m', 'gunicorn', '-c', config, '-w', str(nb_workers),
+                '--bind', f'127.0.0.1:{port}', '--timeout', '600', 'app:app']
+    maitre = subprocess.Popen(commande, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        attendre_workers(maitre, port, nb_workers)
+        solliciter(port, 20 * nb_workers)
+        time.sleep(1)
+        workers = [memoire_processus(pid) for pid in enfants(maitre.pid)]
+        principal = memoire_processus(maitre.pid)
+    finally:
+        maitre.terminate()
+        maitre.wait()
+
+    moyenne = {cle: round(sum(w[cle] for w in workers) / len(workers)) for cle in workers[0]}
+    return {
+        'mode': mode,
+        'workers': nb_workers,
+        'worker_moyen_ko': moyenne,
+        'maitre_ko': principal,
+        'pss_total_ko': principal['pss_ko'] + sum(w['pss_ko'] for w in workers)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mémoire par worker gunicorn selon le mode de chargement")
+    parser.add_argument('--source', default='data/stations.json')
+    parser.add_argument('--multiplier', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--modes', nargs='+', default=['json', 'preload', 'snapshot'])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--sortie', default='data/mesure_memoire.json')
+    args = parser.parse_args()
+
+    resultats = []
+    with tempfile.TemporaryDirectory() as dossier_tmp:
+        donnees = os.path.join(dossier_tmp, 'stations.json')
+        total = multiplier_donnees(args.source, args.multiplier, donnees)
+        print(f"📊 {total} stations (×{args.multiplier})")
+        octets = octets_par_station(donnees)
+        print(f"🧱 Octets par station : {octets['dicts_octets']} (dicts) → {octets['compact_octets']} (compact), "
+              f"÷{octets['reduction']}")
+        if 'snapshot' in args.modes:
+            # Snapshot construit à l'avance : la conversion ne doit pas gonfler le maître mesuré
+            from snapshot import ecrire_snapshot
+            with open(donnees, 'r', encoding='utf-8') as f:
+                ecrire_snapshot(json.load(f), os.path.join(dossier_tmp, 'snapshot'), source=donnees)
+        print(f"{'mode':<10}{'workers':>8}{'RSS/worker':>14}{'PSS/worker':>14}{'privé/worker':>14}{'PSS total':>14}")
+        for mode in args.modes:
+            for nb_workers in args.workers:
+                r = mesurer(mode, nb_workers, donnees, dossier_tmp, args.port)
+                resultats.append(r)
+                w = r['worker_moyen_ko']
+                print(f"{mode:<10}{nb_workers:>8}{w['rss_ko'] / 1024:>11.1f} Mo{w['pss_ko'] / 1024:>11.1f} Mo"
+                      f"{w['prive_ko'] / 1024:>11.1f} Mo{r['pss_total_ko'] / 1024:>11.1f} Mo")
+
+    with open(args.sortie, 'w', encoding='utf-8') as f:
+        json.dump({'stations': total, 'multiplier': args.multiplier, 'octets_par_station': octets,
+                   'mesures': resultats},
+                  f, ensure_ascii=False, indent=2)
+    print(f"💾 Résultats écrits dans {args.sortie}")
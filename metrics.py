@@ -0,0 +1,142 @@
+"""Métriques des requêtes (histogrammes de latence et de taille) au format texte Prometheus
+
+Les métriques sont propres à chaque processus : avec plusieurs workers gunicorn, chaque
+worker expose les siennes et /metrics répond avec celles du worker qui traite la requête.
+"""
+import threading
+import time
+from collections import deque
+
+# Bornes des histogrammes (secondes, octets, nombre de stations)
+BORNES_LATENCE = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BORNES_TAILLE = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+BORNES_RESULTATS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# Nombre de requêtes lentes gardées en mémoire
+TAILLE_JOURNAL_LENTES = 200
+
+
+def echapper(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formater_labels(noms, valeurs, supplementaires=()):
+    paires = [f'{nom}="{echapper(valeur)}"' for nom, valeur in list(zip(noms, valeurs)) + list(supplementaires)]
+    return '{' + ','.join(paires) + '}' if paires else ''
+
+
+def formater_nombre(valeur):
+    if valeur == float('inf'):
+        return '+Inf'
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+class Compteur:
+    def __init__(self, nom, aide, labels=()):
+        self.nom = nom
+        self.aide = aide
+        self.labels = labels
+        self.valeurs = {}
+
+    def incrementer(self, labels=(), valeur=1):
+        self.valeurs[labels] = self.valeurs.get(labels, 0) + valeur
+
+    def lignes(self):
+        yield f'# HELP {self.nom} {self.aide}'
+        yield f'# TYPE {self.nom} counter'
+        for labels, valeur in sorted(self.valeurs.items()):
+            yield f'{self.nom}{formater_labels(self.labels, labels)} {formater_nombre(valeur)}'
+
+
+class Histogramme:
+    def __init__(self, nom, aide, bornes, labels=()):
+        self.nom = nom
+        self.aide = aide
+        self.bornes = bornes
+        self.labels = labels
+        # labels → [comptes par borne (+Inf en dernier), somme]
+        self.series = {}
+
+    def observer(self, valeur, labels=()):
+        serie = self.series.get(labels)
+        if serie is None:
+            serie = self.series[labels] = [[0] * (len(self.bornes) + 1), 0]
+        comptes = serie[0]
+        for k, borne in enumerate(self.bornes):
+            if valeur <= borne:
+                comptes[k] += 1
+                break
+        else:
+            comptes[-1] += 1
+        serie[1] += valeur
+
+    def lignes(self):
+        yield f'# HELP {self.nom} {self.aide}'
+        yield f'# TYPE {self.nom} histogram'
+        for labels, (comptes, somme) in sorted(self.series.items()):
+            cumul = 0
+            for borne, compte in zip(list(self.bornes) + [float('inf')], comptes):
+                cumul += compte
+                le = formater_labels(self.labels, labels, [('le', formater_nombre(borne))])
+                yield f'{self.nom}_bucket{le} {cumul}'
+            yield f'{self.nom}_sum{formater_labels(self.labels, labels)} {formater_nombre(somme)}'
+            yield f'{self.nom}_count{formater_labels(self.labels, labels)} {cumul}'
+
+
+class Metriques:
+    """Compteurs et histogrammes des requêtes, plus le journal des requêtes lentes"""
+
+    def __init__(self, seuil_lent=0.5):
+        self.seuil_lent = seuil_lent
+        self._verrou = threading.Lock()
+        self.requetes = Compteur('carburant_http_requests_total', 'Requêtes traitées',
+                                 ('route', 'method', 'status'))
+        self.latence = Histogramme('carburant_http_request_duration_seconds', 'Durée de traitement des requêtes',
+                                   BORNES_LATENCE, ('route', 'method'))
+        self.taille_requete = Histogramme('carburant_http_request_size_bytes', 'Taille du corps des requêtes',
+                                          BORNES_TAILLE, ('route',))
+        self.taille_reponse = Histogramme('carburant_http_response_size_bytes',
+                                          'Taille des réponses (hors réponses en flux)', BORNES_TAILLE, ('route',))
+        self.resultats = Histogramme('carburant_search_results', 'Nombre de stations trouvées par recherche',
+                                     BORNES_RESULTATS, ('route',))
+        self.lentes = Compteur('carburant_slow_requests_total', 'Requêtes lentes par combinaison de filtres',
+                               ('route', 'filtres'))
+        self.journal_lentes = deque(maxlen=TAILLE_JOURNAL_LENTES)
+
+    def observer(self, route, methode, statut, duree, taille_requete, taille_reponse=None,
+                 nb_resultats=None, filtres=None):
+        with self._verrou:
+            self.requetes.incrementer((route, methode, str(statut)))
+            self.latence.observer(duree, (route, methode))
+            self.taille_requete.observer(taille_requete, (route,))
+            if taille_reponse is not None:
+                self.taille_reponse.observer(taille_reponse, (route,))
+            if nb_resultats is not None:
+                self.resultats.observer(nb_resultats, (route,))
+            if duree >= self.seuil_lent:
+                combinaison = '+'.join(sorted(filtres)) if filtres else 'aucun'
+                self.lentes.incrementer((route, combinaison))
+                entree = {
+                    'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'route': route,
+                    'methode': methode,
+                    'statut': statut,
+                    'duree_ms': round(duree * 1000, 1),
+                    'filtres': filtres or {},
+                    'resultats': nb_resultats
+                }
+                self.journal_lentes.append(entree)
+                return entree
+        return None
+
+    def texte(self, jauges=(), compteurs=()):
+        """Toutes les métriques au format texte Prometheus ; jauges et compteurs : [(nom, aide, valeur)]"""
+        lignes = []
+        for type_metrique, valeurs in (('gauge', jauges), ('counter', compteurs)):
+            for nom, aide, valeur in valeurs:
+                lignes += [f'# HELP {nom} {aide}', f'# TYPE {nom} {type_metrique}', f'{nom} {formater_nombre(valeur)}']
+        with self._verrou:
+            for metrique in (self.requetes, self.latence, self.taille_requete, self.taille_reponse,
+                             self.resultats, self.lentes):
+                lignes.extend(metrique.lignes())
+        return '\n'.join(lignes) + '\n'
@@ -0,0 +1,590 @@
+"""Moteurs de stockage des stations : en mémoire (StationStore) ou MongoDB
+
+Les routes de app.py ne parlent qu'à un moteur, choisi par CARBURANT_BACKEND
+(memoire par défaut, ou mongo). Tous les moteurs offrent la même interface :
+
+    rechercher(filtres, tri, lat, lon, debut, nombre)  → (total, stations de la page)
+    stats_accueil(), stats_prix(), top_departements(limite), distributions_prix(departement), cube()
+    exporter(filtres, champs)                          → (total, itérateur de stations)
+    parcourir(debut, limite, apres)                    → (total, debut, itérateur de stations)
+    proches(lat, lon, rayon_km, carburant, k, tri)     → stations avec distance_km
+    villes(prefixe, limite)                            → [{ville, stations}] pour l'autocomplétion
+    ids_departement(departement), total(), version(), date_version(), metriques()
+
+Les stations renvoyées sont des dicts au format de data/stations.json (seulement les champs
+demandés quand exporter() reçoit champs).
+"""
+import math
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+from cache_recherche import cle_recherche
+from station_cube import CubePrix
+from station_geo import KM_PAR_DEGRE, haversine_km
+from station_index import PrefixesVilles, normaliser_texte
+from station_quantiles import DistributionPrix
+from station_store import normaliser_coordonnee
+
+# Champs ajoutés aux documents MongoDB pour les index, retirés des stations renvoyées
+CHAMPS_INTERNES_MONGO = ('empreinte', 'position', 'ville_normalisee', 'carburants_en_stock')
+PROJECTION_MONGO = {'_id': 0, **{champ: 0 for champ in CHAMPS_INTERNES_MONGO}}
+
+# Durée (s) pendant laquelle la version lue dans MongoDB est réutilisée
+DUREE_VERSION_MONGO = 5
+
+# Clé de tri des stations sans prix pour le carburant choisi (après toutes les autres)
+PRIX_ABSENT = 1e9
+
+
+def preparer_document(station):
+    """Champs d'index d'un document MongoDB : ville normalisée, carburants disponibles et position GeoJSON"""
+    ruptures = station.get('ruptures') or ()
+    champs = {
+        'ville_normalisee': normaliser_texte(station.get('ville') or ''),
+        'carburants_en_stock': [c['type'] for c in station.get('carburants', []) if c['type'] not in ruptures]
+    }
+    latitude = normaliser_coordonnee(station.get('latitude'))
+    longitude = normaliser_coordonnee(station.get('longitude'))
+    if latitude == latitude and longitude == longitude and abs(latitude) <= 90 and abs(longitude) <= 180:
+        champs['position'] = {'type': 'Point', 'coordinates': [longitude, latitude]}
+    return champs
+
+
+def publier_version(base):
+    """Nouvelle version des stations MongoDB : les moteurs oublient leurs statistiques"""
+    base['meta'].update_one({'_id': 'stations'}, {'$inc': {'version': 1}, '$set': {'date': time.time()}},
+                            upsert=True)
+
+
+class MoteurMemoire:
+    """Stations en mémoire (colonnes NumPy, index et agrégats du StationStore)
+
+    courant() renvoie le Dataset utilisé par la requête en cours ; les recherches passent
+    par le cache de résultats, vidé à chaque nouvelle version.
+    """
+    nom = 'memoire'
+
+    def __init__(self, courant, cache):
+        self.courant = courant
+        self.cache = cache
+
+    @property
+    def store(self):
+        return self.courant().store
+
+    def version(self):
+        """Version des fichiers lus, la même dans tous les workers ; suivie du nombre de
+        modifications en place du store s'il y en a eu (propres à ce processus)"""
+        dataset = self.courant()
+        generation = dataset.store.generation
+        return f'{dataset.version}.{generation}' if generation else dataset.version
+
+    def date_version(self):
+        """Date (epoch) de modification des fichiers de la version courante (même date dans tous les workers)"""
+        return self.courant().date_donnees
+
+    def total(self):
+        return len(self.store)
+
+    def positions(self, filtres):
+        """Positions des stations correspondant aux filtres, depuis le cache si possible"""
+        dataset = self.courant()
+        version = (dataset.version, dataset.store.generation)
+        cle = cle_recherche(**filtres)
+        positions = self.cache.obtenir(version, cle)
+        if positions is None:
+            positions = self.cache.ranger(version, cle, dataset.store.rechercher(**filtres))
+        return positions
+
+    def rechercher(self, filtres, tri='', lat=None, lon=None, debut=0, nombre=None):
+        store = self.store
+        positions = self.positions(filtres)
+        page = store.trier(positions, tri, filtres['carburant'], lat, lon, debut=debut, nombre=nombre)
+        return len(positions), store.stations_aux_positions(page)
+
+    def stats_accueil(self):
+        return self.store.stats_accueil()
+
+    def stats_prix(self):
+        return self.store.stats_prix()
+
+    def top_departements(self, limite=10):
+        return self.store.top_departements(limite)
+
+    def distributions_prix(self, departement=None):
+        return self.store.distributions_prix(departement)
+
+    def cube(self):
+        return self.store.cube
+
+    def exporter(self, filtres, champs=None):
+        store = self.store
+        positions = self.positions(filtres)
+        if champs:
+            return len(positions), store.partielles(positions, champs)
+        return len(positions), (store.stations[i] for i in positions)
+
+    def parcourir(self, debut=0, limite=None, apres=None):
+        store = self.store
+        total = len(store)
+        if apres is not None:
+            debut = store.position(apres) + 1
+        debut = min(debut, total)
+        fin = total if limite is None else min(debut + limite, total)
+        return total, debut, (store.stations[i] for i in range(debut, fin))
+
+    def proches(self, lat, lon, rayon_km, carburant='', k=10, tri=''):
+        store = self.store
+        positions, distances = store.proches(lat, lon, rayon_km, carburant=carburant, k=k, tri=tri)
+        stations = []
+        for i, distance in zip(positions, distances):
+            station = dict(store.stations[i])
+            station['latitude'] = float(store.latitude[i])
+            station['longitude'] = float(store.longitude[i])
+            station['distance_km'] = round(float(distance), 3)
+            if carburant:
+                station['prix'] = float(store.prix[i, store.index_carburant[carburant]])
+            stations.append(station)
+        return stations
+
+    def villes(self, prefixe, limite=10):
+        return self.store.index.prefixes_villes.completer(prefixe, limite)
+
+    def ids_departement(self, departement):
+        store = self.store
+        return [store.stations[i].get('id_station') for i in store.index.par_departement.get(departement, [])]
+
+    def metriques(self):
+        """Jauges et compteurs propres au moteur, ajoutés à /metrics"""
+        dataset = self.courant()
+        jauges = [
+            ('carburant_dataset_reloads', 'Versions des données publiées par ce worker', dataset.numero),
+            ('carburant_dataset_stations', 'Nombre de stations de la version publiée', len(dataset.store)),
+            ('carburant_dataset_age_seconds', 'Âge de la version publiée', round(time.time() - dataset.date_chargement, 3)),
+            ('carburant_search_cache_entries', 'Recherches en cache', len(self.cache))
+        ]
+        compteurs = [
+            ('carburant_search_cache_hits_total', 'Recherches servies par le cache', self.cache.hits),
+            ('carburant_search_cache_misses_total', 'Recherches absentes du cache', self.cache.misses),
+            ('carburant_search_cache_evictions_total', 'Entrées retirées du cache (taille ou TTL)', self.cache.evictions)
+        ]
+        return jauges, compteurs
+
+
+class MoteurMongo:
+    """Stations lues dans MongoDB avec un seul client (et son pool de connexions) par processus
+
+    Le client est créé à la première requête, donc après le fork des workers gunicorn.
+    creer_index() prépare la collection au démarrage avec un client temporaire.
+    Une URI mongomock:// remplace le serveur par mongomock (tests, benchmark) ; mongomock
+    n'implémentant ni $geoNear ni $geoWithin, les recherches par distance lisent alors une
+    boîte englobante et calculent les distances ici (voir _par_distance).
+    """
+    nom = 'mongo'
+
+    def __init__(self, uri='mongodb://localhost:27017/', base='carburant_db', taille_pool=50):
+        self.uri = uri
+        self.base = base
+        self.taille_pool = taille_pool
+        self._client = None
+        self._verrou = threading.Lock()
+        self._version = (float('-inf'), None, 0)
+        self._stats = {}
+
+    def _nouveau_client(self):
+        if self.uri.startswith('mongomock://'):
+            # mongomock ne partage pas ses données entre clients : un seul pour tout le processus
+            if self._client is None:
+                import mongomock
+                self._client = mongomock.MongoClient()
+            return self._client
+        from pymongo import MongoClient
+        return MongoClient(self.uri, maxPoolSize=self.taille_pool)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._verrou:
+                if self._client is None:
+                    self._client = self._nouveau_client()
+        return self._client
+
+    @property
+    def stations(self):
+        return self.client[self.base]['stations']
+
+    @property
+    def geo_natif(self):
+        """Vrai si le serveur exécute les opérateurs géographiques ($geoNear), faux avec mongomock"""
+        return not self.uri.startswith('mongomock://')
+
+    def _par_distance(self, requete, lat, lon, rayon_km=None):
+        """[(distance km, document)] des stations localisées, triées par distance (sans $geoNear)
+
+        Avec un rayon, seule la boîte englobante du cercle est lue en base.
+        """
+        requete = dict(requete, position={'$exists': True})
+        if rayon_km is not None:
+            delta_lat = rayon_km / KM_PAR_DEGRE
+            delta_lon = rayon_km / (KM_PAR_DEGRE * max(math.cos(math.radians(lat)), 0.01))
+            requete['position.coordinates.0'] = {'$gte': lon - delta_lon, '$lte': lon + delta_lon}
+            requete['position.coordinates.1'] = {'$gte': lat - delta_lat, '$lte': lat + delta_lat}
+        documents = list(self.stations.find(requete).sort('_id', 1))
+        if not documents:
+            return []
+        coordonnees = np.array([document['position']['coordinates'] for document in documents], dtype=float)
+        distances = haversine_km(lat, lon, coordonnees[:, 1], coordonnees[:, 0])
+        # Tri stable : à distance égale, l'ordre des _id
+        ordre = np.argsort(distances, kind='stable')
+        if rayon_km is not None:
+            ordre = ordre[distances[ordre] <= rayon_km]
+        return [(float(distances[i]), documents[i]) for i in ordre]
+
+    @staticmethod
+    def _sans_champs_internes(document):
+        return {nom: valeur for nom, valeur in document.items() if nom not in PROJECTION_MONGO}
+
+    def creer_index(self):
+        """Index utilisés par les recherches, et champs d'index des documents qui n'en ont pas"""
+        client = self._nouveau_client()
+        try:
+            stations = client[self.base]['stations']
+            a_completer = list(stations.find({'$or': [{'ville_normalisee': {'$exists': False}},
+                                                      {'carburants_en_stock': {'$exists': False}}]},
+                                             {'_id': 1, 'ville': 1, 'latitude': 1, 'longitude': 1,
+                                              'carburants': 1, 'ruptures': 1}))
+            if a_completer:
+                from pymongo import UpdateOne
+                stations.bulk_write([UpdateOne({'_id': doc['_id']}, {'$set': preparer_document(doc)})
+                                     for doc in a_completer], ordered=False)
+            stations.create_index('id_station')
+            stations.create_index('ville_normalisee')
+            stations.create_index('code_departement')
+            stations.create_index([('carburants.type', 1), ('carburants.prix', 1)])
+            stations.create_index('carburants_en_stock')
+            stations.create_index([('position', '2dsphere')])
+            print(f"🗂️ Index MongoDB prêts ({len(a_completer)} documents complétés)")
+        finally:
+            if client is not self._client:
+                client.close()
+
+    def importer(self, stations, taille_lot=5000):
+        """Remplace toutes les stations de la collection (benchmark, import d'un fichier)"""
+        self.stations.delete_many({})
+        lot = []
+        for station in stations:
+            lot.append(dict(station, **preparer_document(station)))
+            if len(lot) == taille_lot:
+                self.stations.insert_many(lot, ordered=False)
+                lot = []
+        if lot:
+            self.stations.insert_many(lot, ordered=False)
+        self._nouvelle_version()
+
+    def dupliquer(self, multiplicateur, par_copie=100):
+        """Ajoute (multiplicateur - 1) copies BIG_ de 100 stations d'origine, prix légèrement modifiés
+
+        Retourne (stations ajoutées, total en base) ; supprimer_copies() les retire.
+        """
+        originales = {'id_station': {'$not': {'$regex': '^BIG_'}}}
+        nouvelles = []
+        compteur = 1000000
+        for _ in range(multiplicateur - 1):
+            for station in self.stations.find(originales).limit(par_copie):
+                station.pop('_id', None)
+                station['id_station'] = f"BIG_{compteur}"
+                compteur += 1
+                for carburant in station.get('carburants', []):
+                    carburant['prix'] = round(carburant['prix'] + random.uniform(-0.05, 0.05), 3)
+                nouvelles.append(station)
+        if nouvelles:
+            self.stations.insert_many(nouvelles)
+            self._nouvelle_version()
+        return len(nouvelles), self.total()
+
+    def supprimer_copies(self):
+        """Retire les stations BIG_ ajoutées par dupliquer() ; retourne (supprimées, restantes)"""
+        supprimees = self.stations.delete_many({'id_station': {'$regex': '^BIG_'}}).deleted_count
+        if supprimees:
+            self._nouvelle_version()
+        return supprimees, self.total()
+
+    def _nouvelle_version(self):
+        publier_version(self.client[self.base])
+        self._version = (float('-inf'), None, 0)
+
+    def version(self):
+        """Version écrite par la collecte dans la collection meta (relue toutes les 5 s)"""
+        lue_le, version, _ = self._version
+        if time.monotonic() - lue_le > DUREE_VERSION_MONGO:
+            meta = self.client[self.base]['meta'].find_one({'_id': 'stations'}) or {}
+            version = meta.get('version', 0)
+            if version != self._version[1]:
+                self._stats = {}
+            self._version = (time.monotonic(), version, meta.get('date', 0))
+        return version
+
+    def date_version(self):
+        """Date (epoch) de la dernière collecte ayant modifié les stations"""
+        self.version()
+        return self._version[2]
+
+    def total(self):
+        return self.stations.count_documents({})
+
+    @staticmethod
+    def requete(filtres):
+        """Filtre MongoDB équivalent à StationStore.rechercher"""
+        requete = {}
+        if filtres.get('ville'):
+            requete['ville_normalisee'] = {'$regex': re.escape(normaliser_texte(filtres['ville']))}
+        if filtres.get('departement'):
+            requete['code_departement'] = filtres['departement']
+        if filtres.get('carburant'):
+            requete['carburants.type'] = filtres['carburant']
+        # Au moins un carburant de la station dans la fourchette de prix
+        if filtres.get('prix_min') is not None or filtres.get('prix_max') is not None:
+            prix = {}
+            if filtres.get('prix_min') is not None:
+                prix['$gte'] = filtres['prix_min']
+            if filtres.get('prix_max') is not None:
+                prix['$lte'] = filtres['prix_max']
+            requete['carburants'] = {'$elemMatch': {'prix': prix}}
+        # Carburant choisi (ou au moins un carburant) proposé et pas en rupture
+        if filtres.get('en_stock'):
+            if filtres.get('carburant'):
+                requete['carburants_en_stock'] = filtres['carburant']
+            else:
+                requete['carburants_en_stock.0'] = {'$exists': True}
+        # Une plage d'ouverture [debut, fin) contient la minute de la semaine demandée
+        if filtres.get('ouvert') is not None:
+            requete['ouvertures'] = {'$elemMatch': {'0': {'$lte': filtres['ouvert']},
+                                                    '1': {'$gt': filtres['ouvert']}}}
+        return requete
+
+    @staticmethod
+    def _valeurs_carburant(champ, carburant):
+        """Expression : valeurs de champ pour le carburant choisi (tous les carburants sinon)"""
+        if not carburant:
+            return f'$carburants.{champ}'
+        return {'$map': {
+            'input': {'$filter': {'input': '$carburants', 'as': 'c', 'cond': {'$eq': ['$$c.type', carburant]}}},
+            'as': 'c', 'in': f'$$c.{champ}'
+        }}
+
+    def rechercher(self, filtres, tri='', lat=None, lon=None, debut=0, nombre=None):
+        requete = self.requete(filtres)
+        if tri == 'distance':
+            # $geoNear ne renvoie que les stations localisées : le total les compte de même
+            requete['position'] = {'$exists': True}
+        total = self.stations.count_documents(requete)
+        if not tri:
+            curseur = self.stations.find(requete, PROJECTION_MONGO).sort('_id', 1).skip(debut)
+            return total, list(curseur.limit(nombre) if nombre else curseur)
+
+        if tri == 'distance' and not self.geo_natif:
+            proches = self._par_distance(requete, lat, lon)[debut:debut + nombre if nombre else None]
+            return total, [self._sans_champs_internes(document) for _, document in proches]
+
+        if tri == 'distance':
+            pipeline = [{'$geoNear': {'near': {'type': 'Point', 'coordinates': [lon, lat]}, 'key': 'position',
+                                      'distanceField': '_cle', 'query': requete, 'spherical': True}}]
+        else:
+            # Prix le plus bas ou mise à jour la plus récente (les dates ISO se comparent en texte)
+            champ = 'prix' if tri == 'prix' else 'date_maj'
+            cle = {'$ifNull': [{'$min': '$_cle'}, PRIX_ABSENT]} if tri == 'prix' else {'$max': '$_cle'}
+            pipeline = [{'$match': requete},
+                        {'$addFields': {'_cle': self._valeurs_carburant(champ, filtres['carburant'])}},
+                        {'$addFields': {'_cle': cle}},
+                        {'$sort': {'_cle': -1 if tri == 'date' else 1, '_id': 1}}]
+        pipeline.append({'$skip': debut})
+        if nombre:
+            pipeline.append({'$limit': nombre})
+        pipeline.append({'$project': dict(PROJECTION_MONGO, _cle=0)})
+        return total, list(self.stations.aggregate(pipeline))
+
+    def _stat(self, nom, calculer):
+        """Statistiques gardées tant que la version des données ne change pas"""
+        self.version()
+        if nom not in self._stats:
+            self._stats[nom] = calculer()
+        return self._stats[nom]
+
+    def stats_accueil(self):
+        def calculer():
+            gazole = list(self.stations.aggregate([
+                {'$unwind': '$carburants'},
+                {'$match': {'carburants.type': 'Gazole'}},
+                {'$group': {'_id': None, 'moyenne': {'$avg': '$carburants.prix'}}}
+            ]))
+            return {
+                'total_stations': self.total(),
+                'total_departments': len([d for d in self.stations.distinct('code_departement') if d]),
+                'avg_price_gazole': gazole[0]['moyenne'] if gazole else 0
+            }
+        return self._stat('accueil', calculer)
+
+    def stats_prix(self):
+        def calculer():
+            return [{
+                '_id': stat['_id'],
+                'moyenne': float(stat['moyenne']),
+                'minimum': float(stat['minimum']),
+                'maximum': float(stat['maximum']),
+                'count': stat['count']
+            } for stat in self.stations.aggregate([
+                {'$unwind': '$carburants'},
+                {'$group': {
+                    '_id': '$carburants.type',
+                    'moyenne': {'$avg': '$carburants.prix'},
+                    'minimum': {'$min': '$carburants.prix'},
+                    'maximum': {'$max': '$carburants.prix'},
+                    'count': {'$sum': 1}
+                }},
+                {'$sort': {'_id': 1}}
+            ])]
+        return self._stat('prix', calculer)
+
+    def top_departements(self, limite=10):
+        def calculer():
+            return [{'count': dep['count'], '_id': dep['_id'] or 'Inconnu'}
+                    for dep in self.stations.aggregate([
+                        {'$group': {'_id': '$code_departement', 'count': {'$sum': 1}}},
+                        {'$sort': {'count': -1, '_id': 1}},
+                        {'$limit': limite}
+                    ])]
+        return self._stat(('top_departements', limite), calculer)
+
+    def distributions_prix(self, departement=None):
+        """Distributions construites à partir du nombre de stations par (carburant, prix)"""
+        def calculer():
+            pipeline = [{'$match': {'code_departement': departement}}] if departement is not None else []
+            pipeline += [
+                {'$unwind': '$carburants'},
+                {'$group': {'_id': {'type': '$carburants.type', 'prix': '$carburants.prix'}, 'count': {'$sum': 1}}}
+            ]
+            distributions = {}
+            for groupe in self.stations.aggregate(pipeline):
+                type_carb, prix = groupe['_id'].get('type'), groupe['_id'].get('prix')
+                if type_carb is not None and prix is not None:
+                    distributions.setdefault(type_carb, DistributionPrix(1)).ajouter(0, prix, groupe['count'])
+            return [dict(distribution.resume(), _id=type_carb)
+                    for type_carb, distribution in sorted(distributions.items())]
+        return self._stat(('distributions', departement), calculer)
+
+    def cube(self):
+        """Cube construit à partir des agrégats par (département, carburant)"""
+        def calculer():
+            return CubePrix((
+                groupe['_id'].get('code'), groupe['nom'], groupe['region'], groupe['_id'].get('type'),
+                groupe['count'], groupe['somme'], groupe['minimum'], groupe['maximum']
+            ) for groupe in self.stations.aggregate([
+                {'$unwind': '$carburants'},
+                {'$match': {'carburants.prix': {'$ne': None}}},
+                {'$group': {
+                    '_id': {'code': '$code_departement', 'type': '$carburants.type'},
+                    'nom': {'$first': '$departement'},
+                    'region': {'$first': '$region'},
+                    'count': {'$sum': 1},
+                    'somme': {'$sum': '$carburants.prix'},
+                    'minimum': {'$min': '$carburants.prix'},
+                    'maximum': {'$max': '$carburants.prix'}
+                }},
+                {'$sort': {'_id.code': 1, '_id.type': 1}}
+            ]))
+        return self._stat('cube', calculer)
+
+    def exporter(self, filtres, champs=None):
+        requete = self.requete(filtres)
+        total = self.stations.count_documents(requete)
+        projection = {'_id': 0, **{champ: 1 for champ in champs}} if champs else PROJECTION_MONGO
+        return total, self.stations.find(requete, projection).sort('_id', 1).batch_size(1000)
+
+    def parcourir(self, debut=0, limite=None, apres=None):
+        total = self.stations.count_documents({})
+        requete = {}
+        if apres is not None:
+            document = (self.stations.find_one({'id_station': apres}, {'_id': 1})
+                        or (apres.isdigit() and self.stations.find_one({'id_station': int(apres)}, {'_id': 1})))
+            if not document:
+                raise KeyError(apres)
+            requete = {'_id': {'$gt': document['_id']}}
+            debut = self.stations.count_documents({'_id': {'$lte': document['_id']}})
+        debut = min(debut, total)
+        curseur = self.stations.find(requete, PROJECTION_MONGO).sort('_id', 1)
+        if apres is None:
+            curseur = curseur.skip(debut)
+        if limite is not None:
+            if limite <= 0:
+                return total, debut, iter(())
+            curseur = curseur.limit(limite)
+        return total, debut, curseur
+
+    def proches(self, lat, lon, rayon_km, carburant='', k=10, tri=''):
+        if not self.geo_natif:
+            return self._proches_sans_geo(lat, lon, rayon_km, carburant, k, tri)
+        pipeline = [{'$geoNear': {
+            'near': {'type': 'Point', 'coordinates': [lon, lat]}, 'key': 'position', 'spherical': True,
+            'distanceField': 'distance_km', 'distanceMultiplier': 0.001, 'maxDistance': rayon_km * 1000,
+            'query': {'carburants.type': carburant} if carburant else {}
+        }}]
+        if carburant:
+            pipeline.append({'$addFields': {'prix': self._valeurs_carburant('prix', carburant)}})
+            pipeline.append({'$addFields': {'prix': {'$min': '$prix'}}})
+            if tri == 'prix':
+                pipeline.append({'$sort': {'prix': 1, 'distance_km': 1}})
+        pipeline += [{'$limit': k},
+                     {'$addFields': {'longitude': {'$arrayElemAt': ['$position.coordinates', 0]},
+                                     'latitude': {'$arrayElemAt': ['$position.coordinates', 1]}}},
+                     {'$project': PROJECTION_MONGO}]
+        stations = list(self.stations.aggregate(pipeline))
+        for station in stations:
+            station['distance_km'] = round(station['distance_km'], 3)
+        return stations
+
+    def _proches_sans_geo(self, lat, lon, rayon_km, carburant, k, tri):
+        """proches() calculé à partir de _par_distance, mêmes champs que le pipeline $geoNear"""
+        stations = []
+        for distance, document in self._par_distance({'carburants.type': carburant} if carburant else {},
+                                                     lat, lon, rayon_km):
+            station = self._sans_champs_internes(document)
+            station['longitude'], station['latitude'] = document['position']['coordinates']
+            station['distance_km'] = round(distance, 3)
+            if carburant:
+                prix = [c.get('prix') for c in station.get('carburants', [])
+                        if c.get('type') == carburant and c.get('prix') is not None]
+                station['prix'] = min(prix) if prix else None
+            stations.append(station)
+        if carburant and tri == 'prix':
+            stations.sort(key=lambda station: (station['prix'] is None, station['prix'] or 0, station['distance_km']))
+        return stations[:k]
+
+    def villes(self, prefixe, limite=10):
+        prefixes = self._stat('villes', lambda: PrefixesVilles(
+            (groupe['_id'], groupe['count'])
+            for groupe in self.stations.aggregate([{'$group': {'_id': '$ville', 'count': {'$sum': 1}}}])
+            if groupe['_id']))
+        return prefixes.completer(prefixe, limite)
+
+    def ids_departement(self, departement):
+        return self.stations.distinct('id_station', {'code_departement': departement})
+
+    def metriques(self):
+        jauges = [
+            ('carburant_dataset_version', 'Version des données écrite par la collecte', self.version()),
+            ('carburant_dataset_stations', 'Nombre de stations en base', self.total())
+        ]
+        return jauges, []
+
+
+def creer_moteur(nom, **options):
+    """Moteur demandé par la configuration (CARBURANT_BACKEND)"""
+    if nom == 'memoire':
+        return MoteurMemoire(**options)
+    if nom == 'mongo':
+        return MoteurMongo(**options)
+    raise ValueError(f"Moteur de stockage inconnu: {nom} (memoire ou mongo)")
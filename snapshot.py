@@ -0,0 +1,198 @@
+"""Snapshot binaire du jeu de données : colonnes à largeur fixe et tables de chaînes ouvertes en mmap
+
+Organisation du dossier (data/snapshot par défaut) :
+    meta.json                    nombre de stations, format, date de création, tris de l'index
+    <colonne>.npy                colonnes NumPy du StationStore (prix, date_maj, dept, ...)
+    ids_tries.npy + ids_positions.npy
+                                 id_station triés (entiers, sinon texte) et leur position
+    index_<tri>.npy              tris de StationIndex (départements, villes, prix, grille...)
+    <table>.bin + <table>.npy    chaînes UTF-8 concaténées + offsets (carburants, villes, ...)
+    stations.bin + stations.npy  une station JSON compacte par entrée, décodée à la demande
+
+Usage : python snapshot.py [data/stations.json] [data/snapshot]
+"""
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from dataset import identite_fichier
+from station_compacte import StationsCompactes
+from station_store import COLONNES, TABLES, IndexIds, StationStore
+
+FORMAT_SNAPSHOT = 5
+DOSSIER_SNAPSHOT = 'data/snapshot'
+
+
+def ecrire_chaines(chemin, chaines):
+    """Écrit des chaînes (ou bytes) bout à bout dans chemin.bin et leurs offsets dans chemin.npy"""
+    longueurs = []
+    with open(chemin + '.bin', 'wb') as f:
+        for chaine in chaines:
+            donnees = chaine.encode('utf-8') if isinstance(chaine, str) else chaine
+            f.write(donnees)
+            longueurs.append(len(donnees))
+    offsets = np.zeros(len(longueurs) + 1, dtype=np.int64)
+    np.cumsum(longueurs, out=offsets[1:])
+    np.save(chemin + '.npy', offsets)
+
+
+class TableChaines:
+    """Table de chaînes en lecture seule : fichier .bin projeté en mémoire et offsets .npy"""
+
+    def __init__(self, chemin):
+        self.offsets = np.load(chemin + '.npy', mmap_mode='r')
+        with open(chemin + '.bin', 'rb') as f:
+            # mmap refuse les fichiers vides
+            if os.fstat(f.fileno()).st_size:
+                self.donnees = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.donnees = b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def brut(self, i):
+        """Octets de l'entrée i"""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.donnees[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.brut(i).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class StationsMmap(TableChaines):
+    """Stations du snapshot, décodées une par une quand on y accède (lecture seule)"""
+
+    def __getitem__(self, i):
+        return json.loads(self.brut(i))
+
+
+def ecrire_snapshot(stations, dossier=DOSSIER_SNAPSHOT, source=''):
+    """Convertit une liste de stations en snapshot (remplace l'ancien une fois complet)"""
+    # Stations écrites au même format que celles du chargement JSON (voir station_compacte.py)
+    stations = StationsCompactes(stations)
+    store = StationStore(stations)
+    colonnes = store.colonnes()
+    temporaire = dossier.rstrip('/') + '.tmp'
+    shutil.rmtree(temporaire, ignore_errors=True)
+    os.makedirs(temporaire)
+
+    for nom in COLONNES:
+        np.save(os.path.join(temporaire, nom + '.npy'), colonnes[nom])
+    for nom in TABLES:
+        ecrire_chaines(os.path.join(temporaire, nom), colonnes[nom])
+
+    # Index id → position et tris de l'index : ouverts tels quels, sans dict ni argsort par worker
+    ids = IndexIds.depuis_ids(colonnes['ids'])
+    np.save(os.path.join(temporaire, 'ids_tries.npy'), ids.ids_tries)
+    np.save(os.path.join(temporaire, 'ids_positions.npy'), ids.positions)
+    tris = store.index.tris
+    for nom, tableau in tris.items():
+        np.save(os.path.join(temporaire, f'index_{nom}.npy'), tableau)
+
+    ecrire_chaines(os.path.join(temporaire, 'stations'),
+                   (json.dumps(station, ensure_ascii=False, separators=(',', ':'))
+                    for station in stations))
+
+    with open(os.path.join(temporaire, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'format': FORMAT_SNAPSHOT,
+            'stations': len(stations),
+            'tris': sorted(tris),
+            'source': source,
+            'date_creation': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }, f, ensure_ascii=False, indent=2)
+
+    # Remplacement du dossier : les mmaps déjà ouverts sur l'ancien restent valides
+    ancien = dossier.rstrip('/') + '.old'
+    shutil.rmtree(ancien, ignore_errors=True)
+    if os.path.exists(dossier):
+        os.rename(dossier, ancien)
+    os.rename(temporaire, dossier)
+    shutil.rmtree(ancien, ignore_errors=True)
+    return len(stations)
+
+
+def snapshot_disponible(dossier=DOSSIER_SNAPSHOT, source='data/stations.json'):
+    """Vrai si le snapshot existe, au format actuel, et n'est pas plus ancien que le JSON source"""
+    meta = os.path.join(dossier, 'meta.json')
+    if not os.path.exists(meta):
+        return False
+    with open(meta, encoding='utf-8') as f:
+        if json.load(f).get('format') != FORMAT_SNAPSHOT:
+            return False
+    return not os.path.exists(source) or os.path.getmtime(meta) >= os.path.getmtime(source)
+
+
+def lire_source(source):
+    """Stations d'un fichier JSON (tableau) ou NDJSON (une station par ligne), compactées à la lecture
+
+    Retourne aussi la version et la date du fichier lu (voir dataset.identite_fichier).
+    """
+    with open(source, 'r', encoding='utf-8') as f:
+        identite = identite_fichier(f)
+        if source.endswith('.ndjson'):
+            return StationsCompactes(json.loads(ligne) for ligne in f if ligne.strip()), identite
+        return StationsCompactes.depuis_json(f), identite
+
+
+def preparer_snapshot(source, dossier=DOSSIER_SNAPSHOT):
+    """Reconstruit le snapshot s'il est plus ancien que la source ; retourne le nombre de stations écrites
+
+    Un seul processus reconstruit à la fois (verrou sur <dossier>.lock) : les autres workers
+    attendent puis trouvent le snapshot à jour, et ouvrent tous les mêmes fichiers en mmap
+    au lieu de relire chacun le JSON. Retourne 0 si le snapshot était déjà à jour.
+    """
+    if not os.path.exists(source):
+        return 0
+    with open(dossier.rstrip('/') + '.lock', 'w') as verrou:
+        fcntl.flock(verrou, fcntl.LOCK_EX)
+        if snapshot_disponible(dossier, source):
+            return 0
+        stations, _ = lire_source(source)
+        return ecrire_snapshot(stations, dossier, source=source)
+
+
+def ouvrir_snapshot(dossier=DOSSIER_SNAPSHOT):
+    """Ouvre un snapshot en mmap, sans JSON global ni tri à refaire : (StationStore, version et date)
+
+    meta.json est écrit à chaque construction : sa version change avec le snapshot.
+    """
+    with open(os.path.join(dossier, 'meta.json'), encoding='utf-8') as f:
+        identite = identite_fichier(f)
+        meta = json.load(f)
+    if meta['format'] != FORMAT_SNAPSHOT:
+        raise ValueError(f"Format de snapshot non supporté: {meta['format']}")
+
+    colonnes = {nom: np.load(os.path.join(dossier, nom + '.npy'), mmap_mode='r') for nom in COLONNES}
+    for nom in TABLES:
+        colonnes[nom] = list(TableChaines(os.path.join(dossier, nom)))
+    colonnes['ids'] = IndexIds(np.load(os.path.join(dossier, 'ids_tries.npy'), mmap_mode='r'),
+                               np.load(os.path.join(dossier, 'ids_positions.npy'), mmap_mode='r'))
+    tris = {nom: np.load(os.path.join(dossier, f'index_{nom}.npy'), mmap_mode='r') for nom in meta['tris']}
+
+    return StationStore(StationsMmap(os.path.join(dossier, 'stations')), colonnes, tris), identite
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convertit data/stations.json en snapshot binaire")
+    parser.add_argument('source', nargs='?', default='data/stations.json')
+    parser.add_argument('dossier', nargs='?', default=DOSSIER_SNAPSHOT)
+    args = parser.parse_args()
+
+    stations, _ = lire_source(args.source)
+    total = ecrire_snapshot(stations, args.dossier, source=args.source)
+    print(f"✅ Snapshot de {total} stations écrit dans {args.dossier}")
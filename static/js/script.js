@@ -0,0 +1,28 @@
+// Autocomplétion des villes : /api/villes est interrogé à chaque frappe,
+// la requête précédente encore en cours est annulée
+function completerVilles(champ, liste) {
+    let requete = null;
+    champ.addEventListener('input', function () {
+        const prefixe = champ.value.trim();
+        if (requete) {
+            requete.abort();
+        }
+        if (!prefixe) {
+            liste.innerHTML = '';
+            return;
+        }
+        requete = new AbortController();
+        fetch('/api/villes?prefix=' + encodeURIComponent(prefixe) + '&limit=10', { signal: requete.signal })
+            .then(reponse => reponse.json())
+            .then(donnees => {
+                liste.innerHTML = '';
+                (donnees.villes || []).forEach(ville => {
+                    const option = document.createElement('option');
+                    option.value = ville.ville;
+                    option.label = ville.stations + (ville.stations > 1 ? ' stations' : ' station');
+                    liste.appendChild(option);
+                });
+            })
+            .catch(() => {});
+    });
+}
@@ -0,0 +1,217 @@
+"""Stations gardées en mémoire sous forme compacte, redevenues des dicts à la lecture
+
+Un dict par station répète ses clés, garde les coordonnées et les dates en texte et alloue
+ses propres copies des chaînes communes (ville, département, région, services...). Ici
+chaque station est un objet à __slots__ dont les chaînes sont internées (une seule copie
+de "Île-de-France" ou de "Station de gonflage" pour toutes les stations), les coordonnées
+des float et les dates de mise à jour des secondes epoch ; les carburants sont des tuples
+(type, prix, date_maj) et les listes répétées (services, horaires) partagées.
+
+StationsCompactes se comporte comme la liste des stations : stations[i] renvoie un dict
+au format de data/stations.json, identique à la station d'origine (coordonnées en texte
+×100000 comme dans le flux, dates ISO). partielles() ne convertit que quelques champs,
+pour les parcours qui n'ont pas besoin de la station entière (colonnes du store, CSV).
+"""
+import json
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from station_store import date_en_epoch
+
+# Champs connus, dans l'ordre de data/stations.json ; les autres sont gardés dans un dict à part
+CHAMPS = ('_id', 'id_station', 'nom', 'adresse', 'ville', 'code_postal', 'departement', 'code_departement',
+          'region', 'latitude', 'longitude', 'services', 'horaires', 'ruptures', 'ouvertures',
+          'carburants', 'date_collecte')
+CHAMPS_COORDONNEES = ('latitude', 'longitude')
+CHAMPS_LISTES = ('services', 'ruptures')
+CLES_CARBURANT = {'type', 'prix', 'date_maj'}
+
+# Valeur par défaut de getattr pour un champ que la station n'a pas
+_ABSENT = object()
+
+
+# Les mêmes dates reviennent d'une station à l'autre (mises à jour groupées, copies ×N)
+@lru_cache(maxsize=65536)
+def date_iso(epoch):
+    """Date ISO UTC d'un epoch (ex: 2025-11-20T09:55:22+00:00), le format de la source"""
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+@lru_cache(maxsize=65536)
+def compacter_date(date_maj):
+    """Secondes epoch si la date ISO s'en retrouve à l'identique, sinon le texte interné"""
+    if isinstance(date_maj, str):
+        epoch = date_en_epoch(date_maj)
+        if epoch and date_iso(epoch) == date_maj:
+            return epoch
+        return sys.intern(date_maj)
+    return date_maj
+
+
+def texte_coordonnee(valeur):
+    """Texte d'une coordonnée du flux à partir de son float ("4786900", "4149182.5740818")"""
+    return str(int(valeur)) if valeur.is_integer() else repr(valeur)
+
+
+def compacter_coordonnee(valeur):
+    """Float si le texte de la source s'en retrouve à l'identique, sinon la valeur telle quelle"""
+    if isinstance(valeur, str):
+        try:
+            nombre = float(valeur)
+        except ValueError:
+            return valeur
+        if nombre == nombre and abs(nombre) != float('inf') and texte_coordonnee(nombre) == valeur:
+            return nombre
+    return valeur
+
+
+def _liste(valeur):
+    return list(valeur) if isinstance(valeur, tuple) else valeur
+
+
+def _plages(valeur):
+    return [list(plage) for plage in valeur] if isinstance(valeur, tuple) else valeur
+
+
+def _carburants(valeur):
+    if not isinstance(valeur, tuple):
+        return valeur
+    return [{'type': c[0], 'prix': c[1], 'date_maj': date_iso(c[2]) if isinstance(c[2], int) else c[2]}
+            if isinstance(c, tuple) else dict(c)
+            for c in valeur]
+
+
+# Retour au format JSON des champs stockés autrement (les autres sont rendus tels quels)
+EN_JSON = {'services': _liste, 'ruptures': _liste, 'ouvertures': _plages, 'carburants': _carburants}
+
+
+class StationCompacte:
+    """Une station : un attribut par champ connu (absent si la station n'a pas le champ)
+
+    Les coordonnées ne sont gardées en float que si la source les donnait en texte
+    (coordonnees_texte vrai) ; sinon elles restent telles quelles.
+    """
+    __slots__ = CHAMPS + ('autres', 'coordonnees_texte')
+
+
+class StationsCompactes:
+    """Liste de stations compactes : même interface que la liste des dicts (lecture, ajout, retrait)"""
+
+    def __init__(self, stations=()):
+        # Valeurs partagées entre stations : tuples (mêmes services, mêmes horaires), prix et dates
+        self._partages = {}
+        self._prix = {}
+        self._dates = {}
+        self._stations = [self.compacter(station) for station in stations]
+
+    @classmethod
+    def depuis_json(cls, fichier):
+        """Lit un tableau JSON de stations en compactant chacune dès qu'elle est décodée
+
+        Seul le texte du fichier et les stations déjà compactes sont en mémoire pendant la
+        lecture, jamais la liste complète des dicts.
+        """
+        stations = cls()
+        decodees = json.load(fichier, object_hook=lambda objet: stations.compacter(objet)
+                             if 'id_station' in objet else objet)
+        stations._stations = [station if isinstance(station, StationCompacte) else stations.compacter(station)
+                              for station in decodees]
+        return stations
+
+    def _partager(self, valeur, table=None):
+        table = self._partages if table is None else table
+        return table.setdefault(valeur, valeur)
+
+    def _compacter_carburant(self, carburant):
+        """Tuple (type, prix, date_maj) ; un carburant avec d'autres clés reste un dict"""
+        if not isinstance(carburant, dict) or carburant.keys() != CLES_CARBURANT:
+            return carburant
+        prix, date_maj = carburant['prix'], compacter_date(carburant['date_maj'])
+        return (sys.intern(carburant['type']),
+                self._partager(prix, self._prix) if isinstance(prix, float) else prix,
+                self._partager(date_maj, self._dates) if isinstance(date_maj, int) else date_maj)
+
+    def _compacter_valeur(self, nom, valeur):
+        if nom in CHAMPS_COORDONNEES:
+            # Converties ensemble par compacter()
+            return valeur
+        if isinstance(valeur, str):
+            return sys.intern(valeur)
+        if nom in CHAMPS_LISTES and isinstance(valeur, list) and all(isinstance(v, str) for v in valeur):
+            return self._partager(tuple(sys.intern(v) for v in valeur))
+        if nom == 'ouvertures' and isinstance(valeur, list):
+            return self._partager(tuple((debut, fin) for debut, fin in valeur))
+        if nom == 'carburants' and isinstance(valeur, list):
+            return tuple(self._compacter_carburant(c) for c in valeur)
+        return valeur
+
+    def compacter(self, station):
+        """StationCompacte équivalente à un dict de station"""
+        compacte = StationCompacte()
+        autres = None
+        for nom, valeur in station.items():
+            if nom in CHAMPS:
+                # Chaînes (la plupart des champs) internées sans passer par _compacter_valeur
+                if type(valeur) is str and nom not in CHAMPS_COORDONNEES:
+                    valeur = sys.intern(valeur)
+                else:
+                    valeur = self._compacter_valeur(nom, valeur)
+                setattr(compacte, nom, valeur)
+            else:
+                autres = autres or {}
+                autres[nom] = valeur
+        compacte.autres = autres
+
+        coordonnees = [compacter_coordonnee(station[nom]) if nom in station else None
+                       for nom in CHAMPS_COORDONNEES]
+        compacte.coordonnees_texte = all(isinstance(c, float) for c in coordonnees)
+        if compacte.coordonnees_texte:
+            compacte.latitude, compacte.longitude = coordonnees
+        return compacte
+
+    @staticmethod
+    def en_dict(compacte, champs=CHAMPS):
+        """Dict de station au format de data/stations.json (nouvelles listes à chaque appel)
+
+        Avec champs, seuls ces champs connus sont convertis (et pas les champs inconnus).
+        """
+        station = {}
+        for nom in champs:
+            valeur = getattr(compacte, nom, _ABSENT)
+            if valeur is not _ABSENT:
+                station[nom] = EN_JSON[nom](valeur) if nom in EN_JSON else valeur
+        if compacte.coordonnees_texte:
+            for nom in CHAMPS_COORDONNEES:
+                if nom in station:
+                    station[nom] = texte_coordonnee(station[nom])
+        if compacte.autres and champs is CHAMPS:
+            station.update(compacte.autres)
+        return station
+
+    def partielles(self, positions, champs):
+        """Stations aux positions données, réduites aux champs demandés"""
+        stations = self._stations
+        for i in positions:
+            yield self.en_dict(stations[i], champs)
+
+    def __len__(self):
+        return len(self._stations)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.en_dict(compacte) for compacte in self._stations[i]]
+        return self.en_dict(self._stations[i])
+
+    def __iter__(self):
+        for compacte in self._stations:
+            yield self.en_dict(compacte)
+
+    def __setitem__(self, i, station):
+        self._stations[i] = self.compacter(station)
+
+    def __delitem__(self, i):
+        del self._stations[i]
+
+    def append(self, station):
+        self._stations.append(self.compacter(station))
@@ -0,0 +1,106 @@
+"""Cube d'agrégats des prix : carburant × (France, région, département)"""
+import numpy as np
+
+NIVEAUX = ('national', 'region', 'departement')
+
+# Niveau en dessous de chaque niveau (pour descendre dans le détail)
+NIVEAU_ENFANT = {'national': 'region', 'region': 'departement'}
+
+
+def lignes_store(store):
+    """(code, nom du département, région, carburant, count, somme, min, max) par département
+
+    Une passe vectorisée par colonne de prix ; la région et le nom d'un département sont lus
+    sur sa première station.
+    """
+    nb_departements = len(store.departements)
+    codes, premieres = np.unique(store.dept, return_index=True)
+    noms, regions = {}, {}
+    for code, i in zip(codes, premieres):
+        station = store.stations[int(i)]
+        noms[int(code)] = station.get('departement') or ''
+        regions[int(code)] = station.get('region') or ''
+
+    for j, carburant in enumerate(store.carburants):
+        colonne = store.prix[:, j]
+        presents = ~np.isnan(colonne)
+        departements, prix = store.dept[presents], colonne[presents]
+        count = np.bincount(departements, minlength=nb_departements)
+        somme = np.bincount(departements, weights=prix, minlength=nb_departements)
+        minimum = np.full(nb_departements, np.inf)
+        maximum = np.full(nb_departements, -np.inf)
+        np.minimum.at(minimum, departements, prix)
+        np.maximum.at(maximum, departements, prix)
+        for code in np.flatnonzero(count):
+            yield (store.departements[code], noms[code], regions[code], carburant,
+                   int(count[code]), float(somme[code]), float(minimum[code]), float(maximum[code]))
+
+
+class CubePrix:
+    """Nombre, somme, minimum et maximum des prix par carburant à chaque niveau
+
+    Construit une fois par version des données à partir des agrégats par département ;
+    les régions et la France en sont la somme. Les réponses sont ensuite de simples
+    lectures de dictionnaires.
+    """
+
+    def __init__(self, lignes):
+        # (niveau, code) → {carburant: [count, somme, min, max]}
+        self.cellules = {}
+        self.noms = {('national', ''): 'France'}
+        self.enfants = {}
+        for code, nom, region, carburant, count, somme, minimum, maximum in lignes:
+            code = code or 'Inconnu'
+            region = region or 'Inconnue'
+            self.noms[('departement', code)] = nom or code
+            self.noms[('region', region)] = region
+            self.enfants.setdefault(('national', ''), set()).add(region)
+            self.enfants.setdefault(('region', region), set()).add(code)
+            for cle in (('national', ''), ('region', region), ('departement', code)):
+                agregat = self.cellules.setdefault(cle, {}).get(carburant)
+                if agregat is None:
+                    self.cellules[cle][carburant] = [count, somme, minimum, maximum]
+                else:
+                    agregat[0] += count
+                    agregat[1] += somme
+                    agregat[2] = min(agregat[2], minimum)
+                    agregat[3] = max(agregat[3], maximum)
+        self._reponses = {}
+
+    @classmethod
+    def depuis_store(cls, store):
+        return cls(lignes_store(store))
+
+    @staticmethod
+    def _formater(agregat):
+        count, somme, minimum, maximum = agregat
+        return {'count': count, 'somme': round(somme, 3), 'moyenne': round(somme / count, 4),
+                'minimum': minimum, 'maximum': maximum}
+
+    def cellule(self, niveau, code, carburant=''):
+        """Agrégats d'une cellule (d'un carburant, ou de tous par carburant) ; None si absente"""
+        agregats = self.cellules.get((niveau, code))
+        if agregats is None or (carburant and carburant not in agregats):
+            return None
+        resultat = {'niveau': niveau, 'code': code or None, 'nom': self.noms[(niveau, code)]}
+        if carburant:
+            resultat.update(self._formater(agregats[carburant]))
+        else:
+            resultat['carburants'] = {nom: self._formater(agregat) for nom, agregat in sorted(agregats.items())}
+        return resultat
+
+    def niveau(self, niveau, carburant='', parent=None):
+        """Cellules d'un niveau, éventuellement limitées aux enfants d'une région (parent)"""
+        cle = (niveau, carburant, parent)
+        if cle not in self._reponses:
+            if niveau == 'national':
+                codes = ['']
+            elif niveau == 'region':
+                codes = sorted(self.enfants.get(('national', ''), ()))
+            elif parent is not None:
+                codes = sorted(self.enfants.get(('region', parent), ()))
+            else:
+                codes = sorted(code for type_niveau, code in self.cellules if type_niveau == 'departement')
+            cellules = (self.cellule(niveau, code, carburant) for code in codes)
+            self._reponses[cle] = [c for c in cellules if c is not None]
+        return self._reponses[cle]
@@ -0,0 +1,66 @@
+"""Index spatial en grille et distances haversine vectorisées"""
+import numpy as np
+
+RAYON_TERRE_KM = 6371.0
+KM_PAR_DEGRE = 111.2
+
+# Côté d'une cellule de la grille en degrés (≈ 11 km en latitude)
+TAILLE_CELLULE = 0.1
+
+
+def haversine_km(lat, lon, latitudes, longitudes):
+    """Distances (km) entre un point et des tableaux de coordonnées en degrés"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = (np.sin((latitudes - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GrilleSpatiale:
+    """Stations regroupées par cellule de TAILLE_CELLULE degrés (coordonnées NaN ignorées)"""
+
+    def __init__(self, latitudes, longitudes, taille_cellule=TAILLE_CELLULE):
+        self.taille = taille_cellule
+        positions = np.flatnonzero(~np.isnan(latitudes) & ~np.isnan(longitudes))
+        lignes = np.floor(latitudes[positions] / self.taille).astype(np.int64)
+        colonnes = np.floor(longitudes[positions] / self.taille).astype(np.int64)
+
+        # Positions triées par cellule, puis une entrée par cellule occupée
+        ordre = np.lexsort((colonnes, lignes))
+        self.positions = positions[ordre]
+        lignes, colonnes = lignes[ordre], colonnes[ordre]
+        nouvelles = np.ones(len(ordre), dtype=bool)
+        nouvelles[1:] = (lignes[1:] != lignes[:-1]) | (colonnes[1:] != colonnes[:-1])
+        self.debuts = np.append(np.flatnonzero(nouvelles), len(ordre))
+        self.cellules_lignes = lignes[nouvelles]
+        self.cellules_colonnes = colonnes[nouvelles]
+
+    # Tableaux qui décrivent entièrement la grille (enregistrés par le snapshot)
+    TABLEAUX = ('positions', 'debuts', 'cellules_lignes', 'cellules_colonnes')
+
+    @classmethod
+    def depuis_tableaux(cls, tableaux, taille_cellule=TAILLE_CELLULE):
+        """Grille déjà construite, à partir de ses TABLEAUX (ex: ouverts en mmap)"""
+        grille = cls.__new__(cls)
+        grille.taille = taille_cellule
+        for nom in cls.TABLEAUX:
+            setattr(grille, nom, tableaux[nom])
+        return grille
+
+    def candidats(self, lat, lon, rayon_km):
+        """Positions des stations des cellules qui recouvrent le cercle (lat, lon, rayon)"""
+        delta_lat = rayon_km / KM_PAR_DEGRE
+        cos_lat = max(np.cos(np.radians(min(abs(lat) + delta_lat, 89.9))), 1e-6)
+        delta_lon = min(rayon_km / (KM_PAR_DEGRE * cos_lat), 180.0)
+
+        dans_zone = (
+            (self.cellules_lignes >= np.floor((lat - delta_lat) / self.taille))
+            & (self.cellules_lignes <= np.floor((lat + delta_lat) / self.taille))
+            & (self.cellules_colonnes >= np.floor((lon - delta_lon) / self.taille))
+            & (self.cellules_colonnes <= np.floor((lon + delta_lon) / self.taille))
+        )
+        cellules = np.flatnonzero(dans_zone)
+        if not cellules.size:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([self.positions[self.debuts[c]:self.debuts[c + 1]] for c in cellules])
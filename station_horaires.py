@@ -0,0 +1,114 @@
+"""Ruptures de carburant et horaires d'ouverture du flux, lus une fois à la collecte
+
+Le flux fournit ces deux champs sous forme de chaînes JSON :
+    rupture   [{"@nom": "E85", "@debut": "...", "@fin": "", "@type": "definitive"}, ...]
+    horaires  {"@automate-24-24": "1"|"", "jour": [{"@id": "1", "@nom": "Lundi", "@ferme": "",
+               "horaire": {"@ouverture": "06.00", "@fermeture": "22.00"} ou une liste}, ...]}
+Ils sont convertis en liste des carburants en rupture et en intervalles d'ouverture
+[debut, fin) exprimés en minutes de la semaine (lundi 00:00 = 0).
+"""
+import json
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+MINUTES_JOUR = 24 * 60
+MINUTES_SEMAINE = 7 * MINUTES_JOUR
+
+# Les horaires du flux sont à l'heure de Paris, quel que soit le fuseau du serveur
+FUSEAU_HORAIRES = ZoneInfo('Europe/Paris')
+
+
+def lire_json(valeur):
+    """Champ du flux : chaîne JSON, déjà décodé, ou vide (None)"""
+    if isinstance(valeur, str):
+        try:
+            return json.loads(valeur) if valeur.strip() else None
+        except ValueError:
+            return None
+    return valeur
+
+
+def en_liste(valeur):
+    """Un élément seul ou une liste d'éléments (le flux utilise les deux formes)"""
+    if valeur is None:
+        return []
+    return valeur if isinstance(valeur, list) else [valeur]
+
+
+def ruptures_station(rupture):
+    """Carburants en rupture en cours (sans date de fin), dans l'ordre du flux"""
+    ruptures = []
+    for element in en_liste(lire_json(rupture)):
+        if isinstance(element, dict) and element.get('@nom') and not element.get('@fin'):
+            if element['@nom'] not in ruptures:
+                ruptures.append(element['@nom'])
+    return ruptures
+
+
+def lire_heure(texte):
+    """Minutes depuis minuit d'une heure du flux ("06.00", "6:30"), None si illisible"""
+    try:
+        heures, _, minutes = str(texte).replace(':', '.').partition('.')
+        heures, minutes = int(heures), int(minutes or 0)
+    except ValueError:
+        return None
+    if not (0 <= heures <= 24 and 0 <= minutes < 60):
+        return None
+    return min(heures * 60 + minutes, MINUTES_JOUR)
+
+
+def fusionner_intervalles(intervalles):
+    """Trie et fusionne des intervalles [debut, fin) qui se chevauchent ou se touchent"""
+    fusionnes = []
+    for debut, fin in sorted(intervalles):
+        if fusionnes and debut <= fusionnes[-1][1]:
+            fusionnes[-1][1] = max(fusionnes[-1][1], fin)
+        else:
+            fusionnes.append([debut, fin])
+    return fusionnes
+
+
+def ouvertures_station(horaires):
+    """Intervalles d'ouverture de la semaine en minutes ; None si les horaires sont inconnus
+
+    Un automate 24/24 ouvre toute la semaine. Une plage qui finit avant son début déborde
+    sur le lendemain (le dimanche sur le lundi), une plage vide couvre la journée.
+    """
+    horaires = lire_json(horaires)
+    if not isinstance(horaires, dict):
+        return None
+    if str(horaires.get('@automate-24-24', '')) == '1':
+        return [[0, MINUTES_SEMAINE]]
+
+    intervalles = []
+    for jour in en_liste(horaires.get('jour')):
+        try:
+            debut_jour = (int(jour['@id']) - 1) * MINUTES_JOUR
+        except (KeyError, TypeError, ValueError):
+            continue
+        if str(jour.get('@ferme', '')) == '1' or not 0 <= debut_jour < MINUTES_SEMAINE:
+            continue
+        for plage in en_liste(jour.get('horaire')):
+            if not isinstance(plage, dict):
+                continue
+            ouverture, fermeture = lire_heure(plage.get('@ouverture')), lire_heure(plage.get('@fermeture'))
+            if ouverture is None or fermeture is None:
+                continue
+            if fermeture == ouverture:
+                ouverture, fermeture = 0, MINUTES_JOUR
+            if fermeture < ouverture:
+                fermeture += MINUTES_JOUR
+            debut, fin = debut_jour + ouverture, debut_jour + fermeture
+            if fin > MINUTES_SEMAINE:
+                intervalles.append((0, fin - MINUTES_SEMAINE))
+                fin = MINUTES_SEMAINE
+            intervalles.append((debut, fin))
+    return fusionner_intervalles(intervalles) if intervalles else None
+
+
+def minute_semaine(moment=None):
+    """Minute de la semaine (lundi 00:00 = 0) d'un instant, maintenant par défaut, heure de Paris"""
+    moment = moment or datetime.now(FUSEAU_HORAIRES)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(FUSEAU_HORAIRES)
+    return moment.weekday() * MINUTES_JOUR + moment.hour * 60 + moment.minute
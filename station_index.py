@@ -0,0 +1,195 @@
+"""Index inversés sur les colonnes du StationStore (département, carburant, prix, ville, position)"""
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+from station_geo import GrilleSpatiale
+
+TAILLE_NGRAMME = 3
+
+
+def normaliser_texte(texte):
+    """Minuscules, sans accents ni ponctuation (ex: "Saint-Étienne" → "saint etienne")"""
+    texte = unicodedata.normalize('NFKD', texte or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).lower()
+    return re.sub(r'[^0-9a-z]+', ' ', texte).strip()
+
+
+def ngrammes(texte):
+    """Ensemble des n-grammes d'un texte normalisé"""
+    return {texte[i:i + TAILLE_NGRAMME] for i in range(len(texte) - TAILLE_NGRAMME + 1)}
+
+
+def listes_par_code(codes, nb_codes):
+    """Regroupe les positions par code : retourne (positions triées par code, début de chaque code)"""
+    ordre = np.argsort(codes, kind='stable')
+    debuts = np.zeros(nb_codes + 1, dtype=np.intp)
+    np.cumsum(np.bincount(codes, minlength=nb_codes), out=debuts[1:])
+    return ordre, debuts
+
+
+class PrefixesVilles:
+    """Noms de villes normalisés et triés, pour l'autocomplétion par préfixe (bisect)
+
+    Les orthographes d'une même ville ("Saint-Étienne", "SAINT ETIENNE") sont regroupées
+    sous le nom le plus fréquent. Chaque ville est rangée sous son nom complet, et dans une
+    seconde liste sous chacun de ses mots suivants ("etienne" pour "saint etienne").
+    """
+
+    def __init__(self, villes):
+        # Nom normalisé → [nombre de stations, {orthographe: nombre de stations}]
+        regroupees = {}
+        for nom, nombre in villes:
+            cle = normaliser_texte(nom)
+            if cle and nombre:
+                entree = regroupees.setdefault(cle, [0, {}])
+                entree[0] += int(nombre)
+                entree[1][nom] = entree[1].get(nom, 0) + int(nombre)
+
+        self.noms = []
+        self.comptes = []
+        self.cles = sorted(regroupees)
+        suites = []
+        for code, cle in enumerate(self.cles):
+            total, orthographes = regroupees[cle]
+            self.noms.append(max(orthographes, key=lambda nom: (orthographes[nom], nom)))
+            self.comptes.append(total)
+            mots = cle.split(' ')
+            suites.extend((' '.join(mots[k:]), code) for k in range(1, len(mots)))
+        suites.sort()
+        self.cles_suites = [cle for cle, _ in suites]
+        self.codes_suites = [code for _, code in suites]
+
+    def completer(self, prefixe, limite=10):
+        """Villes dont le nom, puis l'un de ses mots, commence par le préfixe (ordre alphabétique)"""
+        prefixe = normaliser_texte(prefixe)
+        if not prefixe:
+            return []
+        villes, vues = [], set()
+        for cles, codes in ((self.cles, range(len(self.cles))), (self.cles_suites, self.codes_suites)):
+            # Les noms normalisés ne contiennent que [0-9a-z ] : '~' est après tous les caractères
+            debut = bisect_left(cles, prefixe)
+            fin = bisect_left(cles, prefixe + '~', debut)
+            for k in range(debut, fin):
+                code = codes[k]
+                if code not in vues:
+                    vues.add(code)
+                    villes.append({'ville': self.noms[code], 'stations': self.comptes[code]})
+                    if len(villes) == limite:
+                        return villes
+        return villes
+
+
+class StationIndex:
+    """Index construits une fois au chargement, interrogés par StationStore.rechercher()
+
+    Les tris (argsort) sont la seule partie coûteuse : calculer_tris() les regroupe en
+    tableaux NumPy, que le snapshot enregistre pour que chaque worker les ouvre en mmap
+    au lieu de les recalculer (voir snapshot.py).
+    """
+
+    def __init__(self, store, tris=None):
+        self.store = store
+        self.tris = tris if tris is not None else self.calculer_tris(store)
+
+        # Index de hachage département → positions des stations
+        self.par_departement = {}
+        ordre, debuts = self.tris['departements_ordre'], self.tris['departements_debuts']
+        for code, nom in enumerate(store.departements):
+            self.par_departement[nom] = ordre[debuts[code]:debuts[code + 1]]
+
+        # Masque de présence par carburant, et prix triés pour les recherches par fourchette
+        self.bitmaps = {}
+        self.prix_tries = {}
+        for j, type_carb in enumerate(store.carburants):
+            colonne = store.prix[:, j]
+            self.bitmaps[type_carb] = ~np.isnan(colonne)
+            positions = self.tris[f'prix_{j}']
+            self.prix_tries[type_carb] = (colonne[positions], positions)
+        self.comptes_carburant = {t: int(b.sum()) for t, b in self.bitmaps.items()}
+
+        # Carburants disponibles (proposés et pas en rupture) ; clé '' : au moins un carburant
+        self.en_stock = {'': np.zeros(len(store.stations), dtype=bool)}
+        for j, type_carb in enumerate(store.carburants):
+            en_rupture = (store.rupture >> np.uint64(j)) & np.uint64(1) == 1
+            self.en_stock[type_carb] = self.bitmaps[type_carb] & ~en_rupture
+            self.en_stock[''] |= self.en_stock[type_carb]
+        self.comptes_en_stock = {t: int(m.sum()) for t, m in self.en_stock.items()}
+
+        # Plages d'ouverture triées par début (recherche des stations ouvertes à une minute donnée)
+        self.positions_ouvertures, self.debuts_ouvertures, self.fins_ouvertures = \
+            store.ouvertures[self.tris['ouvertures_ordre']].T
+
+        # Villes : noms normalisés, positions par ville et n-grammes → codes de ville
+        self.villes_normalisees = [normaliser_texte(v) for v in store.villes]
+        self.ordre_villes, self.debuts_villes = self.tris['villes_ordre'], self.tris['villes_debuts']
+        postings = {}
+        for code, nom in enumerate(self.villes_normalisees):
+            for gramme in ngrammes(nom):
+                postings.setdefault(gramme, []).append(code)
+        self.ngrammes = {g: np.array(codes, dtype=np.int32) for g, codes in postings.items()}
+
+        # Préfixes des noms de villes (autocomplétion), avec leur nombre de stations
+        self.prefixes_villes = PrefixesVilles(zip(store.villes, np.diff(self.debuts_villes)))
+
+        # Grille spatiale pour les recherches autour d'un point
+        self.grille = GrilleSpatiale.depuis_tableaux(
+            {nom: self.tris['grille_' + nom] for nom in GrilleSpatiale.TABLEAUX})
+
+    @staticmethod
+    def calculer_tris(store):
+        """Permutations et listes de positions de l'index, par nom (tableaux NumPy uniquement)"""
+        tris = {}
+        tris['departements_ordre'], tris['departements_debuts'] = listes_par_code(store.dept,
+                                                                                  len(store.departements))
+        tris['villes_ordre'], tris['villes_debuts'] = listes_par_code(store.ville, len(store.villes))
+        # Positions des stations qui proposent le carburant j, par prix croissant
+        for j in range(len(store.carburants)):
+            colonne = store.prix[:, j]
+            positions = np.flatnonzero(~np.isnan(colonne))
+            tris[f'prix_{j}'] = positions[np.argsort(colonne[positions], kind='stable')]
+        tris['ouvertures_ordre'] = np.argsort(store.ouvertures[:, 1], kind='stable')
+        grille = GrilleSpatiale(store.latitude, store.longitude)
+        for nom in GrilleSpatiale.TABLEAUX:
+            tris['grille_' + nom] = getattr(grille, nom)
+        return tris
+
+    def codes_villes(self, ville):
+        """Codes des villes dont le nom normalisé contient le texte recherché"""
+        texte = normaliser_texte(ville)
+        grammes = ngrammes(texte)
+        if not grammes:
+            # Texte trop court pour les n-grammes : parcours des noms distincts
+            candidats = range(len(self.villes_normalisees))
+        else:
+            listes = [self.ngrammes.get(g) for g in grammes]
+            if any(liste is None for liste in listes):
+                return np.empty(0, dtype=np.int32)
+            listes.sort(key=len)
+            candidats = listes[0]
+            for liste in listes[1:]:
+                candidats = np.intersect1d(candidats, liste, assume_unique=True)
+        return np.array([c for c in candidats if texte in self.villes_normalisees[c]], dtype=np.int32)
+
+    def lignes_villes(self, codes):
+        """Positions des stations situées dans les villes données"""
+        if not len(codes):
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([self.ordre_villes[self.debuts_villes[c]:self.debuts_villes[c + 1]]
+                               for c in codes])
+
+    def ouvertes(self, minute):
+        """Positions (triées) des stations ouvertes à une minute de la semaine, horaires connus"""
+        fin = np.searchsorted(self.debuts_ouvertures, minute, side='right')
+        return np.unique(self.positions_ouvertures[:fin][self.fins_ouvertures[:fin] > minute])
+
+    def tranches_prix(self, bas, haut):
+        """Pour chaque carburant, positions des stations dont le prix est dans [bas, haut]"""
+        tranches = []
+        for prix, positions in self.prix_tries.values():
+            debut = np.searchsorted(prix, bas, side='left')
+            fin = np.searchsorted(prix, haut, side='right')
+            tranches.append(positions[debut:fin])
+        return tranches
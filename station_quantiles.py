@@ -0,0 +1,101 @@
+"""Distributions des prix (quantiles et histogrammes) en mémoire bornée, mises à jour en place"""
+import numpy as np
+
+# Les prix sont comptés au millième d'euro (précision de la source) entre 0 et PRIX_MAX ;
+# un prix au-delà est compté dans la dernière case
+PAS_PRIX = 0.001
+PRIX_MAX = 3.0
+NB_CASES = int(round(PRIX_MAX / PAS_PRIX)) + 1
+
+# Largeur des barres des histogrammes affichés (5 centimes)
+LARGEUR_HISTOGRAMME = 0.05
+CASES_PAR_BARRE = int(round(LARGEUR_HISTOGRAMME / PAS_PRIX))
+
+QUANTILES = (('p10', 0.1), ('mediane', 0.5), ('p90', 0.9))
+
+
+def case_prix(prix):
+    """Case (millième d'euro) d'un prix ou d'un tableau de prix"""
+    return np.clip(np.rint(np.asarray(prix) / PAS_PRIX), 0, NB_CASES - 1).astype(np.intp)
+
+
+class DistributionPrix:
+    """Nombre de prix par millième d'euro pour un carburant, par groupe (département)
+
+    La taille ne dépend que du nombre de groupes, pas du nombre de stations. Les comptes
+    s'additionnent : la distribution nationale est la fusion de celles des départements,
+    et deux distributions (deux workers, deux sources) se fusionnent de la même façon.
+    Un prix peut être retiré, donc un changement de prix se reporte sans rien relire.
+    Les quantiles sont exacts à la précision de la source (le millième).
+    """
+
+    def __init__(self, nb_groupes):
+        self.comptes = np.zeros((nb_groupes, NB_CASES), dtype=np.int32)
+        self._total = None
+
+    @classmethod
+    def depuis_colonne(cls, prix, groupes, nb_groupes):
+        """Construit la distribution d'une colonne de prix en une passe (NaN ignorés)"""
+        distribution = cls(nb_groupes)
+        presents = ~np.isnan(prix)
+        cles = groupes[presents].astype(np.intp) * NB_CASES + case_prix(prix[presents])
+        distribution.comptes += np.bincount(cles, minlength=nb_groupes * NB_CASES).reshape(nb_groupes, NB_CASES)
+        return distribution
+
+    def agrandir(self, nb_groupes):
+        """Ajoute les groupes apparus depuis la construction"""
+        if nb_groupes > len(self.comptes):
+            self.comptes = np.vstack([self.comptes,
+                                      np.zeros((nb_groupes - len(self.comptes), NB_CASES), dtype=np.int32)])
+
+    def ajouter(self, groupe, prix, nombre=1):
+        self.agrandir(groupe + 1)
+        self.comptes[groupe, case_prix(prix)] += nombre
+        self._total = None
+
+    def retirer(self, groupe, prix, nombre=1):
+        self.comptes[groupe, case_prix(prix)] -= nombre
+        self._total = None
+
+    def fusionner(self, autre):
+        """Ajoute les comptes d'une autre distribution (mêmes groupes)"""
+        self.agrandir(len(autre.comptes))
+        self.comptes[:len(autre.comptes)] += autre.comptes
+        self._total = None
+        return self
+
+    def comptes_groupe(self, groupe=None):
+        """Comptes par case d'un groupe, ou de tous les groupes réunis"""
+        if groupe is not None:
+            return self.comptes[groupe]
+        if self._total is None:
+            self._total = self.comptes.sum(axis=0)
+        return self._total
+
+    def resume(self, groupe=None):
+        """Nombre, moyenne, bornes, quantiles et histogramme (None si aucun prix)"""
+        comptes = self.comptes_groupe(groupe)
+        cumul = np.cumsum(comptes)
+        total = int(cumul[-1])
+        if not total:
+            return None
+        presentes = np.flatnonzero(comptes)
+        resume = {
+            'count': total,
+            'moyenne': round(float(np.dot(comptes, np.arange(NB_CASES))) * PAS_PRIX / total, 4),
+            'minimum': round(int(presentes[0]) * PAS_PRIX, 3),
+            'maximum': round(int(presentes[-1]) * PAS_PRIX, 3)
+        }
+        # Quantile q : plus petit prix dont le rang atteint q × total
+        for nom, q in QUANTILES:
+            resume[nom] = round(int(np.searchsorted(cumul, max(1, int(np.ceil(q * total))))) * PAS_PRIX, 3)
+
+        # Histogramme à barres fixes, limité aux barres entre le premier et le dernier prix
+        premiere, derniere = int(presentes[0]) // CASES_PAR_BARRE, int(presentes[-1]) // CASES_PAR_BARRE
+        barres = np.add.reduceat(comptes, np.arange(0, NB_CASES, CASES_PAR_BARRE))
+        resume['histogramme'] = {
+            'debut': round(premiere * LARGEUR_HISTOGRAMME, 2),
+            'largeur': LARGEUR_HISTOGRAMME,
+            'comptes': [int(c) for c in barres[premiere:derniere + 1]]
+        }
+        return resume
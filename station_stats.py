@@ -0,0 +1,142 @@
+"""Agrégats précalculés (par carburant et par département), maintenus à chaque modification"""
+import numpy as np
+
+from station_quantiles import DistributionPrix
+
+
+class StationStats:
+    """Compteurs, sommes, minima et maxima calculés une fois par version des données
+
+    Les ajouts, retraits et changements de prix les mettent à jour en place ; seuls un
+    minimum ou un maximum retiré obligent à relire la colonne du carburant concerné.
+    Les résultats des pages sont mis en cache jusqu'à la prochaine modification.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        prix = store.prix
+        self.count = [int(c) for c in (~np.isnan(prix)).sum(axis=0)]
+        self.somme = [float(s) for s in np.nansum(prix, axis=0)]
+        self.minimum = [float(m) for m in np.fmin.reduce(prix, axis=0, initial=np.inf)]
+        self.maximum = [float(m) for m in np.fmax.reduce(prix, axis=0, initial=-np.inf)]
+        self.comptes_departements = [int(c) for c in
+                                     np.bincount(store.dept, minlength=len(store.departements))]
+        # Distribution des prix de chaque carburant par département (quantiles, histogrammes)
+        self.distributions = [DistributionPrix.depuis_colonne(prix[:, j], store.dept, len(store.departements))
+                              for j in range(prix.shape[1])]
+        self.a_recalculer = set()
+        self._cache = {}
+
+    def _ajuster_tailles(self):
+        """Étend les compteurs aux carburants et départements apparus depuis la construction"""
+        for _ in range(len(self.store.carburants) - len(self.count)):
+            self.count.append(0)
+            self.somme.append(0.0)
+            self.minimum.append(np.inf)
+            self.maximum.append(-np.inf)
+            self.distributions.append(DistributionPrix(len(self.store.departements)))
+        self.comptes_departements.extend(
+            [0] * (len(self.store.departements) - len(self.comptes_departements)))
+        for distribution in self.distributions:
+            distribution.agrandir(len(self.store.departements))
+
+    def _ajouter_prix(self, i, j, prix):
+        self.distributions[j].ajouter(self.store.dept[i], prix)
+        self.count[j] += 1
+        self.somme[j] += prix
+        self.minimum[j] = min(self.minimum[j], prix)
+        self.maximum[j] = max(self.maximum[j], prix)
+
+    def _retirer_prix(self, i, j, prix):
+        self.distributions[j].retirer(self.store.dept[i], prix)
+        self.count[j] -= 1
+        self.somme[j] -= prix
+        if prix <= self.minimum[j] or prix >= self.maximum[j]:
+            self.a_recalculer.add(j)
+
+    def ajouter(self, i):
+        """Prend en compte la station ajoutée à la position i"""
+        self._ajuster_tailles()
+        for j, prix in enumerate(self.store.prix[i]):
+            if not np.isnan(prix):
+                self._ajouter_prix(i, j, float(prix))
+        self.comptes_departements[self.store.dept[i]] += 1
+        self._cache.clear()
+
+    def retirer(self, i):
+        """Retire la station à la position i (appelé avant sa suppression des colonnes)"""
+        for j, prix in enumerate(self.store.prix[i]):
+            if not np.isnan(prix):
+                self._retirer_prix(i, j, float(prix))
+        self.comptes_departements[self.store.dept[i]] -= 1
+        self._cache.clear()
+
+    def modifier_prix(self, i, j, ancien, nouveau):
+        """Remplace un prix de la station i (ancien NaN si le carburant en était absent)"""
+        self._ajuster_tailles()
+        if not np.isnan(ancien):
+            self._retirer_prix(i, j, float(ancien))
+        self._ajouter_prix(i, j, float(nouveau))
+        self._cache.clear()
+
+    def _recalculer_bornes(self):
+        """Relit les colonnes dont le minimum ou le maximum a été retiré"""
+        for j in self.a_recalculer:
+            colonne = self.store.prix[:, j]
+            self.minimum[j] = float(np.fmin.reduce(colonne, initial=np.inf))
+            self.maximum[j] = float(np.fmax.reduce(colonne, initial=-np.inf))
+        self.a_recalculer.clear()
+
+    def accueil(self):
+        """Statistiques de la page d'accueil"""
+        if 'accueil' not in self._cache:
+            departements = self.store.departements
+            j = self.store.index_carburant.get('Gazole')
+            gazole = j is not None and self.count[j] > 0
+            self._cache['accueil'] = {
+                'total_stations': len(self.store),
+                'total_departments': sum(1 for code, count in enumerate(self.comptes_departements)
+                                         if count and departements[code]),
+                'avg_price_gazole': self.somme[j] / self.count[j] if gazole else 0
+            }
+        return self._cache['accueil']
+
+    def prix(self):
+        """Moyenne, minimum, maximum et nombre de prix par carburant"""
+        if 'prix' not in self._cache:
+            self._recalculer_bornes()
+            self._cache['prix'] = [{
+                '_id': type_carb,
+                'moyenne': self.somme[j] / self.count[j],
+                'minimum': self.minimum[j],
+                'maximum': self.maximum[j],
+                'count': self.count[j]
+            } for j, type_carb in enumerate(self.store.carburants) if self.count[j]]
+        return self._cache['prix']
+
+    def top_departements(self, limite=10):
+        """Départements ayant le plus de stations (ordre d'apparition en cas d'égalité)"""
+        cle = ('top_departements', limite)
+        if cle not in self._cache:
+            departements = self.store.departements
+            ordre = sorted(range(len(self.comptes_departements)),
+                           key=lambda code: -self.comptes_departements[code])[:limite]
+            self._cache[cle] = [{'count': self.comptes_departements[code],
+                                 '_id': departements[code] or 'Inconnu'}
+                                for code in ordre if self.comptes_departements[code]]
+        return self._cache[cle]
+
+    def distributions_prix(self, departement=None):
+        """Quantiles et histogramme des prix par carburant, en France ou dans un département"""
+        groupe = None
+        if departement is not None:
+            # Code inconnu : rien à mettre en cache (n'importe quelle chaîne peut arriver ici)
+            groupe = self.store.index_departement.get(departement)
+            if groupe is None:
+                return []
+        cle = ('distributions', departement)
+        if cle not in self._cache:
+            resumes = [(type_carb, self.distributions[j].resume(groupe))
+                       for j, type_carb in enumerate(self.store.carburants)]
+            self._cache[cle] = [dict(resume, _id=type_carb) for type_carb, resume in resumes if resume]
+        return self._cache[cle]
@@ -0,0 +1,490 @@
+"""Stockage colonnaire des stations (tableaux NumPy) pour la recherche et les statistiques"""
+from collections.abc import Mapping
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from station_cube import CubePrix
+from station_geo import haversine_km
+from station_index import StationIndex
+from station_stats import StationStats
+
+# Tables de chaînes et colonnes NumPy qui décrivent entièrement le store
+TABLES = ('carburants', 'departements', 'villes')
+# Champs des stations lus pour construire les colonnes
+CHAMPS_COLONNES = ('id_station', 'ville', 'code_departement', 'latitude', 'longitude', 'ruptures',
+                   'ouvertures', 'carburants')
+COLONNES = ('prix', 'date_maj', 'dept', 'ville', 'latitude', 'longitude', 'rupture', 'ouvertures')
+
+# Tris proposés pour les résultats de recherche
+TRIS = ('prix', 'date', 'distance')
+
+# Les coordonnées de la source sont exprimées en degrés × 100000 (ex: "4786900" → 47.869)
+ECHELLE_COORDONNEES = 100000
+
+
+def normaliser_coordonnee(valeur):
+    """Convertit une latitude/longitude de la source en degrés décimaux"""
+    try:
+        valeur = float(valeur)
+    except (TypeError, ValueError):
+        return np.nan
+    if abs(valeur) > 180:
+        valeur /= ECHELLE_COORDONNEES
+    return valeur
+
+
+# Les mêmes dates reviennent d'une station à l'autre (mises à jour groupées)
+@lru_cache(maxsize=65536)
+def date_en_epoch(date_maj):
+    """Convertit une date ISO (ex: 2025-11-20T09:55:22+00:00) en secondes epoch, 0 si invalide"""
+    if not date_maj:
+        return 0
+    try:
+        return int(datetime.fromisoformat(str(date_maj)).timestamp())
+    except ValueError:
+        return 0
+
+
+class IndexIds(Mapping):
+    """id_station → position en lecture seule, sur des id triés (recherche dichotomique)
+
+    Remplace le dict des positions pour un store ouvert sur un snapshot : les tableaux
+    sont ouverts en mmap et partagés entre les workers au lieu d'un dict par processus.
+    Les id sont tous des entiers ou tous des chaînes, comme dans le snapshot.
+    """
+
+    def __init__(self, ids_tries, positions):
+        self.ids_tries = ids_tries
+        self.positions = positions
+        self._type = str if ids_tries.dtype.kind == 'U' else (int, np.integer)
+
+    @classmethod
+    def depuis_ids(cls, ids):
+        """Index des id_station donnés dans l'ordre des positions (entiers, sinon en texte)"""
+        if all(isinstance(id_station, int) for id_station in ids):
+            tableau = np.array(ids, dtype=np.int64)
+        else:
+            tableau = np.array([str(id_station) for id_station in ids], dtype=str)
+        positions = np.argsort(tableau, kind='stable')
+        return cls(tableau[positions], positions)
+
+    def __getitem__(self, id_station):
+        if isinstance(id_station, self._type) and not isinstance(id_station, bool):
+            k = int(np.searchsorted(self.ids_tries, id_station))
+            if k < len(self.ids_tries) and self.ids_tries[k] == id_station:
+                return int(self.positions[k])
+        raise KeyError(id_station)
+
+    def __iter__(self):
+        return iter(self.ids_tries.tolist())
+
+    def items(self):
+        return zip(self.ids_tries.tolist(), self.positions.tolist())
+
+    def __len__(self):
+        return len(self.ids_tries)
+
+
+class StationStore:
+    """Colonnes NumPy construites une fois au chargement à partir de la liste des stations"""
+
+    def __init__(self, stations, colonnes=None, tris=None):
+        self.stations = stations
+        if colonnes is not None:
+            self._reprendre_colonnes(colonnes)
+        else:
+            self._construire_colonnes(stations)
+
+        # Index inversés et agrégats construits avec les colonnes ; tris : ceux de l'index
+        # déjà calculés (snapshot), valables seulement pour ces colonnes
+        self._index = StationIndex(self, tris)
+        self.stats = StationStats(self)
+        self._cube = CubePrix.depuis_store(self)
+
+        # Incrémenté à chaque modification en place (invalide les résultats mis en cache)
+        self.generation = 0
+
+    def _construire_colonnes(self, stations):
+        """Construit les colonnes en une passe sur les dicts des stations"""
+        n = len(stations)
+        stations = list(self.partielles(range(n), CHAMPS_COLONNES))
+
+        # Types de carburant dans l'ordre de première apparition
+        self.carburants = []
+        self.index_carburant = {}
+        for station in stations:
+            self._enregistrer_carburants(station)
+
+        # Prix et dates de mise à jour : une colonne par carburant (NaN / 0 si absent)
+        self.prix = np.full((n, len(self.carburants)), np.nan)
+        self.date_maj = np.zeros((n, len(self.carburants)), dtype=np.int64)
+
+        # Départements codés en entiers (table des codes dans l'ordre d'apparition)
+        self.departements = []
+        self.index_departement = {}
+        self.dept = np.empty(n, dtype=np.int32)
+
+        # Villes codées de la même façon
+        self.villes = []
+        self.index_ville = {}
+        self.ville = np.empty(n, dtype=np.int32)
+
+        self.latitude = np.empty(n)
+        self.longitude = np.empty(n)
+
+        # Carburants en rupture : bit j levé si le carburant j est en rupture (64 carburants au plus)
+        self.rupture = np.zeros(n, dtype=np.uint64)
+
+        # Index id_station → position dans les colonnes
+        self.offsets = {}
+
+        # Plages d'ouverture : une ligne (position, début, fin) par intervalle, en minutes de la semaine
+        plages = []
+        for i, station in enumerate(stations):
+            self._remplir_ligne(i, station)
+            plages.extend((i, debut, fin) for debut, fin in station.get('ouvertures') or ())
+        self.ouvertures = np.array(plages, dtype=np.int32).reshape(-1, 3)
+
+    def _reprendre_colonnes(self, colonnes):
+        """Reprend des colonnes déjà construites (ex: snapshot binaire ouvert en mmap)"""
+        for nom in TABLES + COLONNES:
+            setattr(self, nom, colonnes[nom])
+        self.index_carburant = {nom: j for j, nom in enumerate(self.carburants)}
+        self.index_departement = {nom: j for j, nom in enumerate(self.departements)}
+        self.index_ville = {nom: j for j, nom in enumerate(self.villes)}
+        if isinstance(colonnes['ids'], IndexIds):
+            self.offsets = colonnes['ids']
+        else:
+            self.offsets = {id_station: i for i, id_station in enumerate(colonnes['ids'])}
+
+    def colonnes(self):
+        """Tables et colonnes du store, avec les id_station dans l'ordre des positions"""
+        colonnes = {nom: getattr(self, nom) for nom in TABLES + COLONNES}
+        colonnes['ids'] = [None] * len(self)
+        for id_station, i in self.offsets.items():
+            colonnes['ids'][i] = id_station
+        return colonnes
+
+    def _enregistrer_carburants(self, station):
+        """Ajoute à la table les types de carburant encore inconnus de la station"""
+        nouveaux = 0
+        for carburant in station.get('carburants', []):
+            if carburant['type'] not in self.index_carburant:
+                self.index_carburant[carburant['type']] = len(self.carburants)
+                self.carburants.append(carburant['type'])
+                nouveaux += 1
+        return nouveaux
+
+    def _coder(self, table, index, valeur):
+        """Code entier d'une valeur dans une table de chaînes (ajoutée si absente)"""
+        if valeur not in index:
+            index[valeur] = len(table)
+            table.append(valeur)
+        return index[valeur]
+
+    def _remplir_ligne(self, i, station):
+        """Écrit une station à la position i des colonnes"""
+        self.offsets[station.get('id_station')] = i
+        self.dept[i] = self._coder(self.departements, self.index_departement,
+                                   station.get('code_departement', ''))
+        self.ville[i] = self._coder(self.villes, self.index_ville, station.get('ville', ''))
+        self.latitude[i] = normaliser_coordonnee(station.get('latitude'))
+        self.longitude[i] = normaliser_coordonnee(station.get('longitude'))
+        for carburant in station.get('carburants', []):
+            j = self.index_carburant[carburant['type']]
+            self.prix[i, j] = carburant['prix']
+            self.date_maj[i, j] = date_en_epoch(carburant.get('date_maj'))
+        for type_carb in station.get('ruptures') or ():
+            j = self.index_carburant.get(type_carb)
+            if j is not None:
+                self.rupture[i] |= np.uint64(1) << np.uint64(j)
+
+    @staticmethod
+    def _lignes_ouvertures(stations):
+        """Lignes (position, début, fin) des plages d'ouverture de stations (position, dict)"""
+        return np.array([[i, debut, fin] for i, station in stations
+                         for debut, fin in station.get('ouvertures') or ()], dtype=np.int32).reshape(-1, 3)
+
+    def _elargir_colonnes_prix(self, nouveaux):
+        """Ajoute des colonnes vides pour de nouveaux types de carburant"""
+        n = len(self.stations)
+        self.prix = np.hstack([self.prix, np.full((n, nouveaux), np.nan)])
+        self.date_maj = np.hstack([self.date_maj, np.zeros((n, nouveaux), dtype=np.int64)])
+
+    @property
+    def index(self):
+        """Index inversés, reconstruits à la première recherche après une modification"""
+        if self._index is None:
+            self._index = StationIndex(self)
+        return self._index
+
+    @property
+    def cube(self):
+        """Cube carburant × région × département, reconstruit après une modification"""
+        if self._cube is None:
+            self._cube = CubePrix.depuis_store(self)
+        return self._cube
+
+    def __len__(self):
+        return len(self.stations)
+
+    def position(self, id_station):
+        """Position d'une station à partir de son id (les ids lus dans une URL sont des chaînes)"""
+        if id_station in self.offsets:
+            return self.offsets[id_station]
+        return self.offsets[int(id_station)]
+
+    @property
+    def lecture_seule(self):
+        """Vrai pour un store ouvert sur un snapshot en mmap (colonnes et stations non modifiables)"""
+        return not self.prix.flags.writeable or not hasattr(self.stations, 'append')
+
+    def _verifier_modifiable(self):
+        """Refuse une modification avant qu'elle ne touche la moindre colonne"""
+        if self.lecture_seule:
+            raise RuntimeError("Store en lecture seule (snapshot mmap) : modification impossible")
+
+    def ajouter_station(self, station):
+        """Ajoute une station : colonnes étendues et agrégats mis à jour en place"""
+        self._verifier_modifiable()
+        nouveaux = self._enregistrer_carburants(station)
+        if nouveaux:
+            self._elargir_colonnes_prix(nouveaux)
+
+        i = len(self.stations)
+        self.prix = np.vstack([self.prix, np.full((1, len(self.carburants)), np.nan)])
+        self.date_maj = np.vstack([self.date_maj, np.zeros((1, len(self.carburants)), dtype=np.int64)])
+        self.dept = np.append(self.dept, np.int32(0))
+        self.ville = np.append(self.ville, np.int32(0))
+        self.latitude = np.append(self.latitude, np.nan)
+        self.longitude = np.append(self.longitude, np.nan)
+        self.rupture = np.append(self.rupture, np.uint64(0))
+        self.ouvertures = np.vstack([self.ouvertures, self._lignes_ouvertures([(i, station)])])
+
+        self.stations.append(station)
+        self._remplir_ligne(i, station)
+        self._index = None
+        self._cube = None
+        self.generation += 1
+        self.stats.ajouter(i)
+
+    def retirer_station(self, id_station):
+        """Retire une station : agrégats décrémentés puis lignes supprimées des colonnes"""
+        self._verifier_modifiable()
+        i = self.offsets[id_station]
+        self.stats.retirer(i)
+
+        self.prix = np.delete(self.prix, i, axis=0)
+        self.date_maj = np.delete(self.date_maj, i, axis=0)
+        self.dept = np.delete(self.dept, i)
+        self.ville = np.delete(self.ville, i)
+        self.latitude = np.delete(self.latitude, i)
+        self.longitude = np.delete(self.longitude, i)
+        self.rupture = np.delete(self.rupture, i)
+        ouvertures = self.ouvertures[self.ouvertures[:, 0] != i]
+        ouvertures[ouvertures[:, 0] > i, 0] -= 1
+        self.ouvertures = ouvertures
+
+        del self.stations[i]
+        del self.offsets[id_station]
+        for position, station in enumerate(self.partielles(range(i, len(self.stations)), ('id_station',)), start=i):
+            self.offsets[station.get('id_station')] = position
+        self._index = None
+        self._cube = None
+        self.generation += 1
+
+    def modifier_prix(self, id_station, type_carb, prix, date_maj=None):
+        """Met à jour le prix d'un carburant d'une station (colonnes, dict et agrégats)"""
+        self._verifier_modifiable()
+        i = self.offsets[id_station]
+        if type_carb not in self.index_carburant:
+            self._elargir_colonnes_prix(self._enregistrer_carburants({'carburants': [{'type': type_carb}]}))
+        j = self.index_carburant[type_carb]
+
+        ancien = self.prix[i, j]
+        self.prix[i, j] = prix
+        self.date_maj[i, j] = date_en_epoch(date_maj)
+
+        station = self.stations[i]
+        for carburant in station.setdefault('carburants', []):
+            if carburant['type'] == type_carb:
+                carburant['prix'] = prix
+                carburant['date_maj'] = date_maj
+                break
+        else:
+            station['carburants'].append({'type': type_carb, 'prix': prix, 'date_maj': date_maj})
+        # Réécrite pour les listes de stations qui renvoient des copies (voir station_compacte.py)
+        self.stations[i] = station
+
+        self._index = None
+        self._cube = None
+        self.generation += 1
+        self.stats.modifier_prix(i, j, ancien, prix)
+
+    def rechercher(self, ville='', carburant='', departement='', prix_min=None, prix_max=None,
+                   en_stock=False, ouvert=None):
+        """Retourne les positions (triées) des stations qui correspondent à tous les filtres
+
+        Chaque filtre fournit sa taille estimée, ses positions et un test sur des positions
+        candidates : on part du plus sélectif puis on filtre ses positions avec les autres.
+        en_stock : carburant choisi (ou l'un des carburants) proposé et pas en rupture ;
+        ouvert : minute de la semaine à laquelle la station doit être ouverte.
+        """
+        filtres = []
+        vide = np.empty(0, dtype=np.intp)
+
+        if departement:
+            if departement not in self.index_departement:
+                return vide
+            code = self.index_departement[departement]
+            lignes = self.index.par_departement[departement]
+            filtres.append((lignes.size, lambda: lignes,
+                            lambda p: self.dept[p] == code))
+
+        if carburant:
+            if carburant not in self.index_carburant:
+                return vide
+            bitmap = self.index.bitmaps[carburant]
+            filtres.append((self.index.comptes_carburant[carburant], lambda: np.flatnonzero(bitmap),
+                            lambda p: bitmap[p]))
+
+        if en_stock:
+            disponibles = self.index.en_stock[carburant]
+            filtres.append((self.index.comptes_en_stock[carburant], lambda: np.flatnonzero(disponibles),
+                            lambda p: disponibles[p]))
+
+        if ouvert is not None:
+            ouvertes = self.index.ouvertes(ouvert)
+            masque_ouvertes = np.zeros(len(self), dtype=bool)
+            masque_ouvertes[ouvertes] = True
+            filtres.append((ouvertes.size, lambda: ouvertes, lambda p: masque_ouvertes[p]))
+
+        # Au moins un carburant de la station dans la fourchette de prix
+        if prix_min is not None or prix_max is not None:
+            bas = prix_min if prix_min is not None else 0
+            haut = prix_max if prix_max is not None else np.inf
+            tranches = self.index.tranches_prix(bas, haut)
+            filtres.append((sum(t.size for t in tranches),
+                            lambda: np.unique(np.concatenate(tranches)) if tranches else vide,
+                            lambda p: ((self.prix[p] >= bas) & (self.prix[p] <= haut)).any(axis=1)))
+
+        if ville:
+            codes = self.index.codes_villes(ville)
+            villes_retenues = np.zeros(len(self.villes), dtype=bool)
+            villes_retenues[codes] = True
+            taille = int(sum(self.index.debuts_villes[c + 1] - self.index.debuts_villes[c] for c in codes))
+            filtres.append((taille, lambda: self.index.lignes_villes(codes),
+                            lambda p: villes_retenues[self.ville[p]]))
+
+        if not filtres:
+            return np.arange(len(self))
+
+        filtres.sort(key=lambda f: f[0])
+        positions = np.sort(filtres[0][1]())
+        for _, _, garder in filtres[1:]:
+            if not positions.size:
+                break
+            positions = positions[garder(positions)]
+        return positions
+
+    def proches(self, lat, lon, rayon_km, carburant='', k=10, tri=''):
+        """Les k stations les moins chères (tri='prix') ou les plus proches dans un rayon
+
+        Retourne (positions, distances en km). Sans carburant, le tri se fait par distance.
+        """
+        vide = (np.empty(0, dtype=np.intp), np.empty(0))
+        positions = self.index.grille.candidats(lat, lon, rayon_km)
+        if carburant:
+            if carburant not in self.index_carburant:
+                return vide
+            positions = positions[self.index.bitmaps[carburant][positions]]
+
+        distances = haversine_km(lat, lon, self.latitude[positions], self.longitude[positions])
+        dans_rayon = distances <= rayon_km
+        positions, distances = positions[dans_rayon], distances[dans_rayon]
+
+        if tri == 'prix' and carburant:
+            cles = self.prix[positions, self.index_carburant[carburant]]
+        else:
+            cles = distances
+
+        # Sélection partielle des k meilleurs, puis tri de ces k seulement ; les ex æquo avec
+        # le k-ième sont gardés pour être départagés par distance
+        if k < positions.size:
+            seuil = np.partition(cles, k - 1)[k - 1]
+            gardees = np.flatnonzero(cles <= seuil)
+            positions, distances, cles = positions[gardees], distances[gardees], cles[gardees]
+        ordre = np.lexsort((distances, cles))[:k]
+        return positions[ordre], distances[ordre]
+
+    def cles_tri(self, positions, tri, carburant='', lat=None, lon=None):
+        """Clé de tri croissante par position (inf quand la station n'a pas la donnée)
+
+        prix : prix du carburant choisi (le moins cher de la station sans carburant),
+        date : mise à jour la plus récente d'abord, distance : depuis (lat, lon).
+        """
+        j = self.index_carburant.get(carburant) if carburant else None
+        if tri == 'prix':
+            prix = self.prix[positions, j] if j is not None else self.prix[positions]
+            cles = np.where(np.isnan(prix), np.inf, prix)
+            return cles if j is not None else cles.min(axis=1, initial=np.inf)
+        if tri == 'date':
+            dates = self.date_maj[positions, j] if j is not None else self.date_maj[positions].max(axis=1, initial=0)
+            return np.where(dates > 0, -dates.astype(np.float64), np.inf)
+        if tri == 'distance':
+            distances = haversine_km(lat, lon, self.latitude[positions], self.longitude[positions])
+            return np.where(np.isnan(distances), np.inf, distances)
+        raise ValueError(f"Tri inconnu: {tri}")
+
+    def trier(self, positions, tri='', carburant='', lat=None, lon=None, debut=0, nombre=None):
+        """Positions de la page [debut, debut + nombre) des résultats triés
+
+        Seuls les debut + nombre premiers sont sélectionnés (np.partition) puis triés ; les
+        ex æquo sont départagés par position, donc les pages successives se suivent exactement.
+        """
+        positions = np.asarray(positions)
+        fin = positions.size if nombre is None else min(positions.size, debut + nombre)
+        if debut >= fin:
+            return positions[:0]
+        if not tri:
+            return positions[debut:fin]
+
+        cles = self.cles_tri(positions, tri, carburant, lat, lon)
+        if fin < positions.size:
+            # Toutes les stations à égalité avec la fin-ième sont gardées pour le départage
+            seuil = np.partition(cles, fin - 1)[fin - 1]
+            gardees = np.flatnonzero(cles <= seuil)
+            positions, cles = positions[gardees], cles[gardees]
+        ordre = np.lexsort((positions, cles))
+        return positions[ordre[debut:fin]]
+
+    def partielles(self, positions, champs):
+        """Stations aux positions données, réduites aux champs demandés si la liste le permet
+
+        StationsCompactes ne convertit alors que ces champs ; sinon les stations sont entières.
+        """
+        if hasattr(self.stations, 'partielles'):
+            return self.stations.partielles(positions, champs)
+        return (self.stations[i] for i in positions)
+
+    def stations_aux_positions(self, positions):
+        """Retourne les stations (dicts) correspondant à des positions"""
+        return [self.stations[i] for i in positions]
+
+    def stats_accueil(self):
+        """Calcule les statistiques pour la page d'accueil"""
+        return self.stats.accueil()
+
+    def stats_prix(self):
+        """Moyenne, minimum, maximum et nombre de prix par carburant"""
+        return self.stats.prix()
+
+    def top_departements(self, limite=10):
+        """Départements ayant le plus de stations (ordre d'apparition en cas d'égalité)"""
+        return self.stats.top_departements(limite)
+
+    def distributions_prix(self, departement=None):
+        """Quantiles (p10, médiane, p90) et histogramme des prix par carburant"""
+        return self.stats.distributions_prix(departement)
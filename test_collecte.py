@@ -0,0 +1,219 @@
+"""Tests de la collecte sur un export enregistré du flux (data/flux_enregistre.json)
+
+    python -m unittest test_collecte
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from collecte_donnees import DestinationJSON, DestinationMongo, collecte_finale, iterer_tableau_json, par_lots
+from station_horaires import ouvertures_station
+
+# 5 stations du flux : 3 utilisables, une sans ville ("N/A") et une sans aucun prix
+FLUX_ENREGISTRE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'flux_enregistre.json')
+
+
+def lire_flux():
+    with open(FLUX_ENREGISTRE, 'rb') as f:
+        return f.read()
+
+
+def en_morceaux(contenu, taille):
+    return [contenu[i:i + taille] for i in range(0, len(contenu), taille)]
+
+
+class ServeurFichiers(SimpleHTTPRequestHandler):
+    """Sert le dossier de l'export enregistré, sans journaliser les requêtes"""
+
+    def log_message(self, *args):
+        pass
+
+
+class DestinationMemoire:
+    """Garde les lots reçus, pour vérifier le découpage et l'appel à terminer()"""
+
+    def __init__(self):
+        self.lots = []
+        self.complet = None
+        self.abandonnee = False
+
+    def demarrer(self):
+        pass
+
+    def ecrire(self, lot):
+        self.lots.append(list(lot))
+
+    def terminer(self, complet=True):
+        self.complet = complet
+
+    def abandonner(self):
+        self.abandonnee = True
+
+
+class DestinationEnPanne(DestinationMemoire):
+    """Échoue au lot numéro `echec` (après avoir reçu les précédents)"""
+
+    def __init__(self, echec):
+        super().__init__()
+        self.echec = echec
+
+    def ecrire(self, lot):
+        if len(self.lots) == self.echec:
+            raise IOError("disque plein")
+        super().ecrire(lot)
+
+
+class TestItererTableauJson(unittest.TestCase):
+
+    def test_memes_stations_quelle_que_soit_la_taille_des_morceaux(self):
+        contenu = lire_flux()
+        attendu = json.loads(contenu)
+        # Morceaux de 1 et 7 octets : les caractères accentués sont coupés au milieu
+        for taille in (1, 7, 4096, len(contenu)):
+            with self.subTest(taille=taille):
+                self.assertEqual(list(iterer_tableau_json(en_morceaux(contenu, taille))), attendu)
+
+    def test_tableau_vide_et_espaces(self):
+        self.assertEqual(list(iterer_tableau_json([b'  \n', b'[', b' ]'])), [])
+        self.assertEqual(list(iterer_tableau_json([b'[1, ', b'{"a": 2}', b']'])), [1, {'a': 2}])
+
+    def test_flux_invalide(self):
+        with self.assertRaises(ValueError):
+            list(iterer_tableau_json([b'{"a": 1}']))
+        with self.assertRaises(ValueError):
+            list(iterer_tableau_json(en_morceaux(lire_flux()[:-200], 1000)))
+
+
+class TestOuverturesStation(unittest.TestCase):
+
+    def test_plages_invalides_ignorees(self):
+        horaires = {'jour': [{'@id': '1', 'horaire': ['07.00-20.00', None, {'@ouverture': '07.00', '@fermeture': '20.00'}]},
+                             'mardi', {'@id': '3', 'horaire': 42}]}
+        self.assertEqual(ouvertures_station(horaires), [[420, 1200]])
+        self.assertIsNone(ouvertures_station({'jour': ['lundi', None]}))
+
+
+class TestEcritureParLots(unittest.TestCase):
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier)
+
+    def test_par_lots(self):
+        self.assertEqual(list(par_lots(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(par_lots([], 2)), [])
+
+    def test_destination_json_remplace_le_fichier_une_fois_complet(self):
+        chemin = os.path.join(self.dossier, 'stations.json')
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump([{'id_station': 0}], f)
+
+        stations = [{'id_station': i, 'ville': 'Mâcon'} for i in range(1, 6)]
+        destination = DestinationJSON(chemin)
+        with redirect_stdout(io.StringIO()):
+            destination.demarrer()
+            for lot in par_lots(stations, 2):
+                destination.ecrire(lot)
+                # L'ancien fichier reste lisible tant que l'écriture n'est pas terminée
+                with open(chemin, encoding='utf-8') as f:
+                    self.assertEqual(json.load(f), [{'id_station': 0}])
+            destination.terminer()
+
+        with open(chemin, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), stations)
+        self.assertFalse(os.path.exists(chemin + '.tmp'))
+
+
+class TestCollecteFinale(unittest.TestCase):
+    """collecte_finale lit l'export enregistré servi par un serveur HTTP local"""
+
+    @classmethod
+    def setUpClass(cls):
+        gestionnaire = partial(ServeurFichiers, directory=os.path.dirname(FLUX_ENREGISTRE))
+        cls.serveur = ThreadingHTTPServer(('127.0.0.1', 0), gestionnaire)
+        threading.Thread(target=cls.serveur.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.serveur.server_address[1]}/{os.path.basename(FLUX_ENREGISTRE)}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.serveur.shutdown()
+        cls.serveur.server_close()
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier)
+
+    def collecter(self, destinations, **options):
+        with redirect_stdout(io.StringIO()):
+            collecte_finale(self.url, destinations, **options)
+
+    def test_destination_json(self):
+        chemin = os.path.join(self.dossier, 'stations.json')
+        lots = DestinationMemoire()
+        self.collecter([DestinationJSON(chemin), lots], taille_lot=2)
+
+        with open(chemin, encoding='utf-8') as f:
+            stations = json.load(f)
+        self.assertEqual([s['id_station'] for s in stations], [71570003, 75015001, 13008002])
+        self.assertEqual([len(lot) for lot in lots.lots], [2, 1])
+        self.assertEqual(stations, [s for lot in lots.lots for s in lot])
+        self.assertTrue(lots.complet)
+
+        macon, paris, marseille = stations
+        self.assertEqual(macon['ville'], 'La Chapelle-de-Guinchay')
+        self.assertEqual(macon['latitude'], '4621000')
+        self.assertEqual([(c['type'], c['prix']) for c in macon['carburants']],
+                         [('Gazole', 1.729), ('SP95', 1.809), ('SP98', 1.839)])
+        self.assertEqual(macon['ruptures'], ['E85', 'GPLc', 'E10'])
+        self.assertIsNone(macon['ouvertures'])
+        # SP95 en rupture temporaire, dimanche fermé, ouvert de 07:00 à 20:30 les autres jours
+        self.assertEqual([c['type'] for c in paris['carburants']], ['Gazole', 'SP98', 'E10'])
+        self.assertEqual(paris['ruptures'], ['SP95'])
+        self.assertEqual(paris['ouvertures'], [[j * 1440 + 420, j * 1440 + 1230] for j in range(6)])
+        # Automate 24/24 ; le prix E85 de 0.001 € est écarté
+        self.assertEqual(marseille['ouvertures'], [[0, 7 * 1440]])
+        self.assertEqual([c['type'] for c in marseille['carburants']], ['Gazole', 'SP95'])
+
+    def test_limite(self):
+        lots = DestinationMemoire()
+        self.collecter([lots], limite=2)
+        self.assertEqual([s['id_station'] for lot in lots.lots for s in lot], [71570003, 75015001])
+        # Flux lu en partie : les destinations ne doivent pas supprimer les stations absentes
+        self.assertFalse(lots.complet)
+
+    def test_interruption_en_cours_de_flux(self):
+        chemin = os.path.join(self.dossier, 'stations.json')
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump([{'id_station': 0}], f)
+        mongo = DestinationMongo('mongomock://')
+        base = mongo.client['carburant_db']
+        panne = DestinationEnPanne(echec=1)
+        self.collecter([mongo, DestinationJSON(chemin), panne], taille_lot=2)
+
+        # Lots écrits dans MongoDB avant la panne de la dernière destination : la version est publiée
+        self.assertEqual([s['id_station'] for s in base['stations'].find()], [71570003, 75015001, 13008002])
+        self.assertEqual(base['meta'].find_one({'_id': 'stations'})['version'], 1)
+        # Ancien fichier JSON intact, temporaire supprimé
+        with open(chemin, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), [{'id_station': 0}])
+        self.assertFalse(os.path.exists(chemin + '.tmp'))
+        self.assertTrue(panne.abandonnee)
+        self.assertIsNone(panne.complet)
+
+    def test_erreur_http(self):
+        lots = DestinationMemoire()
+        with redirect_stdout(io.StringIO()):
+            collecte_finale(self.url + '.absent', [lots])
+        self.assertEqual(lots.lots, [])
+        self.assertIsNone(lots.complet)
+
+
+if __name__ == '__main__':
+    unittest.main()
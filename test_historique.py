@@ -0,0 +1,71 @@
+"""Tests de l'historique compact des prix (segments, compaction, lecture concurrente)
+
+    python -m unittest test_historique
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from historique import HistoriquePrix
+
+
+def stations_du_jour(jour):
+    """Deux stations dont les prix changent chaque jour"""
+    date = f'2025-11-{jour:02d}T08:00:00+00:00'
+    return [{'id_station': 1, 'carburants': [{'type': 'Gazole', 'prix': 1.6 + jour / 1000, 'date_maj': date}]},
+            {'id_station': 2, 'carburants': [{'type': 'SP98', 'prix': 1.8 - jour / 1000, 'date_maj': date}]}]
+
+
+class ListingPerime(HistoriquePrix):
+    """Lecteur qui liste le dossier juste avant une compaction faite par un autre processus"""
+
+    def __init__(self, dossier, compaction):
+        self.compaction = compaction
+        super().__init__(dossier)
+
+    def _segments_sur_disque(self):
+        listing = super()._segments_sur_disque()
+        compaction, self.compaction = self.compaction, None
+        if compaction:
+            compaction()
+        return listing
+
+
+class TestHistorique(unittest.TestCase):
+
+    def setUp(self):
+        self.dossier = os.path.join(tempfile.mkdtemp(), 'historique')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.dossier))
+
+    def remplir(self, jours):
+        historique = HistoriquePrix(self.dossier)
+        for jour in jours:
+            historique.ajouter(stations_du_jour(jour))
+            historique.enregistrer()
+        return historique
+
+    def test_dossier_cree_au_premier_segment(self):
+        historique = HistoriquePrix(self.dossier)
+        historique.rafraichir()
+        self.assertFalse(os.path.exists(self.dossier))
+        historique.ajouter(stations_du_jour(1))
+        historique.enregistrer()
+        self.assertEqual(os.listdir(self.dossier), ['segment_000001.bin'])
+
+    def test_compaction_pendant_la_lecture(self):
+        ecrivain = self.remplir(range(1, 6))
+        attendu = ecrivain.points(1, 'Gazole')
+
+        lecteur = ListingPerime(self.dossier, ecrivain.compacter)
+        self.assertEqual(sorted(os.listdir(self.dossier)), ['segment_000001-000005.bin'])
+        self.assertEqual(list(lecteur.segments), ['segment_000001-000005.bin'])
+        temps, prix = lecteur.points(1, 'Gazole')
+        np.testing.assert_array_equal(temps, attendu[0])
+        np.testing.assert_allclose(prix, [1.601, 1.602, 1.603, 1.604, 1.605])
+
+
+if __name__ == '__main__':
+    unittest.main()
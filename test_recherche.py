@@ -0,0 +1,274 @@
+"""Tests de la recherche comparée à un parcours exhaustif des stations
+
+rechercher, trier (pages successives), proches et url_canonique sont vérifiés contre
+un calcul direct sur les dicts des stations, sans index.
+
+    python -m unittest test_recherche
+"""
+import io
+import json
+import math
+import os
+import random
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from station_compacte import StationsCompactes
+from station_index import normaliser_texte
+from station_store import StationStore, date_en_epoch, normaliser_coordonnee
+
+FICHIER_STATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stations.json')
+
+RAYON_TERRE_KM = 6371.0
+
+
+def lire_stations():
+    """Stations de l'exemple, avec des ruptures et des horaires tirés au hasard (absents du fichier)"""
+    with open(FICHIER_STATIONS, encoding='utf-8') as f:
+        stations = json.load(f)
+    hasard = random.Random(0)
+    for station in stations:
+        types = [c['type'] for c in station['carburants']]
+        station['ruptures'] = hasard.sample(types, hasard.randint(0, min(2, len(types))))
+        if hasard.random() < 0.2:
+            station['ouvertures'] = [[0, 7 * 1440]]
+        elif hasard.random() < 0.8:
+            ouverture, fermeture = hasard.randint(300, 600), hasard.randint(1000, 1380)
+            station['ouvertures'] = [[j * 1440 + ouverture, j * 1440 + fermeture]
+                                     for j in range(7) if hasard.random() < 0.9]
+    return stations
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Haversine en pur Python"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def correspond(station, ville='', carburant='', departement='', prix_min=None, prix_max=None,
+               en_stock=False, ouvert=None):
+    """Filtres de StationStore.rechercher appliqués à une station"""
+    prix = {c['type']: c['prix'] for c in station['carburants']}
+    if ville and normaliser_texte(ville) not in normaliser_texte(station['ville']):
+        return False
+    if departement and station['code_departement'] != departement:
+        return False
+    if carburant and carburant not in prix:
+        return False
+    if en_stock:
+        disponibles = set(prix) - set(station.get('ruptures') or ())
+        if (carburant not in disponibles) if carburant else not disponibles:
+            return False
+    if ouvert is not None and not any(debut <= ouvert < fin for debut, fin in station.get('ouvertures') or ()):
+        return False
+    bas = prix_min if prix_min is not None else 0
+    haut = prix_max if prix_max is not None else math.inf
+    if (prix_min is not None or prix_max is not None) and not any(bas <= p <= haut for p in prix.values()):
+        return False
+    return True
+
+
+def cle_tri(station, tri, carburant='', lat=None, lon=None):
+    """Clé de StationStore.cles_tri pour une station"""
+    carburants = [c for c in station['carburants'] if not carburant or c['type'] == carburant]
+    if tri == 'prix':
+        return min((c['prix'] for c in carburants), default=math.inf)
+    if tri == 'date':
+        dates = [date_en_epoch(c.get('date_maj')) for c in carburants]
+        date = max(dates, default=0)
+        return -date if date > 0 else math.inf
+    latitude = normaliser_coordonnee(station['latitude'])
+    longitude = normaliser_coordonnee(station['longitude'])
+    if math.isnan(latitude) or math.isnan(longitude):
+        return math.inf
+    return distance_km(lat, lon, latitude, longitude)
+
+
+class RechercheTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stations = lire_stations()
+        cls.store = StationStore(StationsCompactes(cls.stations))
+
+    def ids(self, positions):
+        return [self.store.stations[int(i)]['id_station'] for i in positions]
+
+
+class TestRechercher(RechercheTestCase):
+
+    def test_filtres_combines(self):
+        hasard = random.Random(1)
+        villes = ['', '', 'paris', 'sa', 'SAINT-ÉTIENNE', 'mar', 'zz', 'le ']
+        carburants = ['', '', 'Gazole', 'SP98', 'E85', 'GPLc', 'H2']
+        departements = ['', '', '13', '75', '2A', '45', '99']
+        prix = [None, None, 0.9, 1.6, 1.75, 1.9]
+        for _ in range(400):
+            filtres = {
+                'ville': hasard.choice(villes),
+                'carburant': hasard.choice(carburants),
+                'departement': hasard.choice(departements),
+                'prix_min': hasard.choice(prix),
+                'prix_max': hasard.choice(prix),
+                'en_stock': hasard.random() < 0.3,
+                'ouvert': hasard.choice([None, None, 0, 8 * 60, 3 * 1440 + 22 * 60, 6 * 1440 + 1439])
+            }
+            with self.subTest(**filtres):
+                attendu = [s['id_station'] for s in self.stations if correspond(s, **filtres)]
+                positions = self.store.rechercher(**filtres)
+                self.assertTrue(np.all(np.diff(positions) > 0))
+                self.assertEqual(self.ids(positions), attendu)
+
+
+class TestTrier(RechercheTestCase):
+
+    def page_par_page(self, positions, par_page, **tri):
+        pages = []
+        for debut in range(0, positions.size + par_page, par_page):
+            page = self.store.trier(positions, debut=debut, nombre=par_page, **tri)
+            self.assertLessEqual(page.size, par_page)
+            pages.extend(page)
+        return pages
+
+    def test_pages_successives(self):
+        # Nombreux ex æquo de prix et de date entre stations : les pages doivent se suivre
+        tris = [{'tri': 'prix'}, {'tri': 'prix', 'carburant': 'Gazole'}, {'tri': 'prix', 'carburant': 'E85'},
+                {'tri': 'date'}, {'tri': 'date', 'carburant': 'SP98'},
+                {'tri': 'distance', 'lat': 48.85, 'lon': 2.35}]
+        for filtres in ({}, {'carburant': 'Gazole'}, {'departement': '13'}):
+            positions = self.store.rechercher(**filtres)
+            for tri in tris:
+                stations = [self.store.stations[int(i)] for i in positions]
+                cles = [cle_tri(s, **tri) for s in stations]
+                # Ex æquo départagés par position
+                attendu = [p for _, p in sorted(zip(cles, positions.tolist()))]
+                for par_page in (1, 7, 50, positions.size + 1):
+                    with self.subTest(filtres=filtres, par_page=par_page, **tri):
+                        self.assertEqual(self.page_par_page(positions, par_page, **tri), attendu)
+
+    def test_sans_tri_ni_page(self):
+        positions = self.store.rechercher(departement='13')
+        self.assertEqual(self.store.trier(positions).tolist(), positions.tolist())
+        self.assertEqual(self.store.trier(positions, 'prix', debut=positions.size).size, 0)
+
+
+class TestProches(RechercheTestCase):
+
+    def attendus(self, lat, lon, rayon_km, carburant='', k=10, tri=''):
+        candidats = []
+        for station in self.stations:
+            prix = {c['type']: c['prix'] for c in station['carburants']}
+            if carburant and carburant not in prix:
+                continue
+            latitude = normaliser_coordonnee(station['latitude'])
+            longitude = normaliser_coordonnee(station['longitude'])
+            if math.isnan(latitude) or math.isnan(longitude):
+                continue
+            distance = distance_km(lat, lon, latitude, longitude)
+            if distance <= rayon_km:
+                cle = prix[carburant] if tri == 'prix' and carburant else distance
+                candidats.append((cle, distance, station['id_station']))
+        return sorted(candidats)[:k]
+
+    def test_comparaison_exhaustive(self):
+        points = [(48.85, 2.35), (43.3, 5.4), (45.76, 4.84), (47.9, 1.9), (42.0, 9.0), (0.0, 0.0)]
+        for lat, lon in points:
+            for rayon_km in (1, 20, 300):
+                for carburant, tri in (('', ''), ('Gazole', 'prix'), ('SP98', 'distance'), ('E85', 'prix'),
+                                       ('H2', 'prix'), ('', 'prix')):
+                    for k in (1, 3, 10, 1000):
+                        with self.subTest(lat=lat, lon=lon, rayon_km=rayon_km, carburant=carburant, tri=tri, k=k):
+                            positions, distances = self.store.proches(lat, lon, rayon_km, carburant, k, tri)
+                            j = self.store.index_carburant.get(carburant)
+                            cles = [float(self.store.prix[i, j]) if tri == 'prix' and carburant else float(d)
+                                    for i, d in zip(positions, distances)]
+                            obtenu = [(round(c, 9), round(float(d), 9), self.store.stations[int(i)]['id_station'])
+                                      for c, i, d in zip(cles, positions, distances)]
+                            attendu = [(round(c, 9), round(d, 9), id_station)
+                                       for c, d, id_station in self.attendus(lat, lon, rayon_km, carburant, k, tri)]
+                            # Rendus par (clé, distance) ; à égalité exacte, ordre des positions
+                            self.assertEqual([o[:2] for o in obtenu], sorted(o[:2] for o in obtenu))
+                            self.assertEqual(sorted(obtenu), attendu)
+
+
+class TestUrlCanonique(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with redirect_stdout(io.StringIO()):
+            import app
+        cls.app = app
+
+    def canonique(self, valeurs):
+        with self.app.app.test_request_context('/api/recherche'):
+            return self.app.url_canonique(valeurs)
+
+    def test_meme_recherche_meme_url(self):
+        attendu = '/api/recherche?carburant=Gazole&en_stock=1&prix_max=1.8&ville=saint+etienne'
+        variantes = [
+            {'ville': 'Saint-Étienne', 'carburant': 'Gazole', 'prix_max': '1.80', 'en_stock': 'on'},
+            {'en_stock': 'true', 'prix_max': '1.8', 'carburant': ' Gazole ', 'ville': ' SAINT ETIENNE '},
+            {'ville': 'saint etienne', 'carburant': 'Gazole', 'prix_max': '1.800', 'en_stock': '1',
+             'page': '1', 'par_page': '50', 'tri': '', 'inconnu': 'x', 'ouvert': 'non'},
+        ]
+        for valeurs in variantes:
+            with self.subTest(valeurs=valeurs):
+                self.assertEqual(self.canonique(valeurs), attendu)
+
+    def test_parametres_aleatoires(self):
+        """Ordre des paramètres, défauts et écritures des nombres sans effet sur l'URL"""
+        hasard = random.Random(2)
+        for _ in range(200):
+            valeurs = {'departement': hasard.choice(['', '13', '2A']), 'tri': hasard.choice(['', 'prix', 'date']),
+                       'page': str(hasard.randint(1, 4)), 'lat': hasard.choice(['', '48.85']),
+                       'fields': hasard.choice(['', 'ville,id_station', 'id_station, ville'])}
+            ecriture = dict(valeurs)
+            if ecriture['lat']:
+                ecriture['lat'] = hasard.choice(['48.850', ' 48.85', '4.885e1'])
+            ecriture['page'] = hasard.choice([ecriture['page'], '0' + ecriture['page']])
+            ecriture = dict(hasard.sample(list(ecriture.items()), len(ecriture)))
+            with self.subTest(valeurs=valeurs, ecriture=ecriture):
+                url = self.canonique(ecriture)
+                self.assertEqual(url, self.canonique(valeurs))
+                parametres = [p.split('=')[0] for p in url.partition('?')[2].split('&') if p]
+                self.assertEqual(parametres, sorted(parametres))
+                self.assertNotIn('page=1', url.split('&'))
+
+    def test_sans_parametre(self):
+        self.assertEqual(self.canonique({'page': '1', 'par_page': '50', 'ville': '  '}), '/api/recherche')
+
+
+class TestRouteRecherche(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with redirect_stdout(io.StringIO()):
+            import app
+        cls.client = app.app.test_client()
+
+    def test_prix_non_numerique(self):
+        for reponse in (self.client.post('/recherche', data={'prix_min': 'abc'}),
+                        self.client.get('/recherche?prix_max=1,8')):
+            self.assertEqual(reponse.status_code, 400)
+            self.assertIn('doivent être numériques', reponse.get_data(as_text=True))
+        self.assertEqual(self.client.get('/api/recherche?prix_min=abc').status_code, 400)
+
+    def test_nearby_tri_applique(self):
+        url = '/api/nearby?lat=48.85&lon=2.35&radius_km=50'
+        self.assertEqual(self.client.get(url).get_json()['sort'], 'distance')
+        self.assertEqual(self.client.get(url + '&carburant=Gazole').get_json()['sort'], 'prix')
+        self.assertEqual(self.client.get(url + '&carburant=Gazole&sort=distance').get_json()['sort'], 'distance')
+        # Sans carburant, sort=prix est ramené au tri par distance effectivement appliqué
+        self.assertEqual(self.client.get(url + '&sort=prix').get_json()['sort'], 'distance')
+        for tri in ('date', '<script>', ''):
+            reponse = self.client.get(url + '&sort=' + tri)
+            self.assertEqual(reponse.status_code, 400)
+            self.assertEqual(reponse.get_json(), {'error': 'sort doit valoir prix ou distance'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,298 @@
+"""Tests de la maintenance en place du StationStore (ajout, retrait, changement de prix)
+
+Après une suite aléatoire de modifications, le store doit être identique à un store
+construit d'une traite sur les mêmes stations : colonnes, agrégats (StationStats,
+DistributionPrix), index et cube. Même comparaison pour un store ouvert sur un snapshot.
+
+    python -m unittest test_station_store
+"""
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from station_compacte import StationsCompactes
+from station_cube import NIVEAUX
+from snapshot import ecrire_snapshot, ouvrir_snapshot
+from station_store import CHAMPS_COLONNES, IndexIds, StationStore
+
+FICHIER_STATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stations.json')
+
+# Recherches comparées entre le store modifié et le store reconstruit
+RECHERCHES = [
+    {}, {'ville': 'paris'}, {'ville': 'sa'}, {'departement': '13'}, {'departement': '2A'},
+    {'carburant': 'Gazole'}, {'carburant': 'E85', 'en_stock': True}, {'en_stock': True},
+    {'prix_min': 1.7, 'prix_max': 1.8}, {'carburant': 'SP98', 'prix_max': 1.85},
+    {'carburant': 'H2'}, {'ouvert': 8 * 60}, {'ouvert': 6 * 1440 + 23 * 60}
+]
+
+
+def lire_stations(nombre=150):
+    with open(FICHIER_STATIONS, encoding='utf-8') as f:
+        return json.load(f)[:nombre]
+
+
+def construire(stations):
+    return StationStore(StationsCompactes(stations))
+
+
+def etat_colonnes(store):
+    """Contenu des colonnes par id_station, indépendant de l'ordre des tables de chaînes"""
+    etat = {}
+    for i in range(len(store)):
+        id_station = store.stations[i]['id_station']
+        prix = {type_carb: (float(store.prix[i, j]), int(store.date_maj[i, j]))
+                for j, type_carb in enumerate(store.carburants) if not np.isnan(store.prix[i, j])}
+        ruptures = {type_carb for j, type_carb in enumerate(store.carburants)
+                    if int(store.rupture[i]) >> j & 1}
+        etat[id_station] = (i, prix, store.departements[store.dept[i]], store.villes[store.ville[i]],
+                            float(store.latitude[i]), float(store.longitude[i]), ruptures)
+    ouvertures = sorted((int(i), int(debut), int(fin)) for i, debut, fin in store.ouvertures)
+    return etat, ouvertures
+
+
+def proches_par_id(store, lat, lon, rayon_km=100):
+    """(distance, id_station) des stations dans le rayon, par distance puis id"""
+    positions, distances = store.proches(lat, lon, rayon_km, k=len(store))
+    return sorted((round(float(d), 9), store.stations[int(i)]['id_station']) for i, d in zip(positions, distances))
+
+
+class StoreTestCase(unittest.TestCase):
+
+    def assertStoresEquivalents(self, store, reference):
+        self.assertEqual(len(store), len(reference))
+        self.assertEqual(etat_colonnes(store), etat_colonnes(reference))
+        self.assertEqual(store.offsets, reference.offsets)
+        self.assertStatsEquivalentes(store, reference)
+        self.assertIndexEquivalents(store, reference)
+        self.assertCubesEquivalents(store, reference)
+
+    def assertStatsEquivalentes(self, store, reference):
+        accueil, attendu = store.stats_accueil(), reference.stats_accueil()
+        self.assertEqual(accueil['total_stations'], attendu['total_stations'])
+        self.assertEqual(accueil['total_departments'], attendu['total_departments'])
+        self.assertAlmostEqual(accueil['avg_price_gazole'], attendu['avg_price_gazole'], places=9)
+
+        prix = {stat['_id']: stat for stat in store.stats_prix()}
+        attendus = {stat['_id']: stat for stat in reference.stats_prix()}
+        self.assertEqual(prix.keys(), attendus.keys())
+        for type_carb, stat in attendus.items():
+            for champ in ('count', 'minimum', 'maximum'):
+                self.assertEqual(prix[type_carb][champ], stat[champ], (type_carb, champ))
+            self.assertAlmostEqual(prix[type_carb]['moyenne'], stat['moyenne'], places=9)
+
+        # Ordre des ex aequo : ordre d'apparition des départements, propre à chaque store
+        top = {dep['_id']: dep['count'] for dep in store.top_departements(1000)}
+        self.assertEqual(top, {dep['_id']: dep['count'] for dep in reference.top_departements(1000)})
+
+        for departement in [None, 'inconnu'] + list(reference.departements):
+            distributions = {d['_id']: d for d in store.distributions_prix(departement)}
+            self.assertEqual(distributions, {d['_id']: d for d in reference.distributions_prix(departement)},
+                             departement)
+
+    def assertIndexEquivalents(self, store, reference):
+        def ids(s, positions):
+            return sorted(s.stations[int(i)]['id_station'] for i in positions)
+
+        for filtres in RECHERCHES:
+            self.assertEqual(ids(store, store.rechercher(**filtres)),
+                             ids(reference, reference.rechercher(**filtres)), filtres)
+        for prefixe in ('sa', 'p', 'mar', 'l'):
+            self.assertEqual(store.index.prefixes_villes.completer(prefixe, 1000),
+                             reference.index.prefixes_villes.completer(prefixe, 1000))
+        for lat, lon in ((48.85, 2.35), (43.3, 5.4), (45.76, 4.84)):
+            self.assertEqual(proches_par_id(store, lat, lon), proches_par_id(reference, lat, lon))
+
+    def assertCubesEquivalents(self, store, reference):
+        carburants = [''] + sorted(t for t, count in reference.index.comptes_carburant.items() if count)
+        for niveau in NIVEAUX:
+            for carburant in carburants:
+                self.assertValeursProches(store.cube.niveau(niveau, carburant),
+                                          reference.cube.niveau(niveau, carburant), (niveau, carburant))
+
+    def assertValeursProches(self, valeur, attendue, contexte):
+        """Égalité, à l'arrondi près pour les sommes et moyennes (additions dans un autre ordre)"""
+        if isinstance(attendue, float):
+            self.assertAlmostEqual(valeur, attendue, delta=2e-4, msg=contexte)
+        elif isinstance(attendue, dict):
+            self.assertEqual(valeur.keys(), attendue.keys(), contexte)
+            for cle in attendue:
+                self.assertValeursProches(valeur[cle], attendue[cle], contexte)
+        elif isinstance(attendue, list):
+            self.assertEqual(len(valeur), len(attendue), contexte)
+            for element, attendu in zip(valeur, attendue):
+                self.assertValeursProches(element, attendu, contexte)
+        else:
+            self.assertEqual(valeur, attendue, contexte)
+
+
+class TestModificationsAleatoires(StoreTestCase):
+
+    def nouvelle_station(self, hasard, stations, numero):
+        """Copie modifiée d'une station : autre id, parfois autre ville, département ou carburants"""
+        station = json.loads(json.dumps(hasard.choice(stations)))
+        station['id_station'] = 900000000 + numero
+        station.pop('_id', None)
+        if hasard.random() < 0.3:
+            station['ville'] = hasard.choice(['Ajaccio', 'Villeneuve-Test', 'PARIS'])
+            station['code_departement'] = hasard.choice(['2A', '75', '99'])
+        if hasard.random() < 0.3 and len(station['carburants']) > 1:
+            station['carburants'].pop(hasard.randrange(len(station['carburants'])))
+        for carburant in station['carburants']:
+            carburant['prix'] = round(carburant['prix'] + hasard.uniform(-0.2, 0.2), 3)
+        return station
+
+    def test_suites_aleatoires(self):
+        stations = lire_stations()
+        for graine in range(5):
+            with self.subTest(graine=graine):
+                hasard = random.Random(graine)
+                store = construire(stations)
+                for numero in range(60):
+                    operation = hasard.choice(['ajouter', 'retirer', 'prix', 'prix'])
+                    ids = list(store.offsets)
+                    if operation == 'ajouter':
+                        store.ajouter_station(self.nouvelle_station(hasard, stations, numero))
+                    elif operation == 'retirer' and len(ids) > 1:
+                        store.retirer_station(hasard.choice(ids))
+                    else:
+                        # Quelquefois un carburant que la station (ou tout le store) n'a pas encore
+                        type_carb = hasard.choice(list(store.carburants) + ['H2'])
+                        store.modifier_prix(hasard.choice(ids), type_carb, round(hasard.uniform(1.2, 2.2), 3),
+                                            '2025-11-20T09:55:22+00:00')
+                    # Agrégats lus entre deux modifications : leurs caches doivent être invalidés
+                    if numero % 7 == 0:
+                        store.stats_prix()
+                        store.distributions_prix('13')
+                        store.cube.niveau('region')
+
+                self.assertStoresEquivalents(store, construire(list(store.stations)))
+
+    def test_generation(self):
+        store = construire(lire_stations(20))
+        id_station = next(iter(store.offsets))
+        store.modifier_prix(id_station, 'Gazole', 1.5, '2025-11-20T09:55:22+00:00')
+        store.retirer_station(id_station)
+        self.assertEqual(store.generation, 2)
+
+
+class TestBornes(StoreTestCase):
+    """Retirer le minimum ou le maximum courant oblige à relire la colonne"""
+
+    def setUp(self):
+        self.store = construire(lire_stations())
+        self.j = self.store.index_carburant['Gazole']
+        # Agrégats calculés avant la modification
+        self.store.stats_prix()
+
+    def bornes(self):
+        stat = next(s for s in self.store.stats_prix() if s['_id'] == 'Gazole')
+        return stat['minimum'], stat['maximum']
+
+    def colonne(self):
+        colonne = self.store.prix[:, self.j]
+        return float(np.nanmin(colonne)), float(np.nanmax(colonne))
+
+    def id_a(self, i):
+        return self.store.stations[int(i)]['id_station']
+
+    def test_retrait_du_minimum_et_du_maximum(self):
+        ancien_min, ancien_max = self.colonne()
+        for position in (np.nanargmin, np.nanargmax):
+            while True:
+                colonne = self.store.prix[:, self.j]
+                i = int(position(colonne))
+                if float(colonne[i]) not in (ancien_min, ancien_max):
+                    break
+                self.store.retirer_station(self.id_a(i))
+                self.assertEqual(self.bornes(), self.colonne())
+        self.assertNotEqual(self.bornes(), (ancien_min, ancien_max))
+        self.assertStoresEquivalents(self.store, construire(list(self.store.stations)))
+
+    def test_changement_de_prix_des_bornes(self):
+        minimum, maximum = self.colonne()
+        i_min = int(np.nanargmin(self.store.prix[:, self.j]))
+        i_max = int(np.nanargmax(self.store.prix[:, self.j]))
+        milieu = round((minimum + maximum) / 2, 3)
+        self.store.modifier_prix(self.id_a(i_min), 'Gazole', milieu, '2025-11-20T09:55:22+00:00')
+        self.store.modifier_prix(self.id_a(i_max), 'Gazole', milieu, '2025-11-20T09:55:22+00:00')
+        self.assertEqual(self.bornes(), self.colonne())
+        # Nouveau minimum : pris en compte sans relire la colonne
+        self.store.modifier_prix(self.id_a(i_min), 'Gazole', 0.999, '2025-11-20T09:55:22+00:00')
+        self.assertEqual(self.bornes()[0], 0.999)
+        self.assertStoresEquivalents(self.store, construire(list(self.store.stations)))
+
+
+class TestStationsPartielles(unittest.TestCase):
+
+    def test_memes_champs_que_la_station_entiere(self):
+        stations = lire_stations()
+        stations[0]['champ_inconnu'] = 1
+        stations[1]['latitude'] = 'N/A'
+        compactes = StationsCompactes(stations)
+        for champs in (CHAMPS_COLONNES, ('nom', 'ville', 'carburants'), ('id_station',), ('latitude',)):
+            with self.subTest(champs=champs):
+                attendues = [{nom: s[nom] for nom in champs if nom in s} for s in stations]
+                self.assertEqual(list(compactes.partielles(range(len(stations)), champs)), attendues)
+
+    def test_store_identique_depuis_des_dicts(self):
+        stations = lire_stations()
+        store = StationStore(StationsCompactes(stations))
+        self.assertEqual(etat_colonnes(store), etat_colonnes(StationStore(stations)))
+        self.assertEqual(list(store.partielles([3, 1], ('id_station',))),
+                         [{'id_station': stations[3]['id_station']}, {'id_station': stations[1]['id_station']}])
+
+
+class TestSnapshot(StoreTestCase):
+    """Store ouvert en mmap avec l'index des id et les tris enregistrés"""
+
+    def setUp(self):
+        self.dossier = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.dossier))
+
+    def ouvrir(self, stations):
+        with redirect_stdout(io.StringIO()):
+            ecrire_snapshot(stations, self.dossier)
+        store, _ = ouvrir_snapshot(self.dossier)
+        return store
+
+    def test_meme_store_que_depuis_les_stations(self):
+        stations = lire_stations()
+        store = self.ouvrir(stations)
+        self.assertIsInstance(store.offsets, IndexIds)
+        self.assertStoresEquivalents(store, construire(stations))
+        id_station = stations[42]['id_station']
+        self.assertEqual(store.position(id_station), 42)
+        self.assertEqual(store.position(str(id_station)), 42)
+
+    def test_ids_en_texte(self):
+        stations = lire_stations(30)
+        for k, station in enumerate(stations):
+            station['id_station'] = f'BIG_{29 - k}' if k % 2 else station['id_station']
+        store = self.ouvrir(stations)
+        self.assertEqual(store.position('BIG_28'), 1)
+        self.assertEqual(store.position(str(stations[2]['id_station'])), 2)
+        self.assertNotIn('BIG_99', store.offsets)
+        self.assertNotIn(28, store.offsets)
+        self.assertEqual(dict(store.offsets.items()), {str(s['id_station']): k for k, s in enumerate(stations)})
+
+
+class TestCacheDistributions(unittest.TestCase):
+
+    def test_departements_inconnus_non_mis_en_cache(self):
+        store = construire(lire_stations(20))
+        store.distributions_prix('13')
+        taille = len(store.stats._cache)
+        for code in ('99', 'inconnu', '13 ', 'x' * 200):
+            self.assertEqual(store.distributions_prix(code), [])
+        self.assertEqual(len(store.stats._cache), taille)
+
+
+if __name__ == '__main__':
+    unittest.main()